@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Asyncio Modbus TCP 管線化客戶端
+同一連線上可同時保持多個未完成請求 (以 Transaction ID 對應回應)
+"""
+
+import asyncio
+import struct
+import time
+
+from modbus_engine import PERF_WORKLOADS, DEFAULT_SLAVE_ID, resolve_write_value, check_perf_concurrency
+from perf_stats import PerfStats
+from read_planner import BIT_FUNCTION_CODES
+from bulk_io import (
+    write_block_async, verify_block_async, block_pattern, written_ranges, save_ranges_async, restore_ranges_async
+)
+
+DEFAULT_PIPELINE_DEPTH = 8
+DEFAULT_DEPTHS = (1, 2, 4, 8, 16)
+
+MBAP_HEADER = struct.Struct(">HHHB")  # transaction id, protocol id, length, unit id
+
+
+class ModbusResponse:
+    """Modbus 回應 (介面與 pymodbus 回應相容: registers / bits / isError)"""
+
+    def __init__(self, function_code, registers=None, bits=None, exception_code=None, error=None):
+        self.function_code = function_code
+        self.registers = registers or []
+        self.bits = bits or []
+        self.exception_code = exception_code
+        self.error = error  # 回應格式錯誤的說明
+
+    def isError(self):
+        return self.exception_code is not None or self.error is not None
+
+    def __str__(self):
+        if self.error is not None:
+            return f"InvalidResponse(function_code={self.function_code}, error={self.error})"
+        if self.isError():
+            return f"ExceptionResponse(function_code={self.function_code}, exception_code={self.exception_code})"
+        return f"ModbusResponse(function_code={self.function_code})"
+
+
+def decode_pdu(pdu, count):
+    """解析回應 PDU (count 為請求的數量)；格式錯誤時回傳 error 不為 None 的回應，不拋出例外"""
+    if not pdu:
+        return ModbusResponse(0, error="空的回應")
+    function_code = pdu[0]
+    if function_code & 0x80:
+        if len(pdu) < 2:
+            return ModbusResponse(function_code & 0x7F, error="例外回應缺少例外碼")
+        return ModbusResponse(function_code & 0x7F, exception_code=pdu[1])
+    if function_code in BIT_FUNCTION_CODES or function_code in (3, 4):
+        byte_count = pdu[1] if len(pdu) > 1 else 0
+        needed = (count + 7) // 8 if function_code in BIT_FUNCTION_CODES else count * 2
+        if len(pdu) < 2 + byte_count or byte_count < needed:
+            return ModbusResponse(function_code, error=f"資料長度不符 (byte count {byte_count}, 需要 {needed}, PDU {len(pdu)} bytes)")
+    if function_code in BIT_FUNCTION_CODES:
+        data = pdu[2:2 + byte_count]
+        bits = [bool(data[i // 8] >> (i % 8) & 1) for i in range(count)]
+        return ModbusResponse(function_code, bits=bits)
+    if function_code in (3, 4):
+        return ModbusResponse(function_code, registers=list(struct.unpack(f">{count}H", pdu[2:2 + count * 2])))
+    return ModbusResponse(function_code)
+
+
+class PipelinedModbusClient:
+    """管線化 Modbus TCP 客戶端
+
+    max_in_flight 限制同時未完成的請求數 (管線深度)。
+    """
+
+    def __init__(self, host, port=502, timeout=3, max_in_flight=DEFAULT_PIPELINE_DEPTH):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.reader = None
+        self.writer = None
+        self._pending = {}  # tid → (future, 數量)
+        self._next_tid = 0
+        self._slots = None
+        self._reader_task = None
+        self._closed = True  # 接收迴圈結束 (對方關閉或連線中斷) 後為 True
+
+    @property
+    def connected(self):
+        return not self._closed and self.writer is not None and not self.writer.is_closing()
+
+    async def connect(self):
+        """建立連線，回傳是否成功"""
+        try:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout
+            )
+        except (OSError, asyncio.TimeoutError):
+            return False
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._closed = False
+        self._reader_task = asyncio.create_task(self._read_loop())
+        return True
+
+    async def close(self):
+        """關閉連線"""
+        if self._reader_task:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+            self._reader_task = None
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+            self.writer = None
+        self._fail_pending(ConnectionError("連線已關閉"))
+
+    def _fail_pending(self, exc):
+        """讓所有未完成請求失敗"""
+        for future, _ in self._pending.values():
+            if not future.done():
+                future.set_exception(exc)
+        self._pending.clear()
+
+    def _allocate_tid(self):
+        """取得未使用的 Transaction ID"""
+        while True:
+            self._next_tid = self._next_tid % 0xFFFF + 1
+            if self._next_tid not in self._pending:
+                return self._next_tid
+
+    async def _read_loop(self):
+        """接收回應並依 Transaction ID 分派；結束時標記連線已關閉並讓未完成請求失敗"""
+        try:
+            while True:
+                header = await self.reader.readexactly(MBAP_HEADER.size)
+                tid, _, length, _ = MBAP_HEADER.unpack(header)
+                pdu = await self.reader.readexactly(length - 1)
+                entry = self._pending.pop(tid, None)
+                if entry is None:
+                    continue  # 逾時後才到達的回應
+                future, count = entry
+                if not future.done():
+                    future.set_result(decode_pdu(pdu, count))
+        except asyncio.CancelledError:
+            raise
+        except (asyncio.IncompleteReadError, OSError, ValueError) as e:
+            self._fail_pending(ConnectionError(f"連線中斷: {e}"))
+        finally:
+            self._closed = True
+            self._fail_pending(ConnectionError("連線已關閉"))
+
+    async def execute(self, pdu, count=0, device_id=DEFAULT_SLAVE_ID):
+        """送出請求 PDU 並等待回應"""
+        if not self.connected:
+            raise ConnectionError("尚未連線或連線已關閉")
+        async with self._slots:
+            if not self.connected:
+                raise ConnectionError("連線已關閉")
+            tid = self._allocate_tid()
+            future = asyncio.get_running_loop().create_future()
+            self._pending[tid] = (future, count)
+            self.writer.write(MBAP_HEADER.pack(tid, 0, len(pdu) + 1, device_id) + pdu)
+            try:
+                return await asyncio.wait_for(future, self.timeout)
+            finally:
+                self._pending.pop(tid, None)
+
+    async def read(self, function_code, address, count, device_id=DEFAULT_SLAVE_ID):
+        """讀取 (功能碼 01/02/03/04)"""
+        return await self.execute(struct.pack(">BHH", function_code, address, count), count, device_id)
+
+    async def write_register(self, address, value, device_id=DEFAULT_SLAVE_ID):
+        """寫入單一 Holding Register (功能碼 06)"""
+        return await self.execute(struct.pack(">BHH", 6, address, value), 0, device_id)
+
+    async def write_coil(self, address, value, device_id=DEFAULT_SLAVE_ID):
+        """寫入單一 Coil (功能碼 05)"""
+        return await self.execute(struct.pack(">BHH", 5, address, 0xFF00 if value else 0), 0, device_id)
+
+    async def write_registers(self, address, values, device_id=DEFAULT_SLAVE_ID):
+        """寫入多個 Holding Register (功能碼 16)"""
+        pdu = struct.pack(f">BHHB{len(values)}H", 16, address, len(values), len(values) * 2, *values)
+        return await self.execute(pdu, 0, device_id)
+
+    async def write_coils(self, address, values, device_id=DEFAULT_SLAVE_ID):
+        """寫入多個 Coil (功能碼 15)"""
+        data = bytearray((len(values) + 7) // 8)
+        for i, value in enumerate(values):
+            if value:
+                data[i // 8] |= 1 << (i % 8)
+        pdu = struct.pack(">BHHB", 15, address, len(values), len(data)) + bytes(data)
+        return await self.execute(pdu, 0, device_id)
+
+    async def execute_op(self, op, device_id=DEFAULT_SLAVE_ID):
+        """執行單一工作負載操作"""
+        kind, function_code, address, arg = op
+        if kind == "read":
+            return await self.read(function_code, address, arg, device_id)
+        if kind == "write_block":
+            return await write_block_async(self, function_code, address, block_pattern(function_code, arg), device_id)
+        if kind == "verify_block":
+            return await verify_block_async(self, function_code, address, arg, device_id)
+        value = resolve_write_value(arg)
+        if function_code == 5:
+            return await self.write_coil(address, value, device_id)
+        return await self.write_register(address, value, device_id)
+
+
+async def execute_plan_async(client, blocks, device_id=DEFAULT_SLAVE_ID):
+    """同時送出讀取計畫中的所有區塊，回傳 (values, errors)"""
+    responses = await asyncio.gather(
+        *(client.read(b.function_code, b.address, b.count, device_id) for b in blocks),
+        return_exceptions=True
+    )
+    values = {}
+    errors = []
+    for block, result in zip(blocks, responses):
+        if isinstance(result, BaseException):
+            errors.append((block, str(result) or type(result).__name__))
+            continue
+        if result.isError():
+            errors.append((block, str(result)))
+            continue
+        data = result.bits if block.function_code in BIT_FUNCTION_CODES else result.registers
+        for key, offset, count in block.items:
+            values[key] = list(data[offset:offset + count])
+    return values, errors
+
+
+async def backup_workload(client, ops, restore=True):
+    """備份工作負載會寫入的位址 (restore 為 False 或唯讀工作負載時回傳空列表)
+
+    無法備份時關閉連線並拋出 ConnectionError。
+    """
+    ranges = written_ranges(ops) if restore else []
+    saved, error = await save_ranges_async(client, ranges)
+    if error:
+        await client.close()
+        raise ConnectionError(f"無法備份寫入範圍的原始內容: {error}")
+    return saved
+
+
+async def run_pipelined_test(host, port, test_type, test_count, depth, interval_ms=0,
+                             timeout=3, perf_stats=None, on_sample=None, should_continue=None, restore=True):
+    """以管線深度 depth 執行性能測試，回傳統計數據 (含 throughput)
+
+    每個 worker 依序執行工作負載，depth 個 worker 共用同一連線；
+    樣本記錄到 perf_stats (PerfStats)。
+    restore 為 True 時先備份工作負載會寫入的位址，結束後寫回 (失敗時 restore_error 為錯誤訊息)。
+    """
+    check_perf_concurrency(test_type, depth)
+    ops = PERF_WORKLOADS[test_type]
+    if perf_stats is None:
+        perf_stats = PerfStats(retain_samples=False)
+
+    client = PipelinedModbusClient(host, port, timeout=timeout, max_in_flight=depth)
+    if not await client.connect():
+        raise ConnectionError(f"無法連線到 {host}:{port}")
+    saved = await backup_workload(client, ops, restore)
+    restore_error = None
+
+    remaining = [test_count]
+    interval = interval_ms / 1000.0
+
+    async def worker():
+        while remaining[0] > 0:
+            if should_continue is not None and not should_continue():
+                return
+            remaining[0] -= 1
+            start_ns = time.perf_counter_ns()
+            try:
+                success = True
+                for op in ops:
+                    if (await client.execute_op(op)).isError():
+                        success = False
+                        break
+            except (asyncio.TimeoutError, ConnectionError):
+                success = False
+            perf_stats.record(time.perf_counter_ns() - start_ns, success)
+            if on_sample is not None:
+                on_sample(perf_stats.count, test_count)
+            if interval > 0:
+                await asyncio.sleep(interval)
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker() for _ in range(depth)))
+        elapsed = time.perf_counter() - started
+        if saved:
+            restore_error = await restore_ranges_async(client, saved)
+    finally:
+        await client.close()
+
+    stats = perf_stats.summary() or {"count": 0}
+    stats["restore_error"] = restore_error
+    stats["depth"] = depth
+    stats["elapsed"] = elapsed
+    stats["throughput"] = stats["count"] / elapsed if elapsed > 0 else 0.0
+    return stats
+
+
+async def run_depth_sweep(host, port, test_type, test_count, depths=DEFAULT_DEPTHS, timeout=3, restore=True):
+    """依序以不同管線深度執行性能測試，回傳各深度統計"""
+    check_perf_concurrency(test_type, max(depths))
+    rows = []
+    for depth in depths:
+        rows.append(await run_pipelined_test(host, port, test_type, test_count, depth, timeout=timeout,
+                                             restore=restore))
+    return rows
+
+
+def log_depth_sweep(log, test_type, rows):
+    """輸出 throughput 對管線深度的結果表"""
+    log(f"📊 管線深度測試結果: {test_type}")
+    errors = [row["restore_error"] for row in rows if row.get("restore_error")]
+    if errors:
+        log(f"⚠️ 寫回原始內容失敗: {errors[0]}", "WARNING")
+    log("   深度 |   次數 | 吞吐量(req/s) | 平均(ms) | P95(ms) | 成功率")
+    for row in rows:
+        if not row["count"]:
+            log(f"   {row['depth']:>4} | {0:>6} | 無結果", "WARNING")
+            continue
+        log(f"   {row['depth']:>4} | {row['count']:>6} | {row['throughput']:>13.1f} | "
+            f"{row['avg']:>8.2f} | {row['p95']:>7.2f} | {row['success_rate']:>5.1f}%")
+    # 只在全部成功的深度中挑選，避免推薦大量請求失敗的深度
+    passed = [row for row in rows if row["count"] and row["success_rate"] == 100]
+    if len(rows) > 1 and passed:
+        best = max(passed, key=lambda r: r["throughput"])
+        base = rows[0]
+        ratio = f" (深度 {base['depth']} 的 {best['throughput'] / base['throughput']:.1f} 倍)" if base.get("throughput") else ""
+        log(f"🚀 最佳深度 {best['depth']}: {best['throughput']:.1f} req/s{ratio}", "SUCCESS")
+    elif len(rows) > 1:
+        log("⚠️ 沒有任何深度全部成功，無法推薦管線深度", "WARNING")
+    log("─" * 50)
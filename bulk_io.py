@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大量讀寫
+以 FC16 / FC15 (寫入) 與最大讀取數量 (讀取) 依協定限制切塊，
+用於整塊 User Define 區的寫入、讀回驗證與吞吐量測試
+"""
+
+import asyncio
+import random
+
+from read_planner import READ_METHODS, BIT_FUNCTION_CODES, max_read_count
+
+# 協定限制 (單次寫入請求)
+MAX_WRITE_REGISTERS = 123
+MAX_WRITE_COILS = 1968
+
+# 單一值寫入功能碼 → 多值寫入功能碼
+MULTI_WRITE_FUNCTION_CODES = {5: 15, 6: 16, 15: 15, 16: 16}
+
+# 寫入功能碼 → 讀回用的讀取功能碼
+VERIFY_READ_FUNCTION_CODES = {15: 1, 16: 3}
+
+# 會改寫整個位址範圍的操作 (同時執行會互相覆寫，讀回比對會誤判)
+BLOCK_OPS = ("write_block", "verify_block")
+
+
+class BlockResult:
+    """整塊讀寫結果 (介面與 pymodbus 回應相容: registers / bits / isError)"""
+
+    def __init__(self, data=None, error=None, bits=False):
+        self.registers = [] if bits else (data or [])
+        self.bits = (data or []) if bits else []
+        self.error = error
+
+    def isError(self):
+        return self.error is not None
+
+    def __str__(self):
+        return self.error or "BlockResult(ok)"
+
+
+def max_write_count(function_code):
+    """回傳寫入功能碼單次可寫入的最大數量"""
+    return MAX_WRITE_COILS if function_code == 15 else MAX_WRITE_REGISTERS
+
+
+def chunk_ranges(address, count, max_count):
+    """將位址範圍切成不超過 max_count 的 (起始位址, 數量) 列表"""
+    return [(address + offset, min(max_count, count - offset)) for offset in range(0, count, max_count)]
+
+
+def block_pattern(function_code, count):
+    """產生隨機寫入內容 (register 為 0-65535，coil 為 bool)"""
+    if function_code == 15:
+        return [bool(random.getrandbits(1)) for _ in range(count)]
+    return [random.randint(0, 0xFFFF) for _ in range(count)]
+
+
+def data_bytes(function_code, count):
+    """資料量 (bytes): register 每個 2 bytes，bit 每 8 個 1 byte"""
+    if function_code in BIT_FUNCTION_CODES or function_code in (5, 15):
+        return (count + 7) // 8
+    return count * 2
+
+
+def workload_bytes(ops):
+    """工作負載單次執行傳輸的資料量 (bytes)"""
+    total = 0
+    for kind, function_code, _, arg in ops:
+        if kind == "read":
+            total += data_bytes(function_code, arg)
+        elif kind == "write":
+            total += data_bytes(function_code, 1)
+        elif kind == "write_block":
+            total += data_bytes(function_code, arg)
+        elif kind == "verify_block":
+            total += 2 * data_bytes(function_code, arg)
+    return total
+
+
+def written_ranges(ops):
+    """工作負載會寫入的 (寫入功能碼, 位址, 數量) 列表 (供測試前備份、測試後寫回)"""
+    ranges = []
+    for kind, function_code, address, arg in ops:
+        if kind in BLOCK_OPS:
+            ranges.append((MULTI_WRITE_FUNCTION_CODES[function_code], address, arg))
+        elif kind == "write":
+            ranges.append((MULTI_WRITE_FUNCTION_CODES[function_code], address, 1))
+    return ranges
+
+
+def save_ranges(client, ranges, device_id=1):
+    """讀取 ranges 的原始內容，回傳 (備份列表, 錯誤訊息或 None)"""
+    saved = []
+    for function_code, address, count in ranges:
+        result = read_block(client, VERIFY_READ_FUNCTION_CODES[function_code], address, count, device_id)
+        if result.isError():
+            return saved, str(result)
+        saved.append((function_code, address, result.bits or result.registers))
+    return saved, None
+
+
+def restore_ranges(client, saved, device_id=1):
+    """寫回 save_ranges 的備份，回傳錯誤訊息或 None"""
+    for function_code, address, values in saved:
+        result = write_block(client, function_code, address, values, device_id)
+        if result.isError():
+            return str(result)
+    return None
+
+
+def write_block(client, function_code, address, values, device_id=1):
+    """以多值寫入 (FC16 / FC15) 分塊寫入 values，回傳 BlockResult"""
+    function_code = MULTI_WRITE_FUNCTION_CODES[function_code]
+    method = client.write_coils if function_code == 15 else client.write_registers
+    for start, count in chunk_ranges(address, len(values), max_write_count(function_code)):
+        offset = start - address
+        try:
+            result = method(start, values[offset:offset + count], device_id=device_id)
+        except Exception as e:
+            return BlockResult(error=f"寫入 {start}-{start + count - 1} 失敗: {e}")
+        if result.isError():
+            return BlockResult(error=f"寫入 {start}-{start + count - 1} 失敗: {result}")
+    return BlockResult()
+
+
+def read_block(client, function_code, address, count, device_id=1):
+    """以最大讀取數量分塊讀取，回傳 BlockResult (registers 或 bits)"""
+    method = getattr(client, READ_METHODS[function_code])
+    bits = function_code in BIT_FUNCTION_CODES
+    data = []
+    for start, n in chunk_ranges(address, count, max_read_count(function_code)):
+        try:
+            result = method(start, count=n, device_id=device_id)
+        except Exception as e:
+            return BlockResult(error=f"讀取 {start}-{start + n - 1} 失敗: {e}", bits=bits)
+        if result.isError():
+            return BlockResult(error=f"讀取 {start}-{start + n - 1} 失敗: {result}", bits=bits)
+        data.extend((result.bits if bits else result.registers)[:n])
+    return BlockResult(data, bits=bits)
+
+
+def verify_block(client, function_code, address, count, device_id=1):
+    """寫入隨機內容後讀回比對，回傳 BlockResult"""
+    function_code = MULTI_WRITE_FUNCTION_CODES[function_code]
+    values = block_pattern(function_code, count)
+    result = write_block(client, function_code, address, values, device_id)
+    if result.isError():
+        return result
+    result = read_block(client, VERIFY_READ_FUNCTION_CODES[function_code], address, count, device_id)
+    if result.isError():
+        return result
+    return _compare(address, values, result)
+
+
+def _compare(address, values, result):
+    """比對讀回內容，回傳 BlockResult"""
+    data = result.bits if result.bits else result.registers
+    mismatches = [i for i, (a, b) in enumerate(zip(values, data)) if a != b]
+    if mismatches:
+        return BlockResult(error=f"讀回不符: {len(mismatches)} 個位址 (第一個 {address + mismatches[0]})")
+    return result
+
+
+async def write_block_async(client, function_code, address, values, device_id=1):
+    """非同步版 write_block (PipelinedModbusClient，各塊同時送出，受管線深度限制)"""
+    function_code = MULTI_WRITE_FUNCTION_CODES[function_code]
+    method = client.write_coils if function_code == 15 else client.write_registers
+    chunks = chunk_ranges(address, len(values), max_write_count(function_code))
+    responses = await asyncio.gather(*(
+        method(start, values[start - address:start - address + count], device_id)
+        for start, count in chunks
+    ), return_exceptions=True)
+    for (start, count), result in zip(chunks, responses):
+        if isinstance(result, BaseException) or result.isError():
+            return BlockResult(error=f"寫入 {start}-{start + count - 1} 失敗: {result}")
+    return BlockResult()
+
+
+async def read_block_async(client, function_code, address, count, device_id=1):
+    """非同步版 read_block"""
+    bits = function_code in BIT_FUNCTION_CODES
+    chunks = chunk_ranges(address, count, max_read_count(function_code))
+    responses = await asyncio.gather(*(
+        client.read(function_code, start, n, device_id) for start, n in chunks
+    ), return_exceptions=True)
+    data = []
+    for (start, n), result in zip(chunks, responses):
+        if isinstance(result, BaseException) or result.isError():
+            return BlockResult(error=f"讀取 {start}-{start + n - 1} 失敗: {result}", bits=bits)
+        data.extend((result.bits if bits else result.registers)[:n])
+    return BlockResult(data, bits=bits)
+
+
+async def save_ranges_async(client, ranges, device_id=1):
+    """非同步版 save_ranges"""
+    saved = []
+    for function_code, address, count in ranges:
+        result = await read_block_async(client, VERIFY_READ_FUNCTION_CODES[function_code], address, count, device_id)
+        if result.isError():
+            return saved, str(result)
+        saved.append((function_code, address, result.bits or result.registers))
+    return saved, None
+
+
+async def restore_ranges_async(client, saved, device_id=1):
+    """非同步版 restore_ranges"""
+    for function_code, address, values in saved:
+        result = await write_block_async(client, function_code, address, values, device_id)
+        if result.isError():
+            return str(result)
+    return None
+
+
+async def verify_block_async(client, function_code, address, count, device_id=1):
+    """非同步版 verify_block"""
+    function_code = MULTI_WRITE_FUNCTION_CODES[function_code]
+    values = block_pattern(function_code, count)
+    result = await write_block_async(client, function_code, address, values, device_id)
+    if result.isError():
+        return result
+    result = await read_block_async(client, VERIFY_READ_FUNCTION_CODES[function_code], address, count, device_id)
+    if result.isError():
+        return result
+    return _compare(address, values, result)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+連線建立延遲測試
+模擬 HMI 的短連線: 反覆「連線 → 執行一次工作負載 → 關閉」，
+分別統計 TCP 連線時間、首次回應時間與連線內後續請求 (穩態) 的延遲；
+storm > 1 時每輪同時建立多個連線 (連線風暴)
+"""
+
+import asyncio
+import time
+
+from async_client import PipelinedModbusClient, backup_workload
+from modbus_engine import PERF_WORKLOADS, check_perf_concurrency
+from bulk_io import restore_ranges_async
+from perf_stats import PerfStats
+
+DEFAULT_CONNECT_CYCLES = 100
+
+
+async def _run_workload(client, ops):
+    """執行一次工作負載，回傳是否成功"""
+    try:
+        for op in ops:
+            if (await client.execute_op(op)).isError():
+                return False
+        return True
+    except (asyncio.TimeoutError, ConnectionError):
+        return False
+
+
+async def _cycle(host, port, ops, reads, timeout, result):
+    """單次短連線: 連線、執行 reads 次工作負載、關閉"""
+    client = PipelinedModbusClient(host, port, timeout=timeout, max_in_flight=1)
+    start_ns = time.perf_counter_ns()
+    if not await client.connect():
+        result["refused"] += 1
+        return
+    connected_ns = time.perf_counter_ns()
+    result["connect"].record(connected_ns - start_ns, True)
+    try:
+        success = await _run_workload(client, ops)
+        result["first"].record(time.perf_counter_ns() - connected_ns, success)
+        for _ in range(reads - 1):
+            if not success:
+                break
+            sent_ns = time.perf_counter_ns()
+            success = await _run_workload(client, ops)
+            result["steady"].record(time.perf_counter_ns() - sent_ns, success)
+    finally:
+        await client.close()
+    result["cycle"].record(time.perf_counter_ns() - start_ns, success)
+
+
+async def _restore(client, saved):
+    """重新連線並寫回備份，回傳錯誤訊息或 None"""
+    if not await client.connect():
+        return f"無法連線到 {client.host}:{client.port}"
+    try:
+        return await restore_ranges_async(client, saved)
+    finally:
+        await client.close()
+
+
+async def run_connect_test(host, port, test_type, cycles=DEFAULT_CONNECT_CYCLES, storm=1, reads=1,
+                           interval_ms=0, timeout=3, should_continue=None, restore=True):
+    """執行 cycles 輪短連線測試 (每輪同時 storm 個連線)，回傳結果 dict
+
+    connect: TCP 連線建立時間；first: 連線後第一次工作負載的回應時間；
+    steady: 同一連線內第 2 次起的工作負載延遲 (reads > 1 時)；
+    cycle: 連線到關閉的總時間。
+    restore 為 True 時先以短連線備份工作負載會寫入的位址，結束後再連線寫回
+    (測試期間不保持額外連線，以免影響連線數與連線時間)。
+    """
+    check_perf_concurrency(test_type, storm)
+    ops = PERF_WORKLOADS[test_type]
+    keeper = PipelinedModbusClient(host, port, timeout=timeout, max_in_flight=1)
+    saved = []
+    if restore and any(op[0] != "read" for op in ops):
+        if not await keeper.connect():
+            raise ConnectionError(f"無法連線到 {host}:{port}")
+        saved = await backup_workload(keeper, ops)
+        await keeper.close()
+    result = {
+        "test_type": test_type, "storm": storm, "reads": reads, "refused": 0, "attempts": 0,
+        "connect": PerfStats(retain_samples=False), "first": PerfStats(retain_samples=False),
+        "steady": PerfStats(retain_samples=False), "cycle": PerfStats(retain_samples=False),
+        "storm_ms": PerfStats(retain_samples=False),
+    }
+    interval = interval_ms / 1000.0
+
+    started = time.perf_counter()
+    try:
+        for i in range(cycles):
+            if should_continue is not None and not should_continue():
+                break
+            round_ns = time.perf_counter_ns()
+            await asyncio.gather(*(_cycle(host, port, ops, reads, timeout, result) for _ in range(storm)))
+            result["storm_ms"].record(time.perf_counter_ns() - round_ns, True)
+            result["attempts"] += storm
+            if i < cycles - 1 and interval > 0:
+                await asyncio.sleep(interval)
+        result["elapsed"] = time.perf_counter() - started
+    finally:
+        result["restore_error"] = await _restore(keeper, saved) if saved else None
+
+    for key in ("connect", "first", "steady", "cycle", "storm_ms"):
+        result[key] = result[key].summary()
+    return result
+
+
+def log_connect_test(log, result):
+    """輸出連線建立延遲的分布表，回傳是否全部成功"""
+    attempts = result["attempts"]
+    log(f"📊 連線建立延遲測試: {result['test_type']}")
+    if result.get("restore_error"):
+        log(f"⚠️ 寫回原始內容失敗: {result['restore_error']}", "WARNING")
+    log(f"   連線次數: {attempts} (每輪同時 {result['storm']} 個), 被拒絕: {result['refused']}, "
+        f"耗時 {result['elapsed']:.2f} 秒, {attempts / result['elapsed'] if result['elapsed'] else 0:.1f} 連線/秒",
+        "WARNING" if result["refused"] else "INFO")
+    log("   階段         |   次數 | 平均(ms) | P50(ms) | P99(ms) | 最大(ms) | 成功率")
+    rows = [("連線建立", "connect"), ("首次回應", "first"), ("穩態請求", "steady"), ("完整週期", "cycle")]
+    if result["storm"] > 1:
+        rows.append(("整輪風暴", "storm_ms"))
+    for label, key in rows:
+        stats = result[key]
+        if not stats:
+            continue
+        log(f"   {label:<8} | {stats['count']:>6} | {stats['avg']:>8.2f} | {stats['p50']:>7.2f} | "
+            f"{stats['p99']:>7.2f} | {stats['max']:>8.2f} | {stats['success_rate']:>5.1f}%")
+
+    first, steady = result["first"], result["steady"]
+    if first and steady and steady["p50"] > 0:
+        log(f"   首次回應 P50 為穩態的 {first['p50'] / steady['p50']:.1f} 倍")
+    log("─" * 50)
+    return not result["refused"] and bool(first) and first["success_rate"] == 100
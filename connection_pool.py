@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+持久連線池
+背景執行緒定期以輕量讀取探測閒置連線；連線中斷時以指數退避重新連線，
+並記錄每個連線的延遲、中斷次數與中斷時間，讓長時間浸泡測試撐過控制器重啟
+"""
+
+import random
+import threading
+import time
+
+from pymodbus.client import ModbusTcpClient
+from pymodbus.exceptions import ConnectionException, ModbusIOException
+
+from perf_stats import PerfStats
+from read_planner import READ_METHODS
+
+NS_PER_S = 1_000_000_000
+
+DEFAULT_PROBE_INTERVAL = 2.0  # 閒置超過此秒數才探測
+DEFAULT_BACKOFF_INITIAL = 0.5
+DEFAULT_BACKOFF_MAX = 30.0
+DEFAULT_PROBE = (2, 7200, 1)  # (功能碼, 位址, 數量): Robot Link
+
+# 經過連線池代理的請求方法 (加鎖、計時、偵測斷線)
+REQUEST_METHODS = frozenset(READ_METHODS.values()) | {
+    "write_coil", "write_register", "write_coils", "write_registers",
+}
+
+# 請求時視為連線中斷的例外 (Modbus 例外回應與單純逾時的 ModbusIOException 都不算，逾時計為該次請求失敗)
+CONNECTION_ERRORS = (ConnectionException, OSError)
+# 探測時視為連線中斷的例外 (閒置連線連探測都無回應即視為中斷)
+PROBE_ERRORS = CONNECTION_ERRORS + (ModbusIOException,)
+
+
+class PooledClient:
+    """連線池中的單一連線 (介面與 ModbusTcpClient 相容)
+
+    所有請求經過鎖 (可跨執行緒共用)；連線中斷期間請求立即失敗，
+    不會每次都嘗試重新連線。
+    """
+
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.index = index
+        self.client = ModbusTcpClient(pool.ip, port=pool.port, timeout=pool.timeout)
+        self.lock = threading.RLock()
+        self.healthy = False
+        self.generation = 0  # 每次 (重新) 連線成功加 1
+        self.reconnects = 0
+        self.outages = 0
+        self.downtime = 0.0  # 累計中斷秒數
+        self.down_since_ns = None
+        self.last_error = None
+        self.last_used_ns = 0
+        self.next_attempt_ns = 0
+        self.backoff = pool.backoff_initial
+        self.latency = PerfStats(retain_samples=False)
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if name not in REQUEST_METHODS:
+            return attr
+        return lambda *args, **kwargs: self._call(attr, *args, **kwargs)
+
+    def _call(self, method, *args, **kwargs):
+        if not self.healthy:
+            raise ConnectionException(f"連線 #{self.index} 中斷，等待重新連線: {self.last_error}")
+        with self.lock:
+            start_ns = time.perf_counter_ns()
+            try:
+                result = method(*args, **kwargs)
+            except CONNECTION_ERRORS as e:
+                self.pool.mark_down(self, e)
+                raise
+            self.latency.record(time.perf_counter_ns() - start_ns, not result.isError())
+            self.last_used_ns = time.monotonic_ns()
+            return result
+
+    def open(self):
+        """(重新) 建立連線並探測，回傳是否成功 (Modbus 例外回應也代表連線正常)"""
+        with self.lock:
+            self.client.close()
+            if not self.client.connect():
+                self.last_error = "無法建立 TCP 連線"
+                return False
+            function_code, address, count = self.pool.probe
+            try:
+                getattr(self.client, READ_METHODS[function_code])(
+                    address, count=count, device_id=self.pool.device_id
+                )
+            except PROBE_ERRORS as e:
+                self.client.close()
+                self.last_error = str(e)
+                return False
+            self.last_used_ns = time.monotonic_ns()
+            return True
+
+    def wait_healthy(self, should_continue=None, timeout=None, poll=0.1):
+        """等待連線恢復，回傳是否已恢復
+
+        should_continue() 為 False、超過 timeout 秒或連線池關閉時放棄。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.healthy:
+            if self.pool.closed or (should_continue is not None and not should_continue()):
+                return False
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(poll)
+        return True
+
+
+class ConnectionPool:
+    """持久連線池 (一個背景執行緒負責所有連線的探測與重新連線)"""
+
+    def __init__(self, ip, port, timeout=3, log=None, device_id=1, probe=DEFAULT_PROBE,
+                 probe_interval=DEFAULT_PROBE_INTERVAL, backoff_initial=DEFAULT_BACKOFF_INITIAL,
+                 backoff_max=DEFAULT_BACKOFF_MAX):
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self.log = log
+        self.device_id = device_id
+        self.probe = probe
+        self.probe_interval_ns = int(probe_interval * NS_PER_S)
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.connections = []
+        self.closed = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def primary(self):
+        return self.connections[0] if self.connections else None
+
+    def open(self, count=1):
+        """開啟最多 count 個新連線 (被拒絕即停止)，回傳成功開啟的連線列表
+
+        第一次呼叫時啟動背景健康檢查執行緒。
+        """
+        opened = []
+        for _ in range(count):
+            conn = PooledClient(self, len(self.connections))
+            if not conn.open():
+                conn.client.close()
+                break
+            conn.healthy = True
+            conn.generation = 1
+            with self._lock:
+                self.connections.append(conn)
+            opened.append(conn)
+        if opened and self._thread is None:
+            self._thread = threading.Thread(target=self._health_loop, daemon=True)
+            self._thread.start()
+        return opened
+
+    def remove(self, conn):
+        """關閉並移出一個連線"""
+        with self._lock:
+            if conn in self.connections:
+                self.connections.remove(conn)
+        with conn.lock:
+            conn.healthy = False
+            conn.client.close()
+
+    def close(self):
+        """停止健康檢查並關閉所有連線"""
+        self.closed = True
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.timeout + 1)
+        for conn in list(self.connections):
+            self.remove(conn)
+
+    def mark_down(self, conn, error):
+        """標記連線中斷 (由請求失敗或探測失敗觸發)，立即排程重新連線"""
+        if not conn.healthy:
+            return
+        conn.healthy = False
+        conn.outages += 1
+        conn.last_error = str(error)
+        conn.down_since_ns = time.monotonic_ns()
+        conn.backoff = self.backoff_initial
+        conn.next_attempt_ns = conn.down_since_ns
+        self._log(f"🔌 連線 #{conn.index} 中斷: {error}，將自動重新連線", "WARNING")
+
+    def _health_loop(self):
+        while not self._stop.wait(0.1):
+            with self._lock:
+                connections = list(self.connections)
+            for conn in connections:
+                if self._stop.is_set():
+                    return
+                if conn.healthy:
+                    self._probe_if_idle(conn)
+                else:
+                    self._try_reconnect(conn)
+
+    def _probe_if_idle(self, conn):
+        """閒置超過探測間隔時做一次輕量讀取 (有請求進行中則略過；連線錯誤或無回應才算中斷)"""
+        if time.monotonic_ns() - conn.last_used_ns < self.probe_interval_ns:
+            return
+        if not conn.lock.acquire(blocking=False):
+            return
+        try:
+            function_code, address, count = self.probe
+            try:
+                getattr(conn.client, READ_METHODS[function_code])(address, count=count, device_id=self.device_id)
+            except PROBE_ERRORS as e:
+                self.mark_down(conn, e)
+                return
+            conn.last_used_ns = time.monotonic_ns()
+        finally:
+            conn.lock.release()
+
+    def _try_reconnect(self, conn):
+        """到達退避時間時嘗試重新連線；失敗則退避時間加倍 (含 ±20% 抖動)"""
+        now = time.monotonic_ns()
+        if now < conn.next_attempt_ns:
+            return
+        if conn.open():
+            downtime = (time.monotonic_ns() - conn.down_since_ns) / NS_PER_S
+            conn.downtime += downtime
+            conn.reconnects += 1
+            conn.generation += 1
+            conn.down_since_ns = None
+            conn.healthy = True
+            self._log(f"🔌 連線 #{conn.index} 已重新連線 (中斷 {downtime:.1f} 秒)", "SUCCESS")
+            return
+        delay = conn.backoff * random.uniform(0.8, 1.2)
+        conn.next_attempt_ns = time.monotonic_ns() + int(delay * NS_PER_S)
+        conn.backoff = min(conn.backoff * 2, self.backoff_max)
+        self._log(f"🔌 連線 #{conn.index} 重新連線失敗 ({conn.last_error})，{delay:.1f} 秒後重試", "WARNING")
+
+    def _log(self, message, level="INFO"):
+        if self.log is not None:
+            self.log(message, level)
+
+
+def log_pool_status(log, pool):
+    """輸出各連線的狀態、延遲與中斷統計"""
+    log(f"🔗 連線池: {pool.ip}:{pool.port} ({len(pool.connections)} 個連線)")
+    log("   連線 | 狀態 | 請求數 | 平均(ms) | P99(ms) | 中斷 | 重連 | 中斷時間(s)")
+    for conn in pool.connections:
+        stats = conn.latency.summary()
+        avg = f"{stats['avg']:>8.2f}" if stats else f"{'-':>8}"
+        p99 = f"{stats['p99']:>7.2f}" if stats else f"{'-':>7}"
+        downtime = conn.downtime
+        if conn.down_since_ns is not None:
+            downtime += (time.monotonic_ns() - conn.down_since_ns) / NS_PER_S
+        level = "INFO" if conn.healthy and not conn.outages else "WARNING"
+        log(f"   #{conn.index:<3} | {'🟢' if conn.healthy else '🔴'}   | {conn.latency.count:>6} | {avg} | {p99} | "
+            f"{conn.outages:>4} | {conn.reconnects:>4} | {downtime:>11.1f}", level)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多台 TMflow 控制器併行輪詢 (Fleet 模式)
+以有限併行數同時輪詢所有 Robot，並產生每台的延遲/成功率表
+"""
+
+import asyncio
+import json
+import os
+import time
+
+from async_client import PipelinedModbusClient, execute_plan_async
+from modbus_engine import SNAPSHOT_READ_ITEMS, DEFAULT_SLAVE_ID
+from perf_stats import PerfStats
+from read_planner import plan_reads, DEFAULT_MAX_GAP
+
+DEFAULT_FLEET_CONCURRENCY = 16
+DEFAULT_FLEET_ROUNDS = 10
+
+
+def parse_endpoint(text, default_port=502):
+    """解析端點字串: "ip[:port] [名稱]"，回傳 dict"""
+    parts = text.split()
+    host, _, port = parts[0].partition(":")
+    return {
+        "name": " ".join(parts[1:]) or parts[0],
+        "ip": host,
+        "port": int(port) if port else default_port,
+        "device_id": DEFAULT_SLAVE_ID,
+    }
+
+
+def normalize_endpoint(entry, default_port=502):
+    """將設定檔中的端點 (字串或 dict) 轉換為統一格式"""
+    if isinstance(entry, str):
+        return parse_endpoint(entry, default_port)
+    ip = entry["ip"]
+    port = int(entry.get("port", default_port))
+    return {
+        "name": entry.get("name") or f"{ip}:{port}",
+        "ip": ip,
+        "port": port,
+        "device_id": int(entry.get("device_id", DEFAULT_SLAVE_ID)),
+    }
+
+
+def load_endpoints(path=None, config_file="testkit_config.json"):
+    """載入 Robot 端點列表
+
+    path 可為 JSON (列表或含 "fleet" 的物件) 或文字檔 (每行 "ip[:port] [名稱]"，# 為註解)；
+    未指定時讀取設定檔中的 "fleet" 欄位。
+    """
+    if path is None:
+        if not os.path.exists(config_file):
+            return []
+        with open(config_file, 'r', encoding='utf-8') as f:
+            entries = json.load(f).get("fleet", [])
+    elif path.lower().endswith(".json"):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        entries = data.get("fleet", []) if isinstance(data, dict) else data
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = [line.split("#", 1)[0].strip() for line in f]
+        entries = [e for e in entries if e]
+
+    return [normalize_endpoint(e) for e in entries]
+
+
+async def poll_robot(endpoint, blocks, rounds, timeout=3, depth=1):
+    """輪詢單台 Robot，回傳結果列
+
+    depth 為單一連線上同時進行的請求數；預設 1，不假設控制器支援管線化。
+    """
+    row = {
+        "name": endpoint["name"],
+        "ip": endpoint["ip"],
+        "port": endpoint["port"],
+        "connected": False,
+        "connect_ms": None,
+        "stats": None,
+        "error": "",
+    }
+
+    client = PipelinedModbusClient(endpoint["ip"], endpoint["port"], timeout=timeout, max_in_flight=depth)
+    start_time = time.perf_counter()
+    if not await client.connect():
+        row["error"] = "連線失敗"
+        return row
+    row["connected"] = True
+    row["connect_ms"] = (time.perf_counter() - start_time) * 1000
+
+    perf_stats = PerfStats(retain_samples=False)
+    try:
+        for _ in range(rounds):
+            start_ns = time.perf_counter_ns()
+            _, errors = await execute_plan_async(client, blocks, endpoint["device_id"])
+            perf_stats.record(time.perf_counter_ns() - start_ns, not errors)
+            if errors:
+                row["error"] = errors[-1][1]
+                if not client.connected:
+                    break
+    finally:
+        await client.close()
+
+    row["stats"] = perf_stats.summary()
+    return row
+
+
+async def poll_fleet(endpoints, rounds=DEFAULT_FLEET_ROUNDS, concurrency=DEFAULT_FLEET_CONCURRENCY,
+                     timeout=3, max_gap=DEFAULT_MAX_GAP, depth=1):
+    """併行輪詢所有 Robot (最多 concurrency 台同時進行)，回傳 (結果列, 總耗時秒)"""
+    blocks = plan_reads(SNAPSHOT_READ_ITEMS, max_gap)
+    slots = asyncio.Semaphore(concurrency)
+
+    async def bounded(endpoint):
+        async with slots:
+            return await poll_robot(endpoint, blocks, rounds, timeout, depth)
+
+    started = time.perf_counter()
+    rows = await asyncio.gather(*(bounded(e) for e in endpoints))
+    return list(rows), time.perf_counter() - started
+
+
+def log_fleet_table(log, rows, elapsed):
+    """輸出每台 Robot 的延遲/成功率表"""
+    log(f"🏭 Fleet 輪詢結果 ({len(rows)} 台, 總耗時 {elapsed:.2f} s)")
+    log("   名稱                 | 位址                  | 連線(ms) | 平均(ms) | P95(ms) | 最大(ms) | 成功率")
+    passed = 0
+    for row in rows:
+        address = f"{row['ip']}:{row['port']}"
+        stats = row["stats"]
+        if not row["connected"] or not stats:
+            log(f"   {row['name']:<20} | {address:<21} | {'--':>8} | {row['error'] or '無結果'}", "ERROR")
+            continue
+        level = "INFO" if stats["success_rate"] == 100 else "WARNING"
+        if level == "INFO":
+            passed += 1
+        log(f"   {row['name']:<20} | {address:<21} | {row['connect_ms']:>8.1f} | {stats['avg']:>8.2f} | "
+            f"{stats['p95']:>7.2f} | {stats['max']:>8.2f} | {stats['success_rate']:>5.1f}%", level)
+
+    serial_time = sum(
+        (r["connect_ms"] or 0) / 1000 + (r["stats"]["avg"] * r["stats"]["count"] / 1000 if r["stats"] else 0)
+        for r in rows
+    )
+    log(f"📊 通過 {passed}/{len(rows)} 台; 依序輪詢預估 {serial_time:.2f} s, 實際 {elapsed:.2f} s")
+    log("─" * 50)
+    return passed
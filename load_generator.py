@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+開迴路固定速率負載產生器
+依單調時鐘排程送出請求，延遲由「預定送出時間」起算 (修正 coordinated omission)
+"""
+
+import asyncio
+import time
+
+from async_client import PipelinedModbusClient, backup_workload
+from modbus_engine import PERF_WORKLOADS, check_perf_concurrency
+from bulk_io import restore_ranges_async
+from perf_stats import PerfStats
+
+# 達成速率低於目標的此比例，或錯誤率高於此值，即視為飽和
+SATURATION_RATE_RATIO = 0.95
+SATURATION_ERROR_RATE = 1.0  # %
+
+DEFAULT_RATES = (50, 100, 200, 400, 800)
+
+
+async def run_fixed_rate(host, port, test_type, rate, test_count, depth=1, timeout=3,
+                         perf_stats=None, should_continue=None, restore=True):
+    """以固定速率 rate (req/s) 送出 test_count 次工作負載
+
+    depth 為同時進行中的請求上限；請求來不及送出時會排隊，
+    排隊時間計入延遲 (perf_stats)，另以 service 記錄實際送出後的服務時間。
+    restore 為 True 時先備份工作負載會寫入的位址，結束後寫回。
+    回傳結果 dict。
+    """
+    check_perf_concurrency(test_type, depth)
+    ops = PERF_WORKLOADS[test_type]
+    if perf_stats is None:
+        perf_stats = PerfStats(retain_samples=False)
+    service = PerfStats(retain_samples=False)
+
+    client = PipelinedModbusClient(host, port, timeout=timeout, max_in_flight=depth)
+    if not await client.connect():
+        raise ConnectionError(f"無法連線到 {host}:{port}")
+    saved = await backup_workload(client, ops, restore)
+    restore_error = None
+
+    slots = asyncio.Semaphore(depth)
+    period_ns = 1_000_000_000 / rate
+    last_done = [0]
+
+    async def one(intended_ns):
+        async with slots:
+            sent_ns = time.perf_counter_ns()
+            try:
+                success = True
+                for op in ops:
+                    if (await client.execute_op(op)).isError():
+                        success = False
+                        break
+            except (asyncio.TimeoutError, ConnectionError):
+                success = False
+            done_ns = time.perf_counter_ns()
+        perf_stats.record(done_ns - intended_ns, success)
+        service.record(done_ns - sent_ns, success)
+        last_done[0] = max(last_done[0], done_ns)
+
+    pending = set()  # 進行中的請求 (完成即移除，記憶體不隨次數成長)
+    dispatched = 0
+    start_ns = time.perf_counter_ns()
+    try:
+        for i in range(test_count):
+            if should_continue is not None and not should_continue():
+                break
+            intended_ns = start_ns + int(i * period_ns)
+            delay_ns = intended_ns - time.perf_counter_ns()
+            if delay_ns > 0:
+                await asyncio.sleep(delay_ns / 1_000_000_000)
+            task = asyncio.create_task(one(intended_ns))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            dispatched += 1
+        dispatch_ns = time.perf_counter_ns() - start_ns
+        await asyncio.gather(*pending)
+        if saved:
+            restore_error = await restore_ranges_async(client, saved)
+    finally:
+        await client.close()
+
+    # 至少以排程的時間窗 (dispatched 個週期) 計算，避免低速率、少量請求時實際速率被高估
+    elapsed_s = max(last_done[0] - start_ns, int(dispatched * period_ns), 1) / 1_000_000_000
+    completed = perf_stats.count
+    return {
+        "test_type": test_type,
+        "target_rate": rate,
+        "achieved_rate": completed / elapsed_s,
+        "send_rate": (dispatched - 1) / (dispatch_ns / 1_000_000_000) if dispatched > 1 and dispatch_ns else float(rate),
+        "elapsed": elapsed_s,
+        "latency": perf_stats.summary(),
+        "service": service.summary(),
+        "restore_error": restore_error,
+    }
+
+
+def is_saturated(result):
+    """判斷此速率是否已達飽和"""
+    latency = result["latency"]
+    if not latency:
+        return True
+    return (result["achieved_rate"] < result["target_rate"] * SATURATION_RATE_RATIO
+            or 100 - latency["success_rate"] > SATURATION_ERROR_RATE)
+
+
+async def run_rate_sweep(host, port, test_type, rates=DEFAULT_RATES, duration=5, depth=1, timeout=3,
+                         restore=True):
+    """依序以遞增速率測試，回傳各速率結果 (每個速率執行約 duration 秒)"""
+    check_perf_concurrency(test_type, depth)
+    rows = []
+    for rate in rates:
+        rows.append(await run_fixed_rate(
+            host, port, test_type, rate, max(1, int(rate * duration)), depth, timeout, restore=restore
+        ))
+    return rows
+
+
+def log_fixed_rate(log, result):
+    """輸出單一速率的結果"""
+    latency = result["latency"]
+    service = result["service"]
+    log(f"📊 固定速率測試: {result['test_type']}")
+    if result.get("restore_error"):
+        log(f"⚠️ 寫回原始內容失敗: {result['restore_error']}", "WARNING")
+    log(f"   目標速率: {result['target_rate']:.1f} req/s")
+    log(f"   實際速率: {result['achieved_rate']:.1f} req/s (送出 {result['send_rate']:.1f} req/s)")
+    if not latency:
+        log("   無結果", "WARNING")
+        return
+    log(f"   延遲 (自預定送出時間): 平均 {latency['avg']:.2f} / P50 {latency['p50']:.2f} / "
+        f"P99 {latency['p99']:.2f} / P99.9 {latency['p999']:.2f} / 最大 {latency['max']:.2f} ms")
+    log(f"   服務時間 (自實際送出): 平均 {service['avg']:.2f} / P50 {service['p50']:.2f} / "
+        f"P99 {service['p99']:.2f} ms")
+    log(f"   成功率: {latency['success_rate']:.1f}%")
+    if is_saturated(result):
+        log("⚠️ 已達飽和: 控制器無法維持目標速率", "WARNING")
+    log("─" * 50)
+
+
+def log_rate_sweep(log, test_type, rows):
+    """輸出速率掃描結果表與飽和點"""
+    log(f"📊 速率掃描結果: {test_type}")
+    errors = [row["restore_error"] for row in rows if row.get("restore_error")]
+    if errors:
+        log(f"⚠️ 寫回原始內容失敗: {errors[0]}", "WARNING")
+    log("   目標(req/s) | 實際(req/s) | P50(ms) | P99(ms) | 服務P50(ms) | 成功率")
+    saturation = None
+    for row in rows:
+        latency, service = row["latency"], row["service"]
+        if not latency:
+            log(f"   {row['target_rate']:>11.1f} | 無結果", "WARNING")
+            saturation = saturation or row
+            continue
+        saturated = is_saturated(row)
+        if saturated and saturation is None:
+            saturation = row
+        log(f"   {row['target_rate']:>11.1f} | {row['achieved_rate']:>11.1f} | {latency['p50']:>7.2f} | "
+            f"{latency['p99']:>7.2f} | {service['p50']:>11.2f} | {latency['success_rate']:>5.1f}%",
+            "WARNING" if saturated else "INFO")
+
+    if saturation is None:
+        log(f"✅ 最高測試速率 {rows[-1]['target_rate']:.1f} req/s 仍未飽和", "SUCCESS")
+    else:
+        log(f"⚠️ 飽和點: 約 {saturation['target_rate']:.1f} req/s "
+            f"(實際 {saturation['achieved_rate']:.1f} req/s)", "WARNING")
+    log("─" * 50)
+    return saturation
@@ -0,0 +1,897 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TM Robot Modbus 測試引擎
+與 GUI 無關的 Modbus 客戶端、位址表、解碼器與測試執行器
+"""
+
+import struct
+import time
+import random
+import queue
+import threading
+from datetime import datetime
+
+from read_planner import ReadItem, plan_reads, execute_plan, DEFAULT_MAX_GAP, READ_METHODS
+from perf_stats import PerfStats
+from results_store import ResultStore, RESULT_TEST, RESULT_SUITE, RESULT_CUSTOM, RESULT_PERF
+from bulk_io import (
+    write_block, read_block, verify_block, block_pattern, workload_bytes, written_ranges, save_ranges,
+    restore_ranges, BLOCK_OPS
+)
+from suite_runner import AddressLocks, normalize_access, DEFAULT_SUITE_CONCURRENCY
+from connection_pool import ConnectionPool
+
+# === TM Robot 位址表 ===
+
+BASE_COORDS_ADDR = 7001   # Base 座標系 (7001-7012)
+JOINT_ANGLES_ADDR = 7013  # Joint 角度 (7013-7024)
+TOOL_COORDS_ADDR = 7025   # Tool 座標系 (7025-7036)
+COORD_REGISTER_COUNT = 12  # 6 個 Float32
+
+# Robot 狀態 - Discrete Inputs
+STATUS_DISCRETE_INPUTS = [
+    (7200, "Robot Link"),
+    (7201, "Error"),
+    (7202, "Project Running"),
+    (7208, "ESTOP"),
+]
+
+# Robot 狀態 - Input Registers
+STATUS_INPUT_REGISTERS = [
+    (7215, "Robot State"),
+    (7216, "Operation Mode"),
+]
+
+LIGHT_COIL_ADDR = 7206
+
+# User Define Area (9000-9999)
+USER_DEFINE_START = 9000
+USER_DEFINE_END = 9999
+USER_DEFINE_SIZE = USER_DEFINE_END - USER_DEFINE_START + 1
+USER_DEFINE_TEST_ADDRESSES = [9000, 9001, 9002, 9010, 9020, 9100]
+
+DEFAULT_SLAVE_ID = 1
+
+# 座標項目 (名稱, 起始位址)
+COORD_ITEMS = [
+    ("Base 座標", BASE_COORDS_ADDR),
+    ("Joint 角度", JOINT_ANGLES_ADDR),
+    ("Tool 座標", TOOL_COORDS_ADDR),
+]
+
+# Robot 狀態讀取項目 (合併後為 DI 7200-7208、IR 7215-7216 兩個請求)
+STATUS_READ_ITEMS = (
+    [ReadItem(name, 2, addr, 1) for addr, name in STATUS_DISCRETE_INPUTS] +
+    [ReadItem(name, 4, addr, 1) for addr, name in STATUS_INPUT_REGISTERS]
+)
+
+# 完整快照讀取項目 (Base+Joint+Tool 合併為單一 36-register 請求)
+SNAPSHOT_READ_ITEMS = (
+    [ReadItem(name, 4, addr, COORD_REGISTER_COUNT) for name, addr in COORD_ITEMS] +
+    STATUS_READ_ITEMS
+)
+
+# 性能測試類型
+PERF_TEST_TYPES = (
+    "Base座標讀取", "Tool座標讀取", "Joint角度讀取", "Robot狀態讀取",
+    "User Define讀取", "User Define寫入", "User Define讀寫", "混合測試", "極限測試",
+    "User Define區塊寫入", "User Define區塊驗證"
+)
+
+# 性能測試工作負載 (依序執行的操作)
+# ("read", 功能碼, 位址, 數量) / ("write", 功能碼, 位址, 值；None 為隨機值)
+# ("write_block", 功能碼, 位址, 數量) 隨機內容整塊寫入 (FC16/FC15 分塊)
+# ("verify_block", 功能碼, 位址, 數量) 整塊寫入後讀回比對
+PERF_WORKLOADS = {
+    "Base座標讀取": [("read", 4, BASE_COORDS_ADDR, COORD_REGISTER_COUNT)],
+    "Tool座標讀取": [("read", 4, TOOL_COORDS_ADDR, COORD_REGISTER_COUNT)],
+    "Joint角度讀取": [("read", 4, JOINT_ANGLES_ADDR, COORD_REGISTER_COUNT)],
+    "Robot狀態讀取": [("read", 2, 7200, 4)],
+    "User Define讀取": [("read", 3, USER_DEFINE_START, 10)],
+    "User Define寫入": [("write", 6, USER_DEFINE_START, None)],
+    # 先寫入再讀取驗證
+    "User Define讀寫": [("write", 6, USER_DEFINE_START, None), ("read", 3, USER_DEFINE_START, 1)],
+    # Base XYZ + 狀態
+    "混合測試": [("read", 4, BASE_COORDS_ADDR, 6), ("read", 2, 7200, 2)],
+    # 最小數據量的極限測試
+    "極限測試": [("read", 3, USER_DEFINE_START, 1)],
+    # 整個 User Define 區 (9000-9999)
+    "User Define區塊寫入": [("write_block", 16, USER_DEFINE_START, USER_DEFINE_SIZE)],
+    "User Define區塊驗證": [("verify_block", 16, USER_DEFINE_START, USER_DEFINE_SIZE)],
+}
+
+# 整塊寫入/驗證的工作負載: 多個請求同時執行會互相覆寫，只能單一連線依序執行
+EXCLUSIVE_PERF_TYPES = frozenset(
+    name for name, ops in PERF_WORKLOADS.items() if any(op[0] in BLOCK_OPS for op in ops)
+)
+
+# 性能測試遇到連線中斷時: 同一次測試最多重新執行的次數；
+# 連線在此秒數內即恢復表示並非真正中斷，該次測試直接計為失敗
+PERF_SAMPLE_RETRIES = 2
+PERF_IMMEDIATE_RECOVERY_S = 1.0
+
+
+def check_perf_concurrency(test_type, concurrency):
+    """concurrency 個請求同時執行 test_type 時 (管線深度、連線數等) 不允許則拋出 ValueError"""
+    if concurrency > 1 and test_type in EXCLUSIVE_PERF_TYPES:
+        raise ValueError(f"{test_type} 每次都寫入同一整塊位址，同時執行 {concurrency} 個會互相覆寫而誤判，"
+                         f"請以單一連線、深度 1 執行")
+
+
+# 資料型別
+DATATYPES = ("Bool", "Int16", "UInt16", "Int32", "UInt32", "Float32", "Raw")
+WORD_DATATYPES = ("Int32", "UInt32", "Float32")  # 佔用兩個 register 的型別
+WORD_FORMATS = {"Int32": "i", "UInt32": "I", "Float32": "f"}
+
+# 32-bit 數值的位元組順序 (A 為最高位元組): ABCD 為 Modbus 標準 big-endian
+WORD_ORDERS = ("ABCD", "CDAB", "BADC", "DCBA")
+DEFAULT_WORD_ORDER = "ABCD"
+
+# 測試套件定義 (測試名稱 → 引擎方法)
+TEST_SUITES = {
+    "基本功能測試": [
+        {"name": "Robot Link", "func": "test_robot_status"},
+        {"name": "Base 座標", "func": "test_base_coords"},
+        {"name": "Joint 角度", "func": "test_joint_angles"}
+    ],
+    "完整座標測試": [
+        {"name": "Base 座標", "func": "test_base_coords"},
+        {"name": "Tool 座標", "func": "test_tool_coords"},
+        {"name": "Joint 角度", "func": "test_joint_angles"}
+    ],
+    "狀態檢查": [
+        {"name": "Robot 狀態", "func": "test_robot_status"}
+    ],
+    "User Define 測試": [
+        {"name": "User Define Area", "func": "test_user_define_area"}
+    ],
+    "全功能測試": [
+        {"name": "Base 座標", "func": "test_base_coords"},
+        {"name": "Tool 座標", "func": "test_tool_coords"},
+        {"name": "Joint 角度", "func": "test_joint_angles"},
+        {"name": "Robot 狀態", "func": "test_robot_status"},
+        {"name": "User Define Area", "func": "test_user_define_area"}
+    ]
+}
+
+# 預設測試名稱 (引擎方法 → 顯示名稱)
+PRESET_TEST_NAMES = {
+    "test_base_coords": "Base 座標",
+    "test_tool_coords": "Tool 座標",
+    "test_joint_angles": "Joint 角度",
+    "test_robot_status": "Robot 狀態",
+    "test_user_define_area": "User Define Area",
+    "test_all": "全部測試",
+}
+
+# 預設測試存取的位址範圍 (功能碼, 位址, 數量)，供套件並行執行時判斷衝突
+TEST_ACCESS = {
+    "test_base_coords": {"reads": [(4, BASE_COORDS_ADDR, COORD_REGISTER_COUNT)]},
+    "test_tool_coords": {"reads": [(4, TOOL_COORDS_ADDR, COORD_REGISTER_COUNT)]},
+    "test_joint_angles": {"reads": [(4, JOINT_ANGLES_ADDR, COORD_REGISTER_COUNT)]},
+    "test_robot_status": {"reads": [(2, 7200, 9), (4, 7215, 2)]},
+    "test_user_define_area": {
+        "reads": [(3, USER_DEFINE_START, max(USER_DEFINE_TEST_ADDRESSES) - USER_DEFINE_START + 1)],
+        "writes": [(6, USER_DEFINE_START, 1)],
+    },
+    "test_all": {"reads": [(4, BASE_COORDS_ADDR, 36), (2, 7200, 9), (4, 7215, 2)]},
+}
+
+LOG_ICONS = {
+    "ERROR": "❌",
+    "SUCCESS": "✅",
+    "WARNING": "⚠️",
+}
+
+
+def format_log_line(message, level="INFO"):
+    """格式化日誌行 (含時間戳與等級圖示)"""
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    icon = LOG_ICONS.get(level, "ℹ️")
+    return f"[{timestamp}] {icon} {message}"
+
+
+def console_log(message, level="INFO"):
+    """預設日誌輸出 (標準輸出)"""
+    print(format_log_line(message, level), flush=True)
+
+
+# === 解碼器 ===
+
+def registers_to_floats(registers):
+    """將 register 配對轉換為 Float32 列表"""
+    return convert_registers(registers, "Float32")
+
+
+def convert_registers(registers, datatype, word_order=DEFAULT_WORD_ORDER):
+    """依資料型別轉換 register 數據
+
+    整個 register 列表只打包一次，再以單一格式字串解開；
+    word_order 僅適用於 32-bit 型別，奇數個 register 時忽略最後一個。
+    """
+    if datatype == "Bool":
+        return [bool(reg) for reg in registers]
+    elif datatype == "Int16":
+        count = len(registers)
+        return list(struct.unpack(f'>{count}h', struct.pack(f'>{count}H', *registers)))
+    elif datatype in WORD_DATATYPES:
+        return decode_words(registers, WORD_FORMATS[datatype], word_order)
+    else:  # Raw / UInt16
+        return list(registers)
+
+
+def decode_words(registers, code, word_order=DEFAULT_WORD_ORDER):
+    """將 register 配對批次解碼為 32-bit 數值 (code 為 struct 格式字元 i/I/f)"""
+    if word_order not in WORD_ORDERS:
+        raise ValueError(f"不支援的 word order: {word_order}")
+    count = len(registers) // 2
+    registers = registers[:count * 2]
+    if word_order in ("CDAB", "DCBA"):  # 低位 word 在前
+        swapped = list(registers)
+        swapped[0::2] = registers[1::2]
+        swapped[1::2] = registers[0::2]
+        registers = swapped
+    byte_order = '<' if word_order in ("BADC", "DCBA") else '>'  # 每個 word 內的位元組互換
+    data = struct.pack(f'{byte_order}{count * 2}H', *registers)
+    return list(struct.unpack(f'>{count}{code}', data))
+
+
+def resolve_write_value(value):
+    """取得寫入值 (None 表示 1-65535 隨機值)"""
+    return random.randint(1, 65535) if value is None else value
+
+
+def format_coordinates(coords, coord_type):
+    """格式化座標數據為顯示行"""
+    lines = []
+    if "Joint" in coord_type or "joint" in coord_type.lower():
+        for i, angle in enumerate(coords[:6], 1):
+            lines.append(f"   Joint {i}: {angle:8.3f}°")
+    elif len(coords) >= 6:
+        lines.append(f"   X:  {coords[0]:8.3f} mm")
+        lines.append(f"   Y:  {coords[1]:8.3f} mm")
+        lines.append(f"   Z:  {coords[2]:8.3f} mm")
+        lines.append(f"   Rx: {coords[3]:8.3f}°")
+        lines.append(f"   Ry: {coords[4]:8.3f}°")
+        lines.append(f"   Rz: {coords[5]:8.3f}°")
+    else:
+        for i, coord in enumerate(coords):
+            lines.append(f"   [{i}]: {coord:8.3f}")
+    return lines
+
+
+def decode_snapshot(values):
+    """將讀取結果中的座標 register 轉換為 Float32 (其他項目維持原值)"""
+    coord_names = {name for name, _ in COORD_ITEMS}
+    return {key: registers_to_floats(v) if key in coord_names else v for key, v in values.items()}
+
+
+class ModbusTestEngine:
+    """TM Robot Modbus 測試引擎 (不依賴 GUI)"""
+
+    def __init__(self, log=None, max_gap=DEFAULT_MAX_GAP):
+        self.client = None  # connection_pool.PooledClient (中斷時自動重新連線)
+        self.pool = None
+        self.is_connected = False
+        self.address = None  # (ip, port, timeout)
+        self.log = log or console_log
+        self.max_gap = max_gap  # 合併讀取允許的位址間隙
+        self._plans = {}  # 讀取計畫快取
+        self.recorder = None  # 設定 TimeSeriesRecorder 後，合併讀取的結果都會被記錄
+        self.results = ResultStore()  # 測試結果記錄 (供匯出)
+
+    # === 連線 ===
+
+    def connect(self, ip, port, timeout=3):
+        """連線到 Modbus，回傳是否成功
+
+        連線由連線池管理: 之後若中斷會在背景以指數退避自動重新連線。
+        """
+        self.disconnect()
+        self.address = (ip, port, timeout)
+        self.pool = ConnectionPool(ip, port, timeout, log=self.log, device_id=DEFAULT_SLAVE_ID,
+                                   probe=(2, STATUS_DISCRETE_INPUTS[0][0], 1))
+        opened = self.pool.open()
+        self.client = opened[0] if opened else None
+        self.is_connected = bool(opened)
+        return self.is_connected
+
+    def disconnect(self):
+        """斷線"""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+        self.client = None
+        self.is_connected = False
+
+    def _connection_down(self):
+        """目前連線是否中斷 (等待連線池重新連線中)"""
+        return self.client is not None and not getattr(self.client, "healthy", True)
+
+    def _require_connection(self):
+        """檢查連線狀態"""
+        if not self.is_connected:
+            self.log("❌ 請先連線", "ERROR")
+            return False
+        return True
+
+    # === 讀取 ===
+
+    def read_coordinates(self, start_addr, coord_type, count=COORD_REGISTER_COUNT):
+        """讀取座標數據"""
+        if not self._require_connection():
+            return None
+
+        try:
+            self.log(f"📍 讀取 {coord_type} (位址 {start_addr}-{start_addr+count-1})...")
+
+            result = self.client.read_input_registers(start_addr, count=count, device_id=DEFAULT_SLAVE_ID)
+
+            if result.isError():
+                self.log(f"📍 讀取失敗: {result}", "ERROR")
+                return None
+
+            return self._log_coordinates(coord_type, result.registers)
+
+        except Exception as e:
+            self.log(f"📍 讀取錯誤: {e}", "ERROR")
+            return None
+
+    def _log_coordinates(self, coord_type, registers):
+        """轉換並顯示座標數據"""
+        self.log(f"📊 原始數據: {registers}")
+
+        # 轉換為 Float32
+        coords = registers_to_floats(registers)
+
+        # 格式化顯示
+        self.log(f"✅ {coord_type}:", "SUCCESS")
+
+        if coord_type == "Joint 角度" or len(coords) >= 6:
+            for line in format_coordinates(coords, coord_type):
+                self.log(line)
+        else:
+            self.log(f"   數據: {coords}")
+
+        self.log("─" * 50)
+        return coords
+
+    def read_items(self, items, device_id=DEFAULT_SLAVE_ID):
+        """以合併讀取方式讀取多個項目，回傳 {key: 數值列表}"""
+        items = tuple(items)
+        plan = self._plans.get(items)
+        if plan is None:
+            plan = self._plans[items] = plan_reads(items, self.max_gap)
+
+        sampled_ns = time.monotonic_ns()
+        values, errors = execute_plan(self.client, plan, device_id)
+        for block, error in errors:
+            self.log(f"📍 讀取失敗 (FC{block.function_code:02d} {block.address}-{block.address + block.count - 1}): {error}", "ERROR")
+        if self.recorder is not None and values:
+            self.recorder.record_values(decode_snapshot(values), sampled_ns)
+        return values
+
+    def read_snapshot(self):
+        """讀取座標與狀態快照 (合併為最少請求)"""
+        if not self._require_connection():
+            return None
+        return self.read_items(SNAPSHOT_READ_ITEMS)
+
+    def read_robot_status(self):
+        """讀取 Robot 狀態，回傳 {名稱: 值}"""
+        if not self._require_connection():
+            return None
+
+        try:
+            self.log("📊 讀取 Robot 狀態...")
+            return self._log_status(self.read_items(STATUS_READ_ITEMS))
+
+        except Exception as e:
+            self.log(f"📊 狀態讀取錯誤: {e}", "ERROR")
+            return None
+
+    def _log_status(self, values):
+        """顯示 Robot 狀態，回傳 {名稱: 值}"""
+        status = {}
+
+        # Discrete Inputs
+        for addr, name in STATUS_DISCRETE_INPUTS:
+            if name in values:
+                value = values[name][0]
+                status[name] = value
+                self.log(f"   {name} ({addr}): {'🟢 True' if value else '🔴 False'}")
+
+        # Input Registers
+        for addr, name in STATUS_INPUT_REGISTERS:
+            if name in values:
+                value = values[name][0]
+                status[name] = value
+                self.log(f"   {name} ({addr}): {value}")
+
+        self.log("✅ Robot 狀態讀取完成", "SUCCESS")
+        self.log("─" * 50)
+        return status
+
+    def read_function(self, function, start_addr, count, slave_id=DEFAULT_SLAVE_ID):
+        """依功能碼名稱讀取，回傳 pymodbus 回應"""
+        if "Coils" in function:
+            return self.client.read_coils(start_addr, count=count, device_id=slave_id)
+        elif "Discrete Inputs" in function:
+            return self.client.read_discrete_inputs(start_addr, count=count, device_id=slave_id)
+        elif "Holding Registers" in function:
+            return self.client.read_holding_registers(start_addr, count=count, device_id=slave_id)
+        elif "Input Registers" in function:
+            return self.client.read_input_registers(start_addr, count=count, device_id=slave_id)
+        raise ValueError(f"不支援的功能碼: {function}")
+
+    def write_block(self, function_code, address, values, device_id=DEFAULT_SLAVE_ID):
+        """整塊寫入 (FC16 / FC15，依協定限制分塊)，回傳 BlockResult"""
+        return write_block(self.client, function_code, address, values, device_id)
+
+    def read_block(self, function_code, address, count, device_id=DEFAULT_SLAVE_ID):
+        """整塊讀取 (超過單次上限時分塊)，回傳 BlockResult"""
+        return read_block(self.client, function_code, address, count, device_id)
+
+    # === 預設測試 ===
+
+    def run_named_test(self, func_name, name=None, category=RESULT_TEST, detail=""):
+        """執行預設測試並記錄結果，回傳測試函數的回傳值"""
+        name = name or PRESET_TEST_NAMES.get(func_name, func_name)
+        start_ns = time.perf_counter_ns()
+        try:
+            result = getattr(self, func_name)()
+        except Exception as e:
+            self.results.add(category, name, False, (time.perf_counter_ns() - start_ns) / 1_000_000,
+                             f"{detail} {e}".strip())
+            raise
+        self.results.add(category, name, result is not None and result is not False,
+                         (time.perf_counter_ns() - start_ns) / 1_000_000, detail)
+        return result
+
+    def test_base_coords(self):
+        """測試 Base 座標"""
+        return self.read_coordinates(BASE_COORDS_ADDR, "Base 座標")
+
+    def test_tool_coords(self):
+        """測試 Tool 座標"""
+        return self.read_coordinates(TOOL_COORDS_ADDR, "Tool 座標")
+
+    def test_joint_angles(self):
+        """測試 Joint 角度"""
+        return self.read_coordinates(JOINT_ANGLES_ADDR, "Joint 角度")
+
+    def test_robot_status(self):
+        """測試 Robot 狀態"""
+        return self.read_robot_status()
+
+    def test_user_define_area(self):
+        """測試 TM Robot User Define Area (9000-9999)，回傳是否全部成功"""
+        if not self._require_connection():
+            return False
+
+        self.log("👤 測試 TM Robot User Define Area...")
+        self.log(f"📍 位址範圍: {USER_DEFINE_START}-{USER_DEFINE_END} (User-define)")
+
+        ok = True
+
+        # 測試幾個 User Define 位址
+        for addr in USER_DEFINE_TEST_ADDRESSES:
+            try:
+                # 嘗試讀取 Holding Registers (功能碼 03)
+                result = self.client.read_holding_registers(addr, count=1, device_id=DEFAULT_SLAVE_ID)
+
+                if result.isError():
+                    ok = False
+                    self.log(f"   位址 {addr}: ❌ 讀取失敗 - {result}")
+                else:
+                    value = result.registers[0]
+                    self.log(f"   位址 {addr}: ✅ 值 = {value} (0x{value:04X})")
+
+            except Exception as e:
+                ok = False
+                self.log(f"   位址 {addr}: ❌ 錯誤 - {e}")
+
+        # 測試寫入功能 (如果支援)
+        self.log("\n📝 測試 User Define Area 寫入功能...")
+        test_write_addr = USER_DEFINE_START
+        test_value = 12345
+
+        try:
+            # 寫入測試值
+            write_result = self.client.write_register(test_write_addr, test_value, device_id=DEFAULT_SLAVE_ID)
+
+            if write_result.isError():
+                ok = False
+                self.log(f"   寫入位址 {test_write_addr}: ❌ 失敗 - {write_result}")
+            else:
+                self.log(f"   寫入位址 {test_write_addr}: ✅ 成功寫入 {test_value}")
+
+                # 讀回驗證
+                read_result = self.client.read_holding_registers(test_write_addr, count=1, device_id=DEFAULT_SLAVE_ID)
+                if not read_result.isError():
+                    read_value = read_result.registers[0]
+                    if read_value == test_value:
+                        self.log(f"   驗證讀取: ✅ 值匹配 = {read_value}")
+                    else:
+                        ok = False
+                        self.log(f"   驗證讀取: ⚠️ 值不匹配 = {read_value} (預期: {test_value})")
+
+        except Exception as e:
+            ok = False
+            self.log(f"   寫入測試錯誤: {e}")
+
+        self.log("✅ User Define Area 測試完成", "SUCCESS")
+        self.log("─" * 50)
+        return ok
+
+    def test_all(self):
+        """測試所有項目 (座標與狀態以合併讀取一次取得)"""
+        if not self._require_connection():
+            return False
+
+        self.log("🚀 開始完整測試...")
+        self.log("=" * 50)
+
+        try:
+            values = self.read_snapshot()
+        except Exception as e:
+            self.log(f"📍 讀取錯誤: {e}", "ERROR")
+            return False
+
+        ok = True
+        for coord_type, start_addr in COORD_ITEMS:
+            if coord_type in values:
+                self.log(f"📍 {coord_type} (位址 {start_addr}-{start_addr + COORD_REGISTER_COUNT - 1})")
+                self._log_coordinates(coord_type, values[coord_type])
+            else:
+                ok = False
+
+        self.log("📊 Robot 狀態:")
+        status = self._log_status(values)
+        ok = ok and len(status) == len(STATUS_READ_ITEMS)
+
+        self.log("🎉 完整測試完成！", "SUCCESS")
+        self.log("=" * 50)
+        return ok
+
+    def execute_user_define_test(self, function, start_addr, count, datatype, slave_id=DEFAULT_SLAVE_ID, test_name="Custom Test",
+                                 word_order=DEFAULT_WORD_ORDER):
+        """執行自定義測試並記錄結果，回傳轉換後的數值"""
+        if not self._require_connection():
+            return None
+
+        start_ns = time.perf_counter_ns()
+        values = self._run_user_define_test(function, start_addr, count, datatype, slave_id, test_name, word_order)
+        self.results.add(RESULT_CUSTOM, test_name, values is not None, (time.perf_counter_ns() - start_ns) / 1_000_000,
+                         f"{function} 位址 {start_addr} 數量 {count} {datatype}")
+        return values
+
+    def _run_user_define_test(self, function, start_addr, count, datatype, slave_id, test_name, word_order):
+        """執行自定義測試 (讀取、轉換並顯示)"""
+
+        try:
+            self.log(f"🚀 執行自定義測試: {test_name}")
+            if datatype in WORD_DATATYPES:
+                datatype_text = f"{datatype} ({word_order})"
+            else:
+                datatype_text = datatype
+            self.log(f"📊 參數: {function}, 位址={start_addr}, 數量={count}, 型別={datatype_text}, Slave={slave_id}")
+
+            # 根據功能碼執行讀取
+            try:
+                result = self.read_function(function, start_addr, count, slave_id)
+            except ValueError:
+                self.log("❌ 不支援的功能碼", "ERROR")
+                return None
+
+            if result.isError():
+                self.log(f"❌ 讀取失敗: {result}", "ERROR")
+                return None
+
+            # 處理結果
+            if "Coils" in function or "Discrete Inputs" in function:
+                values = result.bits[:count]
+                self.log(f"✅ {test_name} 結果:", "SUCCESS")
+                for i, value in enumerate(values):
+                    self.log(f"   [{start_addr + i}]: {value}")
+            else:
+                registers = result.registers[:count]
+                self.log(f"📊 原始數據: {registers}")
+
+                # 根據資料型別轉換
+                values = convert_registers(registers, datatype, word_order)
+
+                self.log(f"✅ {test_name} 結果:", "SUCCESS")
+
+                # 特殊處理座標數據
+                if datatype == "Float32" and count >= 6:
+                    for line in format_coordinates(values, test_name):
+                        self.log(line)
+                else:
+                    step = 2 if datatype in WORD_DATATYPES else 1
+                    for i, value in enumerate(values):
+                        self.log(f"   [{start_addr + i * step}]: {value}")
+
+            self.log("─" * 50)
+            return values
+
+        except Exception as e:
+            self.log(f"❌ 測試錯誤: {e}", "ERROR")
+            return None
+
+    # === 測試套件 ===
+
+    def run_test_suite(self, suite_name, suites=None, concurrency=DEFAULT_SUITE_CONCURRENCY):
+        """執行測試套件，回傳 (通過數, 失敗數)
+
+        最多以 concurrency 個連線並行執行；唯讀測試可同時進行，
+        寫入測試與存取重疊位址範圍的測試依序執行 (見 TEST_ACCESS)。
+        各測試的日誌在完成後整段輸出，不會互相穿插。
+        """
+        if not self._require_connection():
+            return None
+
+        suites = suites or TEST_SUITES
+        if suite_name not in suites:
+            self.log(f"❌ 找不到測試套件: {suite_name}", "ERROR")
+            return None
+
+        suite = suites[suite_name]
+        if hasattr(suite, "run"):  # 由套件檔編譯的執行計畫 (suite_file.SuitePlan)
+            return suite.run(self)
+        workers = self._open_suite_workers(min(concurrency, len(suite)))
+
+        self.log(f"🚀 開始執行測試套件: {suite_name} (並行連線 {len(workers)})")
+        self.log("=" * 50)
+
+        locks = AddressLocks()
+        idle = queue.Queue()
+        for worker in workers:
+            idle.put(worker)
+        log_lock = threading.Lock()
+        outcomes = []
+
+        def run(test):
+            access = normalize_access(TEST_ACCESS.get(test['func']))
+            lines = []
+            locks.acquire(access)
+            worker = idle.get()
+            worker.log = lambda message, level="INFO": lines.append((message, level))
+            start_ns = time.perf_counter_ns()
+            try:
+                worker.log(f"\n▶️ 執行: {test['name']}")
+                # 執行測試函數 (結果記錄到 self.results)
+                result = worker.run_named_test(test['func'], test['name'], RESULT_SUITE, suite_name)
+                ok = result is not None and result is not False
+                if not ok:
+                    worker.log(f"❌ 測試失敗: {test['name']}", "ERROR")
+            except Exception as e:
+                ok = False
+                worker.log(f"❌ 測試失敗: {test['name']} - {e}", "ERROR")
+            finally:
+                elapsed = (time.perf_counter_ns() - start_ns) / 1_000_000_000
+                idle.put(worker)
+                locks.release(access)
+            with log_lock:
+                for message, level in lines:
+                    self.log(message, level)
+                outcomes.append((ok, elapsed))
+
+        started = time.perf_counter()
+        try:
+            # 同時執行的測試數受限於閒置引擎數 (idle)
+            threads = [threading.Thread(target=run, args=(test,), daemon=True) for test in suite]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            for worker in workers[1:]:
+                self.pool.remove(worker.client)
+        wall_time = time.perf_counter() - started
+
+        passed = sum(1 for ok, _ in outcomes if ok)
+        failed = len(suite) - passed
+        serial_time = sum(elapsed for _, elapsed in outcomes)
+
+        self.log("=" * 50)
+        self.log(f"🎉 測試套件完成: {suite_name}", "SUCCESS")
+        self.log(f"📊 結果: 通過 {passed}/{len(suite)}, 失敗 {failed}/{len(suite)}")
+        speedup = f", 加速 {serial_time / wall_time:.1f} 倍" if wall_time > 0 else ""
+        self.log(f"⏱️ 耗時 {wall_time * 1000:.1f} ms (依序執行 {serial_time * 1000:.1f} ms{speedup})")
+
+        if failed == 0:
+            self.log("✅ 所有測試通過！", "SUCCESS")
+        else:
+            self.log(f"⚠️ 有 {failed} 個測試失敗", "WARNING")
+
+        return passed, failed
+
+    def _open_suite_workers(self, count):
+        """建立套件執行用的引擎: 第一個共用目前連線，其餘由連線池開啟新連線
+
+        控制器拒絕額外連線時以現有連線數執行。
+        """
+        workers = [self._child_engine(self.client)]
+        if self.pool is None or count < 2:
+            return workers
+        for conn in self.pool.open(count - 1):
+            workers.append(self._child_engine(conn))
+        return workers
+
+    def _child_engine(self, client):
+        """建立共用結果記錄的子引擎"""
+        child = ModbusTestEngine(log=self.log, max_gap=self.max_gap)
+        child.results = self.results
+        if client is not None:
+            child.client = client
+            child.is_connected = self.is_connected
+            child.address = self.address
+        return child
+
+    # === 性能測試 ===
+
+    def execute_op(self, op, device_id=DEFAULT_SLAVE_ID):
+        """執行單一工作負載操作，回傳 pymodbus 回應"""
+        kind, function_code, address, arg = op
+        if kind == "read":
+            method = getattr(self.client, READ_METHODS[function_code])
+            return method(address, count=arg, device_id=device_id)
+        if kind == "write_block":
+            return self.write_block(function_code, address, block_pattern(function_code, arg), device_id)
+        if kind == "verify_block":
+            return verify_block(self.client, function_code, address, arg, device_id)
+        value = resolve_write_value(arg)
+        if function_code == 5:
+            return self.client.write_coil(address, bool(value), device_id=device_id)
+        return self.client.write_register(address, value, device_id=device_id)
+
+    def execute_single_performance_test(self, test_type):
+        """執行單次性能測試 (工作負載內所有操作皆成功才算成功)"""
+        ops = PERF_WORKLOADS.get(test_type)
+        if not ops:
+            return False
+        try:
+            for op in ops:
+                if self.execute_op(op).isError():
+                    return False
+            return True
+
+        except Exception:
+            return False
+
+    def run_performance_test(self, test_type, test_count, interval_ms, stats=None, on_progress=None, should_continue=None,
+                             max_downtime=None, restore=True):
+        """執行性能測試循環，結果記錄到 stats (PerfStats) 並回傳
+
+        on_progress(current, total) 於每次測試後呼叫；
+        should_continue() 回傳 False 時提前結束。
+        連線中斷時暫停等待自動重新連線 (最多 max_downtime 秒，None 為不限)，恢復後重新執行該次測試
+        (最多 PERF_SAMPLE_RETRIES 次；連線立即恢復時計為失敗)；單純逾時計為失敗。
+        restore 為 True 時先備份工作負載會寫入的位址，結束後寫回原始內容。
+        """
+        if stats is None:
+            stats = PerfStats()
+        saved = None
+        ranges = written_ranges(PERF_WORKLOADS.get(test_type, ()))
+        if ranges and restore:
+            saved, error = save_ranges(self.client, ranges)
+            if error:
+                self.log(f"❌ 無法備份寫入範圍的原始內容，停止性能測試: {error}", "ERROR")
+                return stats
+        try:
+            return self._perf_loop(test_type, test_count, interval_ms, stats, on_progress, should_continue,
+                                   max_downtime)
+        finally:
+            if saved:
+                error = restore_ranges(self.client, saved)
+                if error:
+                    self.log(f"⚠️ 寫回原始內容失敗: {error}", "WARNING")
+                else:
+                    self.log("↩️ 已寫回原始內容")
+
+    def _perf_loop(self, test_type, test_count, interval_ms, stats, on_progress, should_continue, max_downtime):
+        interval = interval_ms / 1000.0  # 轉換為秒
+        resumed = False
+        retries = 0  # 目前這次測試因連線中斷重新執行的次數
+        failed_ns = None  # 因連線中斷而失敗、等待重新執行的那次測試耗時
+        failed_at_ns = 0
+
+        i = 0
+        while i < test_count:
+            if should_continue is not None and not should_continue():
+                break
+
+            # 連線中斷: 暫停測試等待連線池重新連線，中斷期間不算失敗
+            if self._connection_down():
+                down_ns = time.perf_counter_ns()
+                if not self.client.wait_healthy(should_continue, max_downtime):
+                    if self._connection_down() and (should_continue is None or should_continue()):
+                        self.log(f"❌ 連線未在 {max_downtime} 秒內恢復，停止性能測試", "ERROR")
+                    break
+                stats.record_outage(time.perf_counter_ns() - down_ns)
+                resumed = True
+
+            # 執行單次測試 (單調時鐘，ns 精度)
+            if failed_ns is not None and (retries >= PERF_SAMPLE_RETRIES or
+                                          time.perf_counter_ns() - failed_at_ns < PERF_IMMEDIATE_RECOVERY_S * 1e9):
+                # 重新執行次數已達上限，或連線立即恢復 (並非真正中斷): 該次測試計為失敗
+                success, elapsed_ns = False, failed_ns
+            else:
+                start_ns = time.perf_counter_ns()
+                success = self.execute_single_performance_test(test_type)
+                elapsed_ns = time.perf_counter_ns() - start_ns
+                if not success and self._connection_down() and retries < PERF_SAMPLE_RETRIES:
+                    retries += 1
+                    failed_ns = elapsed_ns
+                    failed_at_ns = time.perf_counter_ns()
+                    continue  # 這次失敗是連線中斷造成，恢復後重新執行
+            stats.record(elapsed_ns, success, resumed)
+            resumed = False
+            retries = 0
+            failed_ns = None
+            i += 1
+
+            if on_progress is not None:
+                on_progress(i, test_count)
+
+            # 等待間隔 (支援 0ms 極限測試)
+            if i < test_count and interval > 0:  # 最後一次不需要等待，0ms 不等待
+                time.sleep(interval)
+
+        return stats
+
+    def report_performance(self, test_type, interval_ms, perf_stats):
+        """輸出性能測試結果統計，回傳統計數據"""
+        stats = perf_stats.summary()
+        if not stats:
+            return None
+
+        avg_time = stats["avg"]
+
+        self.log("🎉 性能測試完成！", "SUCCESS")
+        self.log("📊 測試結果統計:")
+        self.log(f"   測試類型: {test_type}")
+        self.log(f"   測試次數: {stats['count']}")
+        self.log(f"   測試間隔: {interval_ms} ms")
+        self.log(f"   平均時間: {avg_time:.2f} ms")
+        self.log(f"   最小時間: {stats['min']:.2f} ms")
+        self.log(f"   最大時間: {stats['max']:.2f} ms")
+        self.log(f"   50% 百分位: {stats['p50']:.2f} ms")
+        self.log(f"   90% 百分位: {stats['p90']:.2f} ms")
+        self.log(f"   95% 百分位: {stats['p95']:.2f} ms")
+        self.log(f"   99% 百分位: {stats['p99']:.2f} ms")
+        self.log(f"   99.9% 百分位: {stats['p999']:.2f} ms")
+        self.log(f"   標準差: {stats['std_dev']:.2f} ms")
+        self.log(f"   成功率: {stats['success_rate']:.1f}%")
+        if stats["outages"]:
+            self.log(f"   連線中斷: {stats['outages']} 次, 共 {stats['downtime_ms'] / 1000:.1f} 秒 "
+                     f"(恢復後樣本 {stats['resumed']} 筆，中斷期間不計入)", "WARNING")
+
+        # 資料吞吐量 (每次傳輸量 / 平均時間)
+        size = workload_bytes(PERF_WORKLOADS.get(test_type, ()))
+        if size and avg_time > 0:
+            stats["bytes_per_s"] = size / (avg_time / 1000)
+            self.log(f"   資料吞吐量: {stats['bytes_per_s'] / 1024:.1f} KB/s (每次 {size} bytes)")
+
+        # 特殊提示
+        if str(interval_ms) == "0":
+            self.log("⚡ 極限測試模式: 無間隔連續測試", "WARNING")
+            if avg_time < 5:
+                self.log("🚀 優秀性能: 平均反應時間 < 5ms", "SUCCESS")
+            elif avg_time < 10:
+                self.log("✅ 良好性能: 平均反應時間 < 10ms", "SUCCESS")
+            else:
+                self.log("⚠️ 注意: 平均反應時間較高，可能需要優化", "WARNING")
+
+        if "寫入" in test_type:
+            self.log("📝 寫入測試: 包含寫入操作的性能測試")
+
+        self.results.add(
+            RESULT_PERF, test_type, stats["success_rate"] == 100, stats["avg"],
+            f"次數 {stats['count']}, 間隔 {interval_ms} ms, P99 {stats['p99']:.2f} ms, 成功率 {stats['success_rate']:.1f}%"
+        )
+
+        self.log("─" * 50)
+        return stats
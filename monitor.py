@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+高頻監控引擎
+每組訊號有各自的輪詢頻率 (例如 Joint 100 Hz、狀態 2 Hz)，依單調時鐘排程不累積漂移；
+只有數值變化超過死區 (deadband) 時才通知 GUI 與記錄器
+"""
+
+import time
+
+from modbus_engine import SNAPSHOT_READ_ITEMS, DEFAULT_SLAVE_ID, decode_snapshot
+from read_planner import plan_reads, execute_plan, DEFAULT_MAX_GAP
+
+NS_PER_S = 1_000_000_000
+
+# 預設監控群組: 座標 10 Hz (死區 0.01)、狀態 2 Hz (任何變化)
+DEFAULT_MONITOR_GROUPS = [
+    {"name": "座標", "signals": ["Base 座標", "Joint 角度", "Tool 座標"], "rate": 10, "deadband": 0.01},
+    {"name": "狀態", "signals": ["Robot Link", "Error", "Project Running", "ESTOP",
+                                "Robot State", "Operation Mode"], "rate": 2, "deadband": 0},
+]
+
+MONITOR_ITEMS = {item.key: item for item in SNAPSHOT_READ_ITEMS}
+
+
+def build_groups(config=None, max_gap=DEFAULT_MAX_GAP):
+    """將監控設定 (dict 列表) 編譯為輪詢群組 (含預先規劃的讀取區塊)"""
+    groups = []
+    for entry in config or DEFAULT_MONITOR_GROUPS:
+        unknown = [s for s in entry["signals"] if s not in MONITOR_ITEMS]
+        if unknown:
+            raise ValueError(f"未知的監控訊號: {', '.join(unknown)}")
+        rate = float(entry["rate"])
+        if rate <= 0:
+            raise ValueError(f"監控頻率必須大於 0: {entry['name']}")
+        groups.append({
+            "name": entry["name"],
+            "rate": rate,
+            "period_ns": int(NS_PER_S / rate),
+            "deadband": float(entry.get("deadband", 0)),
+            "blocks": plan_reads([MONITOR_ITEMS[s] for s in entry["signals"]], max_gap),
+            "polls": 0,
+            "errors": 0,
+            "overruns": 0,
+            "changes": 0,
+            "failing": False,
+        })
+    return groups
+
+
+def changed(old, new, deadband):
+    """判斷數值是否變化 (浮點數超過死區，其他型別任何變化)"""
+    if old is None or len(old) != len(new):
+        return True
+    for a, b in zip(old, new):
+        if isinstance(b, float):
+            if abs(a - b) > deadband:
+                return True
+        elif a != b:
+            return True
+    return False
+
+
+class MonitorEngine:
+    """多頻率監控排程器 (在呼叫 run() 的執行緒中執行)
+
+    on_change(名稱, 數值列表, monotonic_ns) 只在數值變化時呼叫；
+    engine.recorder 有設定時，變化的數值同時寫入記錄器。
+    """
+
+    def __init__(self, engine, groups=None, on_change=None, on_error=None, device_id=DEFAULT_SLAVE_ID):
+        self.engine = engine
+        self.groups = groups if groups is not None else build_groups(max_gap=engine.max_gap)
+        self.on_change = on_change
+        self.on_error = on_error
+        self.device_id = device_id
+        self.last_values = {}
+        self.started_ns = None
+        self.elapsed = 0.0
+
+    def poll(self, group):
+        """輪詢一個群組，回傳有變化的 {名稱: 數值}"""
+        sampled_ns = time.monotonic_ns()
+        values, errors = execute_plan(self.engine.client, group["blocks"], self.device_id)
+        group["polls"] += 1
+        if errors:
+            block, error = errors[0]
+            self._report_error(group, f"FC{block.function_code:02d} {block.address} {error}")
+        else:
+            group["failing"] = False
+
+        updates = {}
+        for name, value in decode_snapshot(values).items():
+            if changed(self.last_values.get(name), value, group["deadband"]):
+                self.last_values[name] = value
+                updates[name] = value
+        if updates:
+            group["changes"] += len(updates)
+            recorder = self.engine.recorder
+            if recorder is not None:
+                recorder.record_values(updates, sampled_ns)
+            if self.on_change is not None:
+                for name, value in updates.items():
+                    self.on_change(name, value, sampled_ns)
+        return updates
+
+    def _report_error(self, group, error):
+        """記錄輪詢錯誤 (連續錯誤只通知第一次，避免洗版)"""
+        group["errors"] += 1
+        if not group["failing"] and self.on_error is not None:
+            self.on_error(f"{group['name']}: {error}")
+        group["failing"] = True
+
+    def run(self, should_continue, duration=None):
+        """執行監控直到 should_continue() 回傳 False (或超過 duration 秒)
+
+        各群組的第 k 次輪詢預定在 start + k * period；
+        落後超過一個週期時跳過錯過的時段 (計入 overruns)，不會連續補發。
+        """
+        self.started_ns = start_ns = time.monotonic_ns()
+        end_ns = None if duration is None else start_ns + int(duration * NS_PER_S)
+        due = [start_ns] * len(self.groups)
+
+        while should_continue():
+            i = min(range(len(self.groups)), key=due.__getitem__)
+            now = time.monotonic_ns()
+            if end_ns is not None and due[i] >= end_ns:
+                break
+            if due[i] > now:
+                time.sleep(min(due[i] - now, 100_000_000) / NS_PER_S)  # 最多睡 0.1 秒以便及時停止
+                continue
+
+            group = self.groups[i]
+            try:
+                self.poll(group)
+            except Exception as e:
+                self._report_error(group, e)
+
+            due[i] += group["period_ns"]
+            now = time.monotonic_ns()
+            if now - due[i] > group["period_ns"]:
+                missed = (now - due[i]) // group["period_ns"]
+                group["overruns"] += missed
+                due[i] += missed * group["period_ns"]
+
+        self.elapsed = (time.monotonic_ns() - start_ns) / NS_PER_S
+
+
+def format_signal(name, values):
+    """格式化監控訊號的顯示文字"""
+    if values and isinstance(values[0], float):
+        return f"{name}: " + ", ".join(f"{v:.3f}" for v in values)
+    if len(values) == 1:
+        value = values[0]
+        if isinstance(value, bool):
+            return f"{name}: {'🟢 True' if value else '🔴 False'}"
+        return f"{name}: {value}"
+    return f"{name}: {list(values)}"
+
+
+def log_monitor_summary(log, monitor):
+    """輸出各監控群組的實際輪詢頻率與變化數"""
+    elapsed = monitor.elapsed or 1e-9
+    log(f"📊 監控統計 ({monitor.elapsed:.1f} s)")
+    log("   群組     | 目標(Hz) | 實際(Hz) | 輪詢數 | 變化數 | 落後 | 錯誤")
+    for group in monitor.groups:
+        level = "WARNING" if group["overruns"] or group["errors"] else "INFO"
+        log(f"   {group['name']:<8} | {group['rate']:>8.1f} | {group['polls'] / elapsed:>8.1f} | "
+            f"{group['polls']:>6} | {group['changes']:>6} | {group['overruns']:>4} | {group['errors']:>4}", level)
+    log("─" * 50)
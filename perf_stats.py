@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能測試統計
+固定記憶體的對數分桶延遲直方圖 (HDR 風格)，可容納數百萬筆樣本
+"""
+
+from array import array
+from datetime import datetime
+
+NS_PER_MS = 1_000_000
+
+# 每個 2 的冪次區間切成 2^SUB_BUCKET_BITS 個子桶 → 相對誤差 < 2 / 2^SUB_BUCKET_BITS (約 1.6%)
+SUB_BUCKET_BITS = 7
+# 可區分的最大延遲 (超過者計入最後一個桶，max 仍為精確值)
+MAX_TRACKABLE_NS = 60 * 1_000_000_000
+
+REPORT_PERCENTILES = (50, 90, 95, 99, 99.9)
+
+
+class LatencyHistogram:
+    """對數分桶延遲直方圖 (單位: ns)
+
+    小於 2^SUB_BUCKET_BITS 的值精確記錄；之後每個 2 的冪次區間
+    以 2^(SUB_BUCKET_BITS-1) 個等寬子桶記錄，記憶體固定約 16 KB。
+    """
+
+    def __init__(self, sub_bucket_bits=SUB_BUCKET_BITS, max_value_ns=MAX_TRACKABLE_NS):
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.half_count = self.sub_bucket_count // 2
+        self.sub_bucket_bits = sub_bucket_bits
+        self.max_index = self._index(max_value_ns)
+        self.counts = array('Q', bytes(8 * (self.max_index + 1)))
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        """值 → 桶索引"""
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits
+        return self.sub_bucket_count + (shift - 1) * self.half_count + ((value >> shift) - self.half_count)
+
+    def _bounds(self, index):
+        """桶索引 → (下界, 上界) (含)"""
+        if index < self.sub_bucket_count:
+            return index, index
+        shift, offset = divmod(index - self.sub_bucket_count, self.half_count)
+        shift += 1
+        low = (offset + self.half_count) << shift
+        return low, low + (1 << shift) - 1
+
+    def record(self, value_ns):
+        """記錄一筆延遲 (ns)"""
+        value_ns = max(0, int(value_ns))
+        self.counts[min(self._index(value_ns), self.max_index)] += 1
+        self.count += 1
+        if self.min is None or value_ns < self.min:
+            self.min = value_ns
+        if self.max is None or value_ns > self.max:
+            self.max = value_ns
+
+    def merge(self, other):
+        """合併另一個直方圖 (相同設定)"""
+        for i, c in enumerate(other.counts):
+            if c:
+                self.counts[i] += c
+        self.count += other.count
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def percentile(self, percent):
+        """回傳百分位數 (ns，為該桶的上界，並限制在 [min, max] 內)"""
+        if not self.count:
+            return None
+        rank = max(1, -(-self.count * percent // 100))  # ceil
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c:
+                seen += c
+                if seen >= rank:
+                    return min(max(self._bounds(i)[1], self.min), self.max)
+        return self.max
+
+
+class RunningStats:
+    """O(1) 累加統計: Welford 平均/變異數與最小/最大值"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        """加入一個數值"""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """合併另一個累加器 (Chan 平行演算法)"""
+        if not other.count:
+            return
+        if not self.count:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def variance(self):
+        """母體變異數"""
+        return self.m2 / self.count if self.count else 0.0
+
+    @property
+    def stddev(self):
+        return self.variance ** 0.5
+
+
+class PerfStats:
+    """性能測試統計收集器
+
+    所有樣本計入直方圖與成功計數；retain_samples 為 False 時
+    不保留逐筆樣本，記憶體不隨測試次數成長。
+    連線中斷期間不記錄樣本 (不算失敗)，改記錄中斷時間；恢復後的第一筆樣本標記為 resumed。
+    """
+
+    def __init__(self, retain_samples=True):
+        self.retain_samples = retain_samples
+        self.histogram = LatencyHistogram()
+        self.running = RunningStats()  # 即時統計 (ms)
+        self.samples = []
+        self.success_count = 0
+        self.failure_count = 0
+        self.outages = []  # 每次連線中斷的時間 (ms)
+        self.resumed_count = 0
+        self.started_at = datetime.now()
+
+    @property
+    def count(self):
+        return self.success_count + self.failure_count
+
+    def record(self, elapsed_ns, success, resumed=False):
+        """記錄一次測試結果 (resumed: 連線恢復後的第一筆)"""
+        self.histogram.record(elapsed_ns)
+        self.running.add(elapsed_ns / NS_PER_MS)
+        if success:
+            self.success_count += 1
+        else:
+            self.failure_count += 1
+        if resumed:
+            self.resumed_count += 1
+        if self.retain_samples:
+            self.samples.append({
+                'time': elapsed_ns / NS_PER_MS,
+                'success': success,
+                'timestamp': datetime.now(),
+                'resumed': resumed
+            })
+
+    def record_outage(self, duration_ns):
+        """記錄一次連線中斷 (期間未執行的測試不計入樣本)"""
+        self.outages.append(duration_ns / NS_PER_MS)
+
+    def merge(self, other):
+        """合併另一個收集器 (逐筆樣本依時間排序)"""
+        self.histogram.merge(other.histogram)
+        self.running.merge(other.running)
+        self.success_count += other.success_count
+        self.failure_count += other.failure_count
+        self.outages.extend(other.outages)
+        self.resumed_count += other.resumed_count
+        if self.retain_samples:
+            self.samples.extend(other.samples)
+            self.samples.sort(key=lambda r: r['timestamp'])
+
+    def live(self):
+        """回傳即時統計 (O(1)，供 GUI 定時刷新)，沒有樣本時回傳 None"""
+        r = self.running
+        if not r.count:
+            return None
+        return {
+            "count": r.count,
+            "avg": r.mean,
+            "min": r.min,
+            "max": r.max,
+            "std_dev": r.stddev,
+            "success_rate": self.success_count / self.count * 100,
+        }
+
+    def summary(self):
+        """回傳完整統計數據 (單位 ms，含百分位數)，沒有樣本時回傳 None"""
+        stats = self.live()
+        if not stats:
+            return None
+        h = self.histogram
+        for p in REPORT_PERCENTILES:
+            stats[percentile_key(p)] = h.percentile(p) / NS_PER_MS
+        stats["outages"] = len(self.outages)
+        stats["downtime_ms"] = sum(self.outages)
+        stats["resumed"] = self.resumed_count
+        return stats
+
+
+def percentile_key(percent):
+    """百分位數對應的統計欄位名稱: 50 → p50, 99.9 → p999"""
+    return "p" + f"{percent:g}".replace(".", "")
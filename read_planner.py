@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Modbus 讀取規劃器
+將相鄰或接近的位址依功能碼合併為最少的讀取請求，再切回各項目
+"""
+
+from collections import namedtuple
+
+# 協定限制 (單次請求)
+MAX_READ_REGISTERS = 125
+MAX_READ_BITS = 2000
+
+# 預設允許合併的位址間隙 (中間未使用的位址也會一併讀取)
+DEFAULT_MAX_GAP = 8
+
+# 功能碼 → pymodbus 客戶端讀取方法
+READ_METHODS = {
+    1: "read_coils",
+    2: "read_discrete_inputs",
+    3: "read_holding_registers",
+    4: "read_input_registers",
+}
+
+BIT_FUNCTION_CODES = (1, 2)
+
+# key: 項目名稱, function_code: 功能碼, address: 起始位址, count: 數量
+ReadItem = namedtuple("ReadItem", ["key", "function_code", "address", "count"])
+
+# items: [(key, 區塊內偏移, 數量), ...]
+ReadBlock = namedtuple("ReadBlock", ["function_code", "address", "count", "items"])
+
+
+def max_read_count(function_code):
+    """回傳功能碼單次可讀取的最大數量"""
+    return MAX_READ_BITS if function_code in BIT_FUNCTION_CODES else MAX_READ_REGISTERS
+
+
+def plan_reads(items, max_gap=DEFAULT_MAX_GAP):
+    """將讀取項目合併為最少的區塊
+
+    同一功能碼中，若下一個項目與目前區塊的間隙 <= max_gap，
+    且合併後不超過協定上限，就併入同一個請求。
+    """
+    blocks = []
+    by_function = {}
+    for item in items:
+        if item.count < 1 or item.count > max_read_count(item.function_code):
+            raise ValueError(f"讀取數量超出範圍: {item}")
+        by_function.setdefault(item.function_code, []).append(item)
+
+    for function_code in sorted(by_function):
+        limit = max_read_count(function_code)
+        ordered = sorted(by_function[function_code], key=lambda i: (i.address, i.count))
+
+        start = end = None  # 目前區塊 [start, end)
+        members = []
+        for item in ordered:
+            item_end = item.address + item.count
+            if members and item.address - end <= max_gap and max(end, item_end) - start <= limit:
+                end = max(end, item_end)
+                members.append(item)
+                continue
+            if members:
+                blocks.append(_make_block(function_code, start, end, members))
+            start, end, members = item.address, item_end, [item]
+        if members:
+            blocks.append(_make_block(function_code, start, end, members))
+
+    return blocks
+
+
+def _make_block(function_code, start, end, members):
+    """建立讀取區塊"""
+    return ReadBlock(
+        function_code, start, end - start,
+        [(m.key, m.address - start, m.count) for m in members]
+    )
+
+
+def execute_plan(client, blocks, device_id=1):
+    """執行讀取計畫
+
+    回傳 (values, errors)：values 為 {key: 數值列表}，
+    errors 為 [(ReadBlock, 錯誤訊息)]，失敗區塊內的項目不會出現在 values 中。
+    """
+    values = {}
+    errors = []
+    for block in blocks:
+        method = getattr(client, READ_METHODS[block.function_code])
+        try:
+            result = method(block.address, count=block.count, device_id=device_id)
+        except Exception as e:
+            errors.append((block, str(e)))
+            continue
+        if result.isError():
+            errors.append((block, str(result)))
+            continue
+        data = result.bits if block.function_code in BIT_FUNCTION_CODES else result.registers
+        for key, offset, count in block.items:
+            values[key] = list(data[offset:offset + count])
+    return values, errors
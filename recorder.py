@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+時間序列記錄器
+將每次輪詢的數值 (含單調時鐘時間戳) 寫入僅附加、分塊壓縮的二進位檔，
+記憶體只保留目前的區塊；關閉時寫入索引，之後可依時間範圍快速讀取
+
+檔案格式 (little-endian):
+    FILE_MAGIC
+    區塊 = 類型 (1 byte) + 長度 (uint32) + 內容
+        H  檔頭 JSON (起始時間)
+        C  訊號定義 JSON (id, 名稱, struct 格式字元, 數量)
+        D  資料區塊: 第一筆/最後一筆時間 (int64 ns) + 筆數 (uint32) + zlib 壓縮的樣本
+        I  索引 JSON (訊號定義與各資料區塊的位置/時間範圍)
+    結尾: 索引區塊位置 (uint64) + INDEX_MAGIC
+
+未正常關閉 (沒有索引) 的檔案會以依序掃描區塊的方式重建索引。
+"""
+
+import bisect
+import csv
+import json
+import os
+import struct
+import time
+import zlib
+from datetime import datetime
+
+FILE_MAGIC = b"TMREC\x01\n\x00"
+INDEX_MAGIC = b"TMRIDX\x01\x00"
+BLOCK_HEADER = struct.Struct("<cI")
+CHUNK_HEADER = struct.Struct("<qqI")  # 第一筆時間, 最後一筆時間, 筆數
+SAMPLE_HEADER = struct.Struct("<qH")  # 時間 (ns), 訊號 id
+TRAILER = struct.Struct("<Q8s")
+
+DEFAULT_CHUNK_BYTES = 64 * 1024  # 未壓縮資料達此大小即寫出區塊
+DEFAULT_CHUNK_SECONDS = 1.0      # 或區塊涵蓋時間達此秒數 (異常結束時最多遺失此段)
+COMPRESS_LEVEL = 6
+
+RECORDING_EXTENSION = ".tmrec"
+
+
+def value_code(values):
+    """依數值型別決定 struct 格式字元"""
+    if all(isinstance(v, bool) for v in values):
+        return "?"
+    if all(isinstance(v, int) for v in values):
+        return "H" if all(0 <= v <= 0xFFFF for v in values) else "q"
+    return "f"  # Float32 來源，以 float32 儲存不失真
+
+
+class TimeSeriesRecorder:
+    """時間序列記錄器 (單一寫入者)"""
+
+    def __init__(self, path, chunk_bytes=DEFAULT_CHUNK_BYTES, chunk_seconds=DEFAULT_CHUNK_SECONDS):
+        self.path = path
+        self.chunk_bytes = chunk_bytes
+        self.chunk_ns = int(chunk_seconds * 1_000_000_000)
+        self.channels = {}  # 名稱 → (id, struct.Struct, 格式字元, 數量)
+        self.chunks = []    # (位置, 第一筆時間, 最後一筆時間, 筆數)
+        self.sample_count = 0
+        self._buffer = bytearray()
+        self._chunk_first = None
+        self._chunk_last = None
+        self._chunk_count = 0
+        self._origin_ns = time.monotonic_ns()
+
+        self._file = open(path, "wb")
+        self._file.write(FILE_MAGIC)
+        self._write_block(b"H", json.dumps({
+            "version": 1,
+            "started_at": datetime.now().isoformat(timespec="milliseconds"),
+            "wall_time_ns": time.time_ns(),
+        }).encode("utf-8"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def closed(self):
+        return self._file is None
+
+    def _write_block(self, kind, payload):
+        """寫入一個區塊，回傳其位置"""
+        offset = self._file.tell()
+        self._file.write(BLOCK_HEADER.pack(kind, len(payload)))
+        self._file.write(payload)
+        return offset
+
+    def _channel(self, name, values):
+        """取得訊號定義 (首次出現時寫入檔案)"""
+        channel = self.channels.get(name)
+        if channel is None:
+            code = value_code(values)
+            channel = (len(self.channels), struct.Struct(f"<{len(values)}{code}"), code, len(values))
+            self.channels[name] = channel
+            self._flush_chunk()  # 訊號定義須位於使用它的資料區塊之前
+            self._write_block(b"C", json.dumps({
+                "id": channel[0], "name": name, "code": code, "count": len(values)
+            }, ensure_ascii=False).encode("utf-8"))
+        elif len(values) != channel[3]:
+            raise ValueError(f"訊號 {name} 的數量不一致: {len(values)} != {channel[3]}")
+        return channel
+
+    def record(self, name, values, timestamp_ns=None):
+        """記錄一個訊號的數值列表 (timestamp_ns 為 time.monotonic_ns()，省略則取目前時間)"""
+        if timestamp_ns is None:
+            timestamp_ns = time.monotonic_ns()
+        channel_id, packer, _, _ = self._channel(name, values)
+        t = timestamp_ns - self._origin_ns
+
+        if self._chunk_first is None:
+            self._chunk_first = t
+        self._chunk_last = t
+        self._chunk_count += 1
+        self.sample_count += 1
+        self._buffer += SAMPLE_HEADER.pack(t, channel_id)
+        self._buffer += packer.pack(*values)
+
+        if len(self._buffer) >= self.chunk_bytes or t - self._chunk_first >= self.chunk_ns:
+            self._flush_chunk()
+
+    def record_values(self, values, timestamp_ns=None):
+        """以相同時間戳記錄多個訊號 ({名稱: 數值列表})"""
+        if timestamp_ns is None:
+            timestamp_ns = time.monotonic_ns()
+        for name, channel_values in values.items():
+            self.record(name, channel_values, timestamp_ns)
+
+    def _flush_chunk(self):
+        """壓縮並寫出目前的資料區塊"""
+        if not self._chunk_count:
+            return
+        payload = CHUNK_HEADER.pack(self._chunk_first, self._chunk_last, self._chunk_count)
+        payload += zlib.compress(bytes(self._buffer), COMPRESS_LEVEL)
+        offset = self._write_block(b"D", payload)
+        self._file.flush()
+        self.chunks.append((offset, self._chunk_first, self._chunk_last, self._chunk_count))
+        self._buffer.clear()
+        self._chunk_first = self._chunk_last = None
+        self._chunk_count = 0
+
+    def close(self):
+        """寫出剩餘資料與索引並關閉檔案"""
+        if self._file is None:
+            return
+        self._flush_chunk()
+        index = {
+            "channels": [
+                {"id": cid, "name": name, "code": code, "count": count}
+                for name, (cid, _, code, count) in self.channels.items()
+            ],
+            "chunks": self.chunks,
+        }
+        offset = self._write_block(b"I", json.dumps(index, ensure_ascii=False).encode("utf-8"))
+        self._file.write(TRAILER.pack(offset, INDEX_MAGIC))
+        self._file.close()
+        self._file = None
+
+
+class RecordingReader:
+    """時間序列記錄檔讀取器"""
+
+    def __init__(self, path):
+        self.path = path
+        self.header = {}
+        self.channels = {}  # id → (名稱, struct.Struct, 數量)
+        self.chunks = []
+        self.indexed = False
+        self._file = open(path, "rb")
+        if self._file.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            self._file.close()
+            raise ValueError(f"不是記錄檔: {path}")
+        if not self._load_index():
+            self._scan()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def _read_block(self, offset):
+        """讀取指定位置的區塊，回傳 (類型, 內容)；檔案截斷時回傳 (None, None)"""
+        self._file.seek(offset)
+        head = self._file.read(BLOCK_HEADER.size)
+        if len(head) < BLOCK_HEADER.size:
+            return None, None
+        kind, length = BLOCK_HEADER.unpack(head)
+        payload = self._file.read(length)
+        if len(payload) < length:
+            return None, None
+        return kind, payload
+
+    def _add_channel(self, info):
+        code = info["code"]
+        self.channels[info["id"]] = (info["name"], struct.Struct(f"<{info['count']}{code}"), info["count"])
+
+    def _load_index(self):
+        """讀取檔尾索引，回傳是否成功"""
+        size = self._file.seek(0, os.SEEK_END)
+        if size < len(FILE_MAGIC) + TRAILER.size:
+            return False
+        self._file.seek(size - TRAILER.size)
+        offset, magic = TRAILER.unpack(self._file.read(TRAILER.size))
+        if magic != INDEX_MAGIC:
+            return False
+        kind, payload = self._read_block(offset)
+        if kind != b"I":
+            return False
+        index = json.loads(payload)
+        for info in index["channels"]:
+            self._add_channel(info)
+        self.chunks = [tuple(c) for c in index["chunks"]]
+        _, header = self._read_block(len(FILE_MAGIC))
+        self.header = json.loads(header) if header else {}
+        self.indexed = True
+        return True
+
+    def _scan(self):
+        """依序掃描區塊重建索引 (未正常關閉的檔案)"""
+        offset = len(FILE_MAGIC)
+        while True:
+            self._file.seek(offset)
+            head = self._file.read(BLOCK_HEADER.size)
+            if len(head) < BLOCK_HEADER.size:
+                break
+            kind, length = BLOCK_HEADER.unpack(head)
+            if kind == b"D":
+                chunk_head = self._file.read(CHUNK_HEADER.size)
+                end = self._file.seek(0, os.SEEK_END)
+                if len(chunk_head) < CHUNK_HEADER.size or offset + BLOCK_HEADER.size + length > end:
+                    break  # 最後一個區塊不完整
+                self.chunks.append((offset,) + CHUNK_HEADER.unpack(chunk_head))
+            elif kind in (b"H", b"C"):
+                payload = self._file.read(length)
+                if len(payload) < length:
+                    break
+                if kind == b"H":
+                    self.header = json.loads(payload)
+                else:
+                    self._add_channel(json.loads(payload))
+            elif kind != b"I":
+                break
+            offset += BLOCK_HEADER.size + length
+
+    @property
+    def channel_names(self):
+        return [name for name, _, _ in self.channels.values()]
+
+    @property
+    def sample_count(self):
+        return sum(c[3] for c in self.chunks)
+
+    @property
+    def duration(self):
+        """記錄涵蓋的秒數"""
+        if not self.chunks:
+            return 0.0
+        return (self.chunks[-1][2] - self.chunks[0][1]) / 1_000_000_000
+
+    def read(self, start=None, end=None, channels=None):
+        """依時間範圍 (秒，自記錄開始起算) 讀取樣本，逐筆產生 (時間秒, 訊號名稱, 數值 tuple)"""
+        start_ns = None if start is None else int(start * 1_000_000_000)
+        end_ns = None if end is None else int(end * 1_000_000_000)
+        wanted = None if channels is None else set(channels)
+
+        # 區塊依時間排序: 以二分搜尋跳到第一個可能包含 start 的區塊
+        first = 0
+        if start_ns is not None:
+            first = bisect.bisect_left([c[2] for c in self.chunks], start_ns)
+
+        for offset, t_first, t_last, _ in self.chunks[first:]:
+            if end_ns is not None and t_first > end_ns:
+                break
+            _, payload = self._read_block(offset)
+            data = zlib.decompress(payload[CHUNK_HEADER.size:])
+            pos = 0
+            while pos < len(data):
+                t, channel_id = SAMPLE_HEADER.unpack_from(data, pos)
+                pos += SAMPLE_HEADER.size
+                name, unpacker, _ = self.channels[channel_id]
+                values = unpacker.unpack_from(data, pos)
+                pos += unpacker.size
+                if start_ns is not None and t < start_ns:
+                    continue
+                if end_ns is not None and t > end_ns:
+                    return
+                if wanted is None or name in wanted:
+                    yield t / 1_000_000_000, name, values
+
+    def export_csv(self, path, start=None, end=None, channels=None):
+        """將指定範圍匯出為 CSV，回傳筆數"""
+        rows = 0
+        with open(path, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow(["時間(s)", "訊號", "數值"])
+            for t, name, values in self.read(start, end, channels):
+                writer.writerow([f"{t:.6f}", name] + list(values))
+                rows += 1
+        return rows
+
+
+def log_recording_info(log, reader):
+    """輸出記錄檔摘要"""
+    size = os.path.getsize(reader.path)
+    log(f"📼 記錄檔: {reader.path}")
+    log(f"   開始時間: {reader.header.get('started_at', '未知')}")
+    log(f"   時間長度: {reader.duration:.3f} s, 樣本數: {reader.sample_count}, 區塊數: {len(reader.chunks)}")
+    log(f"   檔案大小: {size / 1024:.1f} KB" + ("" if reader.indexed else " (無索引，已掃描重建)"))
+    log(f"   訊號: {', '.join(reader.channel_names)}")
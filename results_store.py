@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+測試結果儲存
+每筆測試/套件/性能結果以欄位型式保存在記憶體，超過上限時批次寫入 SQLite，
+匯出 CSV 時直接寫出記錄，不需解析日誌
+"""
+
+import csv
+import os
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime
+
+# 結果類別
+RESULT_TEST = "預設測試"
+RESULT_SUITE = "測試套件"
+RESULT_CUSTOM = "自定義測試"
+RESULT_PERF = "性能測試"
+
+RESULT_COLUMNS = ("timestamp", "category", "name", "success", "duration_ms", "detail")
+CSV_HEADER = ["時間", "類別", "測試項目", "狀態", "耗時(ms)", "詳細資訊"]
+
+DEFAULT_SPILL_THRESHOLD = 10000  # 記憶體中最多保留的筆數
+
+
+class ResultStore:
+    """欄位式測試結果緩衝區 (超過 spill_threshold 筆時寫入 SQLite)
+
+    spill_path 省略時於第一次寫出時建立暫存檔，close() 時刪除。
+    """
+
+    def __init__(self, spill_path=None, spill_threshold=DEFAULT_SPILL_THRESHOLD):
+        self.spill_path = spill_path
+        self.spill_threshold = spill_threshold
+        self.columns = {name: [] for name in RESULT_COLUMNS}
+        self.spilled = 0
+        self._db = None
+        self._temp_path = None
+        self._lock = threading.Lock()  # GUI 主執行緒與測試執行緒可能同時寫入
+
+    def __len__(self):
+        return self.spilled + len(self.columns["timestamp"])
+
+    def add(self, category, name, success, duration_ms=None, detail=""):
+        """新增一筆結果"""
+        with self._lock:
+            self.columns["timestamp"].append(datetime.now().timestamp())
+            self.columns["category"].append(category)
+            self.columns["name"].append(name)
+            self.columns["success"].append(bool(success))
+            self.columns["duration_ms"].append(duration_ms)
+            self.columns["detail"].append(detail)
+            if len(self.columns["timestamp"]) >= self.spill_threshold:
+                self._spill()
+
+    def _connect(self):
+        """開啟 SQLite (首次寫出時建立)"""
+        if self._db is None:
+            path = self.spill_path
+            if path is None:
+                fd, path = tempfile.mkstemp(prefix="tm_results_", suffix=".sqlite3")
+                os.close(fd)
+                self._temp_path = path
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results (timestamp REAL, category TEXT, name TEXT, "
+                "success INTEGER, duration_ms REAL, detail TEXT)"
+            )
+            self.spilled = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return self._db
+
+    def _spill(self):
+        """將記憶體中的結果批次寫入 SQLite"""
+        db = self._connect()
+        rows = list(zip(*(self.columns[name] for name in RESULT_COLUMNS)))
+        with db:
+            db.executemany("INSERT INTO results VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self.spilled += len(rows)
+        for values in self.columns.values():
+            values.clear()
+
+    def records(self):
+        """依時間順序產生所有結果 (tuple，欄位同 RESULT_COLUMNS)"""
+        with self._lock:
+            buffered = list(zip(*(self.columns[name] for name in RESULT_COLUMNS)))
+            if self._db is not None:
+                spilled = self._db.execute("SELECT * FROM results ORDER BY rowid").fetchall()
+            else:
+                spilled = []
+        for row in spilled:
+            yield row[:3] + (bool(row[3]),) + row[4:]
+        yield from buffered
+
+    def summary(self):
+        """回傳 {類別: (成功數, 失敗數)}"""
+        counts = {}
+        for _, category, _, success, _, _ in self.records():
+            passed, failed = counts.get(category, (0, 0))
+            counts[category] = (passed + 1, failed) if success else (passed, failed + 1)
+        return counts
+
+    def export_csv(self, path):
+        """匯出所有結果為 CSV，回傳筆數"""
+        count = 0
+        with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_HEADER)
+            for timestamp, category, name, success, duration_ms, detail in self.records():
+                writer.writerow([
+                    datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+                    category,
+                    name,
+                    "成功" if success else "失敗",
+                    "" if duration_ms is None else f"{duration_ms:.3f}",
+                    detail,
+                ])
+                count += 1
+        return count
+
+    def clear(self):
+        """清除所有結果"""
+        with self._lock:
+            for values in self.columns.values():
+                values.clear()
+            if self._db is not None:
+                with self._db:
+                    self._db.execute("DELETE FROM results")
+            self.spilled = 0
+
+    def close(self):
+        """關閉 SQLite 並刪除暫存檔"""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        if self._temp_path is not None:
+            os.remove(self._temp_path)
+            self._temp_path = None
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多連線擴展測試
+對同一台控制器同時開啟 K 個連線 (每個連線一個執行緒)，
+觀察總吞吐量、各連線延遲分布與連線被拒絕的情形
+"""
+
+import threading
+import time
+
+from modbus_engine import ModbusTestEngine, PERF_WORKLOADS, check_perf_concurrency
+from bulk_io import written_ranges, save_ranges, restore_ranges
+from perf_stats import PerfStats
+
+DEFAULT_SESSION_COUNTS = (1, 2, 4, 8, 16)
+DEFAULT_SESSION_MAX_DOWNTIME = 10.0  # 各連線中斷時最多等待重新連線的秒數 (避免單一連線卡住整個測試)
+
+
+def _silent_log(message, level="INFO"):
+    """各連線不輸出日誌，結果統一由呼叫端輸出"""
+
+
+def run_sessions(ip, port, test_type, sessions, test_count, interval_ms=0, timeout=3,
+                 should_continue=None, restore=True, max_downtime=DEFAULT_SESSION_MAX_DOWNTIME):
+    """同時開啟 sessions 個連線，各自執行 test_count 次工作負載，回傳結果 dict
+
+    所有連線建立後才同時開始測試；無法連線者計為被拒絕。
+    連線中斷超過 max_downtime 秒未恢復的連線提前結束。
+    restore 為 True 時先備份工作負載會寫入的位址，所有連線結束後寫回。
+    """
+    check_perf_concurrency(test_type, sessions)
+    ranges = written_ranges(PERF_WORKLOADS[test_type]) if restore else []
+    if not ranges:
+        return _run_sessions(ip, port, test_type, sessions, test_count, interval_ms, timeout, should_continue,
+                             max_downtime)
+
+    # 備份與寫回各用一個短連線，測試期間不佔用控制器的連線數
+    keeper = ModbusTestEngine(log=_silent_log)
+    if not keeper.connect(ip, port, timeout=timeout):
+        raise ConnectionError(f"無法連線到 {ip}:{port}")
+    try:
+        saved, error = save_ranges(keeper.client, ranges)
+    finally:
+        keeper.disconnect()
+    if error:
+        raise ConnectionError(f"無法備份寫入範圍的原始內容: {error}")
+
+    result = _run_sessions(ip, port, test_type, sessions, test_count, interval_ms, timeout, should_continue,
+                           max_downtime)
+    if not keeper.connect(ip, port, timeout=timeout):
+        result["restore_error"] = f"無法連線到 {ip}:{port}"
+        return result
+    try:
+        result["restore_error"] = restore_ranges(keeper.client, saved)
+    finally:
+        keeper.disconnect()
+    return result
+
+
+def _run_sessions(ip, port, test_type, sessions, test_count, interval_ms, timeout, should_continue,
+                             max_downtime):
+    rows = [{
+        "session": i + 1,
+        "connected": False,
+        "connect_ms": None,
+        "stats": None,
+        "perf_stats": PerfStats(retain_samples=False),
+    } for i in range(sessions)]
+    timing = {}
+    barrier = threading.Barrier(sessions, action=lambda: timing.setdefault("start", time.perf_counter()))
+
+    def session(row):
+        engine = ModbusTestEngine(log=_silent_log)
+        start_time = time.perf_counter()
+        try:
+            row["connected"] = engine.connect(ip, port, timeout=timeout)
+        except Exception:
+            row["connected"] = False
+        row["connect_ms"] = (time.perf_counter() - start_time) * 1000
+        barrier.wait()
+        if not row["connected"]:
+            return
+        try:
+            engine.run_performance_test(
+                test_type, test_count, interval_ms,
+                stats=row["perf_stats"], should_continue=should_continue, max_downtime=max_downtime,
+                restore=False
+            )
+        finally:
+            engine.disconnect()
+        row["finished"] = time.perf_counter()
+
+    threads = [threading.Thread(target=session, args=(row,), daemon=True) for row in rows]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    total = PerfStats(retain_samples=False)
+    for row in rows:
+        total.merge(row["perf_stats"])
+        row["stats"] = row.pop("perf_stats").summary()
+
+    finished = [row.pop("finished") for row in rows if "finished" in row]
+    elapsed = max(finished) - timing["start"] if finished else 0.0
+    connected = sum(1 for row in rows if row["connected"])
+    return {
+        "test_type": test_type,
+        "sessions": sessions,
+        "connected": connected,
+        "refused": sessions - connected,
+        "elapsed": elapsed,
+        "throughput": total.count / elapsed if elapsed > 0 else 0.0,
+        "stats": total.summary(),
+        "rows": rows,
+    }
+
+
+def run_session_ramp(ip, port, test_type, session_counts=DEFAULT_SESSION_COUNTS, test_count=100,
+                     interval_ms=0, timeout=3, restore=True, max_downtime=DEFAULT_SESSION_MAX_DOWNTIME):
+    """依序以遞增連線數測試，回傳各連線數結果"""
+    check_perf_concurrency(test_type, max(session_counts))
+    return [run_sessions(ip, port, test_type, k, test_count, interval_ms, timeout, restore=restore,
+                         max_downtime=max_downtime)
+            for k in session_counts]
+
+
+def log_sessions(log, result):
+    """輸出單次多連線測試的各連線延遲表"""
+    log(f"🔗 {result['sessions']} 個連線: 已連線 {result['connected']}, 被拒絕 {result['refused']}")
+    log("   連線 | 連線(ms) |   次數 | 平均(ms) | P50(ms) | P99(ms) | 最大(ms) | 成功率")
+    for row in result["rows"]:
+        stats = row["stats"]
+        if not row["connected"] or not stats:
+            log(f"   {row['session']:>4} | {row['connect_ms']:>8.1f} | 連線被拒絕", "ERROR")
+            continue
+        log(f"   {row['session']:>4} | {row['connect_ms']:>8.1f} | {stats['count']:>6} | {stats['avg']:>8.2f} | "
+            f"{stats['p50']:>7.2f} | {stats['p99']:>7.2f} | {stats['max']:>8.2f} | {stats['success_rate']:>5.1f}%",
+            "INFO" if stats["success_rate"] == 100 else "WARNING")
+
+
+def log_session_ramp(log, test_type, results):
+    """輸出總吞吐量與延遲對連線數的結果表"""
+    log(f"📊 多連線擴展測試結果: {test_type}")
+    errors = [result["restore_error"] for result in results if result.get("restore_error")]
+    if errors:
+        log(f"⚠️ 寫回原始內容失敗: {errors[0]}", "WARNING")
+    log("   連線數 | 已連線 | 被拒絕 | 吞吐量(req/s) | P50(ms) | P99(ms) | 最差連線P99(ms) | 成功率")
+    for result in results:
+        stats = result["stats"]
+        if not stats:
+            log(f"   {result['sessions']:>6} | {result['connected']:>6} | {result['refused']:>6} | 無結果", "ERROR")
+            continue
+        worst_p99 = max(row["stats"]["p99"] for row in result["rows"] if row["stats"])
+        level = "WARNING" if result["refused"] or stats["success_rate"] < 100 else "INFO"
+        log(f"   {result['sessions']:>6} | {result['connected']:>6} | {result['refused']:>6} | "
+            f"{result['throughput']:>13.1f} | {stats['p50']:>7.2f} | {stats['p99']:>7.2f} | "
+            f"{worst_p99:>15.2f} | {stats['success_rate']:>5.1f}%", level)
+
+    refused = [r for r in results if r["refused"]]
+    if refused:
+        log(f"⚠️ 自 {refused[0]['sessions']} 個連線起出現連線被拒絕 "
+            f"(最多同時接受 {max(r['connected'] for r in results)} 個連線)", "WARNING")
+    # 只在全部成功的連線數中挑選，避免把大多失敗的連線數報告為最佳
+    passed = [r for r in results if r["stats"] and r["stats"]["success_rate"] == 100 and r["throughput"]]
+    if passed:
+        best = max(passed, key=lambda r: r["throughput"])
+        log(f"🚀 最高總吞吐量: {best['throughput']:.1f} req/s ({best['sessions']} 個連線)", "SUCCESS")
+    elif any(r["stats"] for r in results):
+        log("⚠️ 沒有任何連線數全部成功，無法判斷最高總吞吐量", "WARNING")
+    log("─" * 50)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模擬器精簡資料區塊 (分頁 + 寫入時複製)
+以固定大小的 array 分頁存放數值，全為 0 的分頁不配置記憶體；
+從範本複製時只複製分頁參考，某一頁第一次被寫入時才複製該頁，
+讓大量模擬裝置共用 TM 位址表中少數有資料的區段 (0-15、7001-7216、9000-9999)
+"""
+
+import argparse
+import gc
+import tracemalloc
+from array import array
+
+from pymodbus.constants import ExcCodes
+from pymodbus.datastore import ModbusSequentialDataBlock, ModbusDeviceContext
+from pymodbus.datastore.store import BaseModbusDataBlock
+
+PAGE_SIZE = 256
+REGISTER_TYPE = "H"  # 16-bit register
+BIT_TYPE = "B"  # 每個位元一個 byte (Coils/DI)
+
+
+class PagedDataBlock(BaseModbusDataBlock):
+    """分頁、寫入時複製的 Modbus 資料區塊 (介面與 ModbusSequentialDataBlock 相容)
+
+    pages[i] 為 None 表示該頁全為 0；owned[i] 為 0 表示該頁與其他區塊共用，
+    寫入前必須先複製。
+    """
+
+    def __init__(self, address, size, typecode=REGISTER_TYPE):
+        self.address = address
+        self.size = size
+        self.typecode = typecode
+        self.default_value = 0
+        self.pages = [None] * ((size + PAGE_SIZE - 1) // PAGE_SIZE)
+        self.owned = bytearray(len(self.pages))
+        self._zero_page = array(typecode, bytes(PAGE_SIZE * array(typecode).itemsize))
+
+    @classmethod
+    def from_values(cls, address, values, typecode=REGISTER_TYPE):
+        """由完整數值列表建立 (只配置含非零值的分頁)"""
+        block = cls(address, len(values), typecode)
+        for i in range(len(block.pages)):
+            chunk = values[i * PAGE_SIZE:(i + 1) * PAGE_SIZE]
+            if any(chunk):
+                block.setValues(address + i * PAGE_SIZE, list(chunk))
+        return block
+
+    def clone(self):
+        """寫入時複製的副本 (兩邊之後寫入共用分頁時都會先複製)"""
+        block = PagedDataBlock(self.address, self.size, self.typecode)
+        block.pages = list(self.pages)
+        block._zero_page = self._zero_page
+        self.owned = bytearray(len(self.pages))
+        return block
+
+    @property
+    def values(self):
+        """完整數值列表 (相容用，會配置整個區塊)"""
+        return self.getValues(self.address, self.size)
+
+    def reset(self):
+        self.pages = [None] * len(self.pages)
+        self.owned = bytearray(len(self.pages))
+
+    def getValues(self, address, count=1):
+        start = address - self.address
+        if start < 0 or count < 0 or start + count > self.size:
+            return ExcCodes.ILLEGAL_ADDRESS
+        index, offset = divmod(start, PAGE_SIZE)
+        if offset + count <= PAGE_SIZE:
+            page = self.pages[index] or self._zero_page
+            return page[offset:offset + count].tolist()
+        result = []
+        while count > 0:
+            n = min(count, PAGE_SIZE - offset)
+            page = self.pages[index] or self._zero_page
+            result.extend(page[offset:offset + n])
+            count -= n
+            index += 1
+            offset = 0
+        return result
+
+    def setValues(self, address, values):
+        if not isinstance(values, list):
+            values = [values]
+        start = address - self.address
+        if start < 0 or start + len(values) > self.size:
+            return ExcCodes.ILLEGAL_ADDRESS
+        try:
+            data = array(self.typecode, values)
+        except (OverflowError, TypeError):
+            return ExcCodes.ILLEGAL_VALUE
+        index, offset = divmod(start, PAGE_SIZE)
+        done = 0
+        while done < len(data):
+            n = min(len(data) - done, PAGE_SIZE - offset)
+            self._writable_page(index)[offset:offset + n] = data[done:done + n]
+            done += n
+            index += 1
+            offset = 0
+        return None
+
+    def _writable_page(self, index):
+        if not self.owned[index]:
+            page = self.pages[index]
+            self.pages[index] = array(self.typecode, page if page is not None else self._zero_page)
+            self.owned[index] = 1
+        return self.pages[index]
+
+    def page_count(self):
+        """(已配置分頁數, 本區塊獨有分頁數)"""
+        return sum(page is not None for page in self.pages), sum(self.owned)
+
+
+def measure_devices(factory, count):
+    """建立 count 台裝置，回傳每台裝置平均配置的記憶體 (bytes)"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    devices = [factory() for _ in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del devices
+    return (after - before) / count
+
+
+def run_memory_benchmark(count=200, writes=0):
+    """比較每台模擬裝置的記憶體: 整數列表 / 各自的精簡區塊 / 由範本寫入時複製
+
+    writes > 0 時每台裝置建立後寫入 User Define 區 writes 個 register (觸發分頁複製)。
+    """
+    from simulator import create_tm_robot_context, DATA_SIZE  # simulator 本身會匯入此模組
+
+    def touch(device):
+        if writes:
+            device.setValues(16, 9000, list(range(writes)))
+        return device
+
+    def list_device():
+        # 每台裝置各自 4 個完整的整數列表 (原本的資料結構)
+        template_values = {key: block.values for key, block in template.store.items()}
+        return touch(ModbusDeviceContext(**{
+            name: ModbusSequentialDataBlock(1, template_values[key])
+            for name, key in (("di", "d"), ("co", "c"), ("hr", "h"), ("ir", "i"))
+        }))
+
+    template = create_tm_robot_context()
+    results = {
+        "list": measure_devices(list_device, count),
+        "compact": measure_devices(lambda: touch(create_tm_robot_context()), count),
+        "template": measure_devices(lambda: touch(create_tm_robot_context(template, share_inputs=False)), count),
+        "template_shared_inputs": measure_devices(lambda: touch(create_tm_robot_context(template)), count),
+    }
+    return {"devices": count, "writes": writes, "data_size": DATA_SIZE, "bytes_per_device": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模擬裝置記憶體用量測試")
+    parser.add_argument("--devices", type=int, default=200, help="建立的裝置數")
+    parser.add_argument("--writes", type=int, default=0, help="每台裝置寫入 User Define 區的 register 數")
+    args = parser.parse_args()
+
+    result = run_memory_benchmark(args.devices, args.writes)
+    labels = {
+        "list": "整數列表 (每台各自一份)",
+        "compact": "精簡分頁區塊 (每台各自一份)",
+        "template": "範本寫入時複製",
+        "template_shared_inputs": "範本寫入時複製 + 共用 DI/IR",
+    }
+    baseline = result["bytes_per_device"]["list"]
+    print(f"裝置數: {result['devices']}, 每台寫入: {result['writes']} registers")
+    for key, label in labels.items():
+        size = result["bytes_per_device"][key]
+        print(f"   {label:<28} {size / 1024:>9.1f} KB/台  ({baseline / size if size else 0:>6.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模擬器農場 (Fleet 規模測試)
+單一行程、單一事件迴圈模擬多台 TM 控制器 (不同埠及/或 Unit ID)，
+各裝置以同一個範本建立 (唯讀區塊共用)，並定期輸出彙總請求計數供性能測試比對
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+from pymodbus.datastore import ModbusServerContext
+
+from simulator import (
+    ModbusSimServer, LatencyModel, create_tm_robot_context, merge_counters, load_latency_profile,
+    DEFAULT_LATENCY_PROFILE, NO_LATENCY_PROFILE
+)
+from sim_faults import FaultModel
+from sim_metrics import start_metrics_server, dump_metrics, write_metrics
+from sim_motion import MotionSimulator, DEFAULT_TICK_RATE
+
+log = logging.getLogger(__name__)
+
+DEFAULT_FARM_CONFIG = "sim_farm.json"
+DEFAULT_STATS_INTERVAL = 10.0
+
+
+def expand_controllers(entries):
+    """將設定中的控制器項目展開為 [{"name", "port", "units"}]
+
+    項目可為 {"name", "port", "units"} 或以 "ports": [起始, 結束] 指定連續埠範圍；
+    units 預設 [1]。
+    """
+    controllers = []
+    for entry in entries:
+        units = [int(u) for u in entry.get("units", [1])]
+        if not units or any(not 0 <= u <= 255 for u in units):
+            raise ValueError(f"Unit ID 必須介於 0-255: {units}")
+        if "ports" in entry:
+            first, last = (int(p) for p in entry["ports"])
+            name = entry.get("name", "sim")
+            controllers.extend({"name": f"{name}-{port}", "port": port, "units": units}
+                               for port in range(first, last + 1))
+        else:
+            port = int(entry["port"])
+            controllers.append({"name": entry.get("name", f"sim-{port}"), "port": port, "units": units})
+
+    ports = [c["port"] for c in controllers]
+    duplicated = sorted({p for p in ports if ports.count(p) > 1})
+    if duplicated:
+        raise ValueError(f"重複的埠: {duplicated}")
+    return controllers
+
+
+def load_farm_config(path):
+    """讀取農場設定檔 (JSON)"""
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    config["controllers"] = expand_controllers(config.get("controllers", []))
+    latency = config.get("latency")
+    if latency == "none":
+        config["latency"] = NO_LATENCY_PROFILE
+    elif isinstance(latency, str):
+        config["latency"] = load_latency_profile(latency)
+    elif latency:
+        FaultModel(latency.get("faults"))  # 驗證故障規則
+    if not config["controllers"]:
+        raise ValueError("設定檔沒有任何控制器 (controllers)")
+    return config
+
+
+class SimFarm:
+    """在同一事件迴圈中執行多個模擬控制器"""
+
+    def __init__(self, config):
+        self.host = config.get("host", "127.0.0.1")
+        self.latency_profile = config.get("latency") or DEFAULT_LATENCY_PROFILE
+        seed = self.latency_profile.get("seed")
+        self.controllers = config["controllers"]
+        motion = config.get("motion")
+        self.distinct_motion = bool(motion and motion.get("distinct", False))
+
+        # 所有裝置以同一個範本建立；座標各自運動時 IR 不能共用
+        self.template = create_tm_robot_context()
+        self.servers = []
+        self.devices = []
+        for index, controller in enumerate(self.controllers):
+            devices = {
+                unit: create_tm_robot_context(self.template, share_inputs=not self.distinct_motion)
+                for unit in controller["units"]
+            }
+            self.devices.extend(devices.values())
+            context = ModbusServerContext(devices=devices, single=False)
+            # 各控制器使用不同但可重現的亂數序列
+            server_seed = None if seed is None else seed + index
+            self.servers.append(ModbusSimServer(context, LatencyModel(self.latency_profile, server_seed),
+                                                FaultModel(self.latency_profile.get("faults"), server_seed)))
+
+        self.motion = None
+        if motion:
+            # 共用 DI/IR 時只需更新範本
+            targets = self.devices if self.distinct_motion else [self.template]
+            self.motion = MotionSimulator(targets, motion.get("tick_rate", DEFAULT_TICK_RATE),
+                                          motion.get("status_scale", 1.0), self.distinct_motion)
+        self.listeners = []
+        self.started = None
+
+    async def start(self):
+        """開始監聽所有控制器的埠"""
+        for controller, server in zip(self.controllers, self.servers):
+            self.listeners.append(await server.start(self.host, controller["port"]))
+        self.started = time.monotonic()
+
+    def close(self):
+        for listener in self.listeners:
+            listener.close()
+
+    def endpoints(self):
+        """Fleet 端點列表 (可直接作為 testkit_cli.py fleet --file 的輸入)"""
+        return [
+            {"name": f"{c['name']}/{unit}" if len(c["units"]) > 1 else c["name"],
+             "ip": self.host, "port": c["port"], "device_id": unit}
+            for c in self.controllers for unit in c["units"]
+        ]
+
+    def stats(self):
+        """彙總與各控制器的請求計數"""
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        per_controller = []
+        for controller, server in zip(self.controllers, self.servers):
+            per_controller.append(dict(server.counters, name=controller["name"], port=controller["port"],
+                                       connections=server.connections))
+        total = merge_counters(server.counters for server in self.servers)
+        total["connections"] = sum(server.connections for server in self.servers)
+        total["controllers"] = len(self.controllers)
+        total["devices"] = len(self.devices)
+        total["elapsed"] = elapsed
+        total["requests_per_s"] = total["requests"] / elapsed if elapsed > 0 else 0.0
+        if self.motion:
+            total["motion_ticks"] = self.motion.ticks
+            total["motion_overruns"] = self.motion.overruns
+        return {"total": total, "controllers": per_controller}
+
+    async def report_loop(self, interval, path=None):
+        """定期輸出彙總計數 (並寫入 path)"""
+        last_requests = 0
+        while True:
+            await asyncio.sleep(interval)
+            stats = self.stats()
+            total = stats["total"]
+            log.info("farm: %d controllers, %d connections, %d requests (%.1f req/s), %d exceptions, "
+                     "in %.1f KB, out %.1f KB", total["controllers"], total["connections"], total["requests"],
+                     (total["requests"] - last_requests) / interval, total["exceptions"],
+                     total["bytes_in"] / 1024, total["bytes_out"] / 1024)
+            if total["injected_exceptions"] or total["dropped"] or total["resets"]:
+                log.info("farm faults: %d injected exceptions, %d dropped, %d resets",
+                         total["injected_exceptions"], total["dropped"], total["resets"])
+            last_requests = total["requests"]
+            if path:
+                write_stats(path, stats)
+
+
+def write_stats(path, stats):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(stats, f, ensure_ascii=False, indent=2)
+
+
+async def run_farm(config, fleet_file=None, stats_file=None, metrics_port=None, metrics_file=None):
+    """啟動模擬器農場直到被中斷"""
+    farm = SimFarm(config)
+    await farm.start()
+    metrics_port = metrics_port or config.get("metrics_port")
+    servers = [(c["port"], server) for c, server in zip(farm.controllers, farm.servers)]
+    if metrics_port:
+        farm.listeners.append(await start_metrics_server(farm.host, metrics_port, servers))
+
+    ports = [c["port"] for c in farm.controllers]
+    print("=" * 60)
+    print("TM Robot Modbus TCP Simulator Farm")
+    print("=" * 60)
+    print(f"Controllers: {len(farm.controllers)} on {farm.host}:{min(ports)}-{max(ports)}")
+    print(f"Devices: {len(farm.devices)} (unit IDs per controller: {sorted({len(c['units']) for c in farm.controllers})})")
+    print(f"Latency profile: {json.dumps({k: v for k, v in farm.latency_profile.items() if k != 'faults'})}")
+    if farm.latency_profile.get("faults"):
+        print(f"Fault rules: {len(farm.latency_profile['faults'])}")
+    if farm.motion:
+        print(f"Motion: {farm.motion.tick_rate:g} Hz, {'distinct' if farm.distinct_motion else 'shared'} trajectories")
+    if fleet_file:
+        with open(fleet_file, "w", encoding="utf-8") as f:
+            json.dump({"fleet": farm.endpoints()}, f, ensure_ascii=False, indent=2)
+        print(f"Fleet endpoints: {fleet_file}")
+    print("\nFarm is running... (Press Ctrl+C to stop)")
+    print("=" * 60)
+
+    tasks = [asyncio.create_task(farm.report_loop(config.get("stats_interval", DEFAULT_STATS_INTERVAL), stats_file))]
+    if farm.motion:
+        tasks.append(asyncio.create_task(farm.motion.run()))
+    if metrics_file:
+        tasks.append(asyncio.create_task(dump_metrics(metrics_file, servers, config.get("stats_interval", DEFAULT_STATS_INTERVAL))))
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        farm.close()
+        if stats_file:
+            write_stats(stats_file, farm.stats())
+        if metrics_file:
+            write_metrics(metrics_file, servers)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="TM Robot Modbus TCP 模擬器農場")
+    parser.add_argument("config", nargs="?", default=DEFAULT_FARM_CONFIG, help="農場設定檔 (JSON)")
+    parser.add_argument("--fleet-file", help="輸出 Fleet 端點檔 (供 testkit_cli.py fleet --file 使用)")
+    parser.add_argument("--stats-file", help="定期寫入彙總請求計數 (JSON)")
+    parser.add_argument("--metrics-port", type=int, help="量測 HTTP 端點埠 (各控制器、用戶端、功能碼的請求量測)")
+    parser.add_argument("--metrics-file", help="定期寫入各控制器、用戶端、功能碼的請求量測 (JSON)")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    try:
+        farm_config = load_farm_config(args.config)
+    except (OSError, ValueError, KeyError) as e:
+        raise SystemExit(f"載入農場設定失敗: {e}")
+    try:
+        asyncio.run(run_farm(farm_config, args.fleet_file, args.stats_file, args.metrics_port,
+                             args.metrics_file))
+    except KeyboardInterrupt:
+        pass
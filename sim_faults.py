@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模擬器故障注入
+依功能碼、位址範圍與 Unit ID 比對請求，以機率或固定間隔觸發:
+例外回應、丟棄回應 (用戶端逾時)、重置連線、額外延遲 (含長尾分布)、
+頻寬限制與週期性停頓；所有亂數由種子決定，可重現同一組故障序列
+"""
+
+import random
+import struct
+from collections import namedtuple
+
+# 規則動作 (每條規則只能有一個)
+ACTIONS = ("exception", "drop", "reset", "delay", "bandwidth", "stall")
+RULE_KEYS = {"name", "functions", "address", "units", "probability", "every"} | set(ACTIONS)
+
+# 單一請求的故障決定: delay 為額外延遲 (秒)，bandwidth 為每連線 bytes/s (0 表示不限)
+Fault = namedtuple("Fault", "exception drop reset delay bandwidth")
+NO_FAULT = Fault(0, False, False, 0.0, 0)
+
+
+def make_distribution(spec):
+    """將延遲分布設定 (ms) 轉換為取樣函數 rng → 秒
+
+    ["fixed", ms] / ["uniform", 最小, 最大] / ["normal", 平均, 標準差] /
+    ["lognormal", 中位數, sigma] / ["exponential", 平均] / ["pareto", 最小值, alpha]
+    """
+    kind, *args = spec
+    if kind == "fixed":
+        value = args[0] / 1000
+        return lambda rng: value
+    if kind == "uniform":
+        low, high = args
+        return lambda rng: rng.uniform(low, high) / 1000
+    if kind == "normal":
+        mean, std = args
+        return lambda rng: max(0.0, rng.gauss(mean, std)) / 1000
+    if kind == "lognormal":
+        median, sigma = args
+        return lambda rng: median * rng.lognormvariate(0, sigma) / 1000
+    if kind == "exponential":
+        mean, = args
+        return lambda rng: rng.expovariate(1 / mean) / 1000 if mean > 0 else 0.0
+    if kind == "pareto":
+        scale, alpha = args
+        return lambda rng: scale * rng.paretovariate(alpha) / 1000
+    raise ValueError(f"不支援的延遲分布: {kind}")
+
+
+def request_range(pdu):
+    """請求 PDU 的 (起始位址, 數量)；無法解析時回傳 None"""
+    try:
+        if pdu[0] in (5, 6):
+            return struct.unpack(">H", pdu[1:3])[0], 1
+        return struct.unpack(">HH", pdu[1:5])
+    except struct.error:
+        return None
+
+
+class FaultRule:
+    """一條故障規則 (設定單位為 ms)
+
+    比對: functions (功能碼列表)、address ([起始, 結束]，與請求範圍重疊即符合)、units；
+    觸發: probability (0-1，預設 1) 或 every (每 N 個符合的請求一次)；
+    動作: exception (不執行請求，回傳例外碼)、drop (執行請求但不回應)、
+    reset (不執行請求並中斷連線)、delay (額外延遲分布)、bandwidth (每連線 bytes/s)、
+    stall ([週期, 持續] ms: 每個週期開頭的一段時間內回應全部延後到停頓結束)。
+    同一請求觸發多個動作時延遲相加，reset 優先於 drop，drop 優先於 exception。
+    """
+
+    def __init__(self, spec):
+        unknown = set(spec) - RULE_KEYS
+        if unknown:
+            raise ValueError(f"未知的故障規則欄位: {sorted(unknown)}")
+        actions = [key for key in ACTIONS if key in spec]
+        if len(actions) != 1:
+            raise ValueError(f"每條故障規則必須剛好有一個動作 {ACTIONS}: {spec}")
+        self.action = actions[0]
+        self.value = spec[self.action]
+        self.name = spec.get("name", self.action)
+        self.functions = set(spec["functions"]) if "functions" in spec else None
+        self.address = tuple(spec["address"]) if "address" in spec else None
+        self.units = set(spec["units"]) if "units" in spec else None
+        self.probability = float(spec.get("probability", 1.0))
+        self.every = int(spec.get("every", 0))
+        self.matched = 0
+        self.triggered = 0
+
+        if self.address is not None and (len(self.address) != 2 or self.address[0] > self.address[1]):
+            raise ValueError(f"address 必須為 [起始, 結束]: {spec['address']}")
+        if not 0 <= self.probability <= 1:
+            raise ValueError(f"probability 必須介於 0-1: {self.probability}")
+        if self.action == "exception" and not 1 <= int(self.value) <= 0x0B:
+            raise ValueError(f"例外碼必須介於 1-11: {self.value}")
+        if self.action == "delay":
+            self.distribution = make_distribution(self.value)
+        if self.action == "bandwidth" and self.value <= 0:
+            raise ValueError(f"bandwidth 必須大於 0 (bytes/s): {self.value}")
+        if self.action == "stall":
+            period, duration = self.value
+            if not 0 < duration < period:
+                raise ValueError(f"stall 必須為 [週期, 持續] 且持續小於週期 (ms): {self.value}")
+            self.period, self.duration = period / 1000, duration / 1000
+
+    def matches(self, unit_id, function_code, address_range):
+        if self.functions is not None and function_code not in self.functions:
+            return False
+        if self.units is not None and unit_id not in self.units:
+            return False
+        if self.address is not None:
+            if address_range is None:
+                return False
+            start, count = address_range
+            if start > self.address[1] or start + count - 1 < self.address[0]:
+                return False
+        return True
+
+    def fires(self, rng):
+        self.matched += 1
+        if self.every:
+            return self.matched % self.every == 0
+        return self.probability >= 1 or rng.random() < self.probability
+
+
+class FaultModel:
+    """依規則決定每個請求的故障 (同一種子與請求順序產生相同結果)
+
+    停頓以伺服器啟動時間為起點；頻寬限制依連線排程送出時間。
+    """
+
+    def __init__(self, rules=None, seed=None, rng=None):
+        self.rules = [FaultRule(spec) for spec in rules or []]
+        self.rng = rng or random.Random(seed)
+        self.epoch = None
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def evaluate(self, unit_id, pdu, now):
+        """回傳此請求的 Fault (now 為事件迴圈時間，秒)"""
+        if self.epoch is None:
+            self.epoch = now
+        address_range = request_range(pdu)
+        terminal = {}
+        delay = 0.0
+        bandwidth = 0
+        for rule in self.rules:
+            if not rule.matches(unit_id, pdu[0], address_range):
+                continue
+            if rule.action == "stall":
+                rule.matched += 1
+                phase = (now - self.epoch) % rule.period
+                if phase < rule.duration:
+                    rule.triggered += 1
+                    delay = max(delay, rule.duration - phase)
+                continue
+            if not rule.fires(self.rng):
+                continue
+            rule.triggered += 1
+            if rule.action == "delay":
+                delay += rule.distribution(self.rng)
+            elif rule.action == "bandwidth":
+                bandwidth = min(bandwidth, rule.value) if bandwidth else rule.value
+            else:
+                terminal.setdefault(rule.action, rule.value)
+        if not terminal and not delay and not bandwidth:
+            return NO_FAULT
+        return Fault(
+            exception=int(terminal.get("exception", 0)),
+            drop="drop" in terminal,
+            reset="reset" in terminal,
+            delay=delay,
+            bandwidth=bandwidth,
+        )
+
+    def summary(self):
+        """各規則的符合/觸發次數"""
+        return [{"name": rule.name, "action": rule.action, "matched": rule.matched, "triggered": rule.triggered}
+                for rule in self.rules]
+
+
+def throttle(state, now, ready_at, size, bandwidth):
+    """依連線頻寬排程送出時間 (state 為每連線的 dict)，回傳送出時間"""
+    start = max(ready_at, state.get("busy_until", now))
+    state["busy_until"] = start + size / bandwidth
+    return state["busy_until"]
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模擬器請求量測
+依用戶端 (ip:port) 與功能碼記錄請求數、流量、服務時間 (執行請求)、注入延遲
+與排隊延遲 (回應預定送出到實際交給傳輸層的落後，反映事件迴圈壅塞與背壓)，
+並以本機 HTTP 端點輸出 Prometheus 文字格式 (/metrics) 或 JSON (/metrics.json)，
+也可定期寫入 JSON 檔
+"""
+
+import asyncio
+import json
+import logging
+
+log = logging.getLogger(__name__)
+
+MAX_CLOSED_CLIENTS = 256  # 保留的已關閉連線數，較舊的併入 client="closed"
+CLOSED_CLIENT = "closed"
+DEFAULT_DUMP_INTERVAL = 10.0
+
+# 每個 (用戶端, 功能碼) 的統計欄位 (以 list 儲存以降低每個請求的負擔)
+REQUESTS, RESPONSES, BYTES_IN, BYTES_OUT, SERVICE_NS, DELAY_NS, QUEUE_NS, QUEUE_MAX_NS = range(8)
+FIELD_NAMES = ("requests", "responses", "bytes_in", "bytes_out", "service_ns", "delay_ns", "queue_ns", "queue_max_ns")
+
+
+def new_entry():
+    return [0] * len(FIELD_NAMES)
+
+
+def merge_entry(total, entry):
+    for i, value in enumerate(entry):
+        total[i] = max(total[i], value) if i == QUEUE_MAX_NS else total[i] + value
+
+
+class ServerMetrics:
+    """單一伺服器 (埠) 的請求量測"""
+
+    def __init__(self):
+        self.clients = {}  # 用戶端 → {功能碼: entry}
+        self.open_clients = set()
+        self.closed_clients = []
+
+    def connect(self, client):
+        """新連線，回傳該用戶端的功能碼統計 dict"""
+        self.open_clients.add(client)
+        return self.clients.setdefault(client, {})
+
+    def disconnect(self, client):
+        """連線關閉；已關閉連線超過上限時最舊的統計併入 CLOSED_CLIENT"""
+        self.open_clients.discard(client)
+        self.closed_clients.append(client)
+        if len(self.closed_clients) > MAX_CLOSED_CLIENTS:
+            oldest = self.closed_clients.pop(0)
+            closed = self.clients.setdefault(CLOSED_CLIENT, {})
+            for function_code, entry in self.clients.pop(oldest, {}).items():
+                merge_entry(closed.setdefault(function_code, new_entry()), entry)
+
+    @staticmethod
+    def record(functions, function_code, bytes_in, service_ns):
+        """記錄一個已執行的請求，回傳其 entry (送出回應時再呼叫 sent)"""
+        entry = functions.get(function_code)
+        if entry is None:
+            entry = functions[function_code] = new_entry()
+        entry[REQUESTS] += 1
+        entry[BYTES_IN] += bytes_in
+        entry[SERVICE_NS] += service_ns
+        return entry
+
+    @staticmethod
+    def sent(entry, bytes_out, delay_ns, queue_ns):
+        """記錄一個已送出的回應"""
+        entry[RESPONSES] += 1
+        entry[BYTES_OUT] += bytes_out
+        entry[DELAY_NS] += delay_ns
+        entry[QUEUE_NS] += queue_ns
+        if queue_ns > entry[QUEUE_MAX_NS]:
+            entry[QUEUE_MAX_NS] = queue_ns
+
+    def snapshot(self):
+        """[{"client", "function", 各欄位}]"""
+        rows = []
+        for client, functions in list(self.clients.items()):
+            for function_code, entry in sorted(functions.items()):
+                row = dict(zip(FIELD_NAMES, entry), client=client, function=function_code)
+                row["open"] = client in self.open_clients
+                rows.append(row)
+        return rows
+
+
+def _labels(**labels):
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+
+def render_prometheus(servers):
+    """servers 為 [(埠, ModbusSimServer)]，回傳 Prometheus 文字格式"""
+    samples = {}  # 指標名稱 → [(labels, 值)]
+
+    def add(name, labels, value):
+        samples.setdefault(name, []).append((labels, value))
+
+    for port, server in servers:
+        counters = server.counters
+        add("modbus_sim_connections", _labels(port=port), server.connections)
+        for key in ("connections", "exceptions", "injected_exceptions", "dropped", "resets"):
+            add(f"modbus_sim_{key}_total", _labels(port=port), counters[key if key != "connections" else "connections_total"])
+        for row in server.metrics.snapshot():
+            labels = _labels(port=port, client=row["client"], function=row["function"])
+            add("modbus_sim_requests_total", labels, row["requests"])
+            add("modbus_sim_responses_total", labels, row["responses"])
+            add("modbus_sim_received_bytes_total", labels, row["bytes_in"])
+            add("modbus_sim_sent_bytes_total", labels, row["bytes_out"])
+            add("modbus_sim_service_seconds_total", labels, row["service_ns"] / 1e9)
+            add("modbus_sim_injected_delay_seconds_total", labels, row["delay_ns"] / 1e9)
+            add("modbus_sim_queue_seconds_total", labels, row["queue_ns"] / 1e9)
+            add("modbus_sim_queue_seconds_max", labels, row["queue_max_ns"] / 1e9)
+
+    help_text = {
+        "modbus_sim_connections": ("gauge", "目前連線數"),
+        "modbus_sim_connections_total": ("counter", "累計連線數"),
+        "modbus_sim_exceptions_total": ("counter", "例外回應數"),
+        "modbus_sim_injected_exceptions_total": ("counter", "故障注入的例外回應數"),
+        "modbus_sim_dropped_total": ("counter", "故障注入丟棄的回應數"),
+        "modbus_sim_resets_total": ("counter", "故障注入重置的連線數"),
+        "modbus_sim_requests_total": ("counter", "請求數"),
+        "modbus_sim_responses_total": ("counter", "已送出的回應數"),
+        "modbus_sim_received_bytes_total": ("counter", "接收的請求 bytes (含 MBAP)"),
+        "modbus_sim_sent_bytes_total": ("counter", "送出的回應 bytes (含 MBAP)"),
+        "modbus_sim_service_seconds_total": ("counter", "執行請求的總時間"),
+        "modbus_sim_injected_delay_seconds_total": ("counter", "注入延遲 (延遲模型與故障規則) 的總時間"),
+        "modbus_sim_queue_seconds_total": ("counter", "回應預定送出到實際送出的總落後"),
+        "modbus_sim_queue_seconds_max": ("gauge", "回應送出的最大落後"),
+    }
+    lines = []
+    for name, values in samples.items():
+        kind, text = help_text[name]
+        lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(f"{name}{{{labels}}} {value:g}" if isinstance(value, float) else f"{name}{{{labels}}} {value}"
+                     for labels, value in values)
+    return "\n".join(lines) + "\n"
+
+
+def metrics_json(servers):
+    """servers 為 [(埠, ModbusSimServer)]，回傳可 JSON 序列化的 dict"""
+    return {
+        str(port): {"counters": server.counters, "connections": server.connections,
+                    "clients": server.metrics.snapshot()}
+        for port, server in servers
+    }
+
+
+def write_metrics(path, servers):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(metrics_json(servers), f, ensure_ascii=False, indent=2)
+
+
+async def dump_metrics(path, servers, interval=DEFAULT_DUMP_INTERVAL):
+    """每 interval 秒將量測寫入 path (JSON)"""
+    while True:
+        await asyncio.sleep(interval)
+        write_metrics(path, servers)
+
+
+async def start_metrics_server(host, port, servers):
+    """啟動量測 HTTP 端點 (GET /metrics、/metrics.json)，回傳 asyncio.Server"""
+
+    async def handle(reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()).strip():
+                pass  # 略過標頭
+            parts = request_line.decode("latin-1").split()
+            path = parts[1] if len(parts) > 1 else "/"
+            if path == "/metrics":
+                status, content_type = "200 OK", "text/plain; version=0.0.4; charset=utf-8"
+                body = render_prometheus(servers).encode()
+            elif path == "/metrics.json":
+                status, content_type = "200 OK", "application/json"
+                body = json.dumps(metrics_json(servers), ensure_ascii=False).encode()
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", b"not found\n"
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    log.info("metrics: http://%s:%d/metrics (Prometheus), /metrics.json", host, port)
+    return server
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模擬器動態資料 (tick 引擎)
+背景任務以固定頻率 (最高 1 kHz) 更新 Joint 軌跡，以正向運動學推導 Base/Tool 座標，
+每個 tick 以一次 struct 打包寫入 IR 7001-7036；狀態位元 (DI 7200-7208、IR 7215)
+依腳本循環切換 (運行、暫停、錯誤、恢復、急停、斷線)
+"""
+
+import asyncio
+import logging
+import math
+import struct
+import time
+
+log = logging.getLogger(__name__)
+
+COORDS_ADDR = 7001  # Base (7001) + Joint (7013) + Tool (7025)，共 18 個 Float32
+STATUS_BITS_ADDR = 7200  # DI 7200-7208
+ROBOT_STATE_ADDR = 7215
+
+MAX_TICK_RATE = 1000
+DEFAULT_TICK_RATE = 100
+STATS_INTERVAL = 30.0  # 每隔幾秒輸出一次 tick 統計
+MAX_CATCH_UP = 0.05  # 落後不超過此秒數時連續補上錯過的 tick (計時器解析度約 1 ms)
+
+FLOATS = struct.Struct(">18f")
+REGISTERS = struct.Struct(">36H")
+
+# Joint 軌跡: 中心角度、擺幅 (deg)、週期 (s)
+JOINT_CENTER = (0.0, -30.0, 45.0, 0.0, 75.0, 0.0)
+JOINT_AMPLITUDE = (60.0, 20.0, 30.0, 45.0, 15.0, 90.0)
+JOINT_PERIOD = (8.0, 6.0, 7.0, 5.0, 9.0, 4.0)
+
+# 近似 TM5-700 的 DH 參數: (theta 偏移 deg, d mm, a mm, alpha deg)
+TM_DH = (
+    (0.0, 145.2, 0.0, -90.0),
+    (-90.0, 0.0, 329.0, 0.0),
+    (0.0, 0.0, 311.5, 0.0),
+    (90.0, -122.3, 0.0, 90.0),
+    (0.0, 106.0, 0.0, 90.0),
+    (0.0, 113.15, 0.0, 0.0),
+)
+
+DEFAULT_TOOL_OFFSET = (0.0, 0.0, 100.0)  # 工具中心點相對法蘭 (mm)
+
+# 狀態腳本: (持續秒數, 說明, {DI 位址: 值}, Robot State, Joint 是否運動)
+# Robot State: 0=Normal, 1=SOS, 2=Error, 3=Recovery, 4=STO
+STATUS_SCRIPT = (
+    (8.0, "運行", {7200: 1, 7201: 0, 7202: 1, 7205: 1, 7208: 0}, 0, True),
+    (2.0, "暫停", {7202: 0}, 0, False),
+    (6.0, "運行", {7202: 1}, 0, True),
+    (2.0, "錯誤", {7201: 1, 7202: 0}, 2, False),
+    (1.0, "恢復", {7201: 0}, 3, False),
+    (6.0, "運行", {7202: 1}, 0, True),
+    (2.0, "急停", {7202: 0, 7208: 1}, 4, False),
+    (1.0, "恢復", {7208: 0}, 3, False),
+    (1.0, "斷線", {7200: 0, 7205: 0}, 0, False),
+)
+
+
+# DH 參數的常數部分 (theta 偏移 rad, d, a, cos alpha, sin alpha)
+_DH_CONSTANTS = tuple(
+    (math.radians(offset), d, a, math.cos(math.radians(alpha)), math.sin(math.radians(alpha)))
+    for offset, d, a, alpha in TM_DH
+)
+
+
+def _compose(m, theta, d, a, ca, sa):
+    """m × DH(theta, d, a, alpha)；矩陣以 3x4 (旋轉 + 平移) 的 12 個元素表示"""
+    r00, r01, r02, r10, r11, r12, r20, r21, r22, px, py, pz = m
+    ct, st = math.cos(theta), math.sin(theta)
+    # DH 矩陣各欄: x = (ct, st, 0), y = (-st ca, ct ca, sa), z = (st sa, -ct sa, ca), p = (a ct, a st, d)
+    yx, yy = -st * ca, ct * ca
+    zx, zy = st * sa, -ct * sa
+    tx, ty = a * ct, a * st
+    return (
+        r00 * ct + r01 * st, r00 * yx + r01 * yy + r02 * sa, r00 * zx + r01 * zy + r02 * ca,
+        r10 * ct + r11 * st, r10 * yx + r11 * yy + r12 * sa, r10 * zx + r11 * zy + r12 * ca,
+        r20 * ct + r21 * st, r20 * yx + r21 * yy + r22 * sa, r20 * zx + r21 * zy + r22 * ca,
+        px + r00 * tx + r01 * ty + r02 * d, py + r10 * tx + r11 * ty + r12 * d, pz + r20 * tx + r21 * ty + r22 * d,
+    )
+
+
+_IDENTITY = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0)
+
+
+def forward_kinematics(joints):
+    """Joint 角度 (deg) → 法蘭位姿 (3x4 矩陣的 12 個元素)"""
+    m = _IDENTITY
+    for q, (offset, d, a, ca, sa) in zip(joints, _DH_CONSTANTS):
+        m = _compose(m, math.radians(q) + offset, d, a, ca, sa)
+    return m
+
+
+def apply_tool(m, tool_offset):
+    """法蘭位姿 → 工具中心點位姿 (旋轉不變，平移加上 R × offset)"""
+    x, y, z = tool_offset
+    r00, r01, r02, r10, r11, r12, r20, r21, r22, px, py, pz = m
+    return m[:9] + (px + r00 * x + r01 * y + r02 * z, py + r10 * x + r11 * y + r12 * z,
+                    pz + r20 * x + r21 * y + r22 * z)
+
+
+def matrix_to_pose(m):
+    """位姿矩陣 → [X, Y, Z (mm), Rx, Ry, Rz (deg, ZYX 歐拉角)]"""
+    r00, _, _, r10, _, _, r20, r21, r22, px, py, pz = m
+    rx = math.atan2(r21, r22)
+    ry = math.atan2(-r20, math.hypot(r21, r22))
+    rz = math.atan2(r10, r00)
+    return [px, py, pz, math.degrees(rx), math.degrees(ry), math.degrees(rz)]
+
+
+def joint_positions(t, phase=0.0):
+    """時間 t (s) 的 Joint 角度 (deg)"""
+    return [
+        center + amplitude * math.sin(2 * math.pi * t / period + phase)
+        for center, amplitude, period in zip(JOINT_CENTER, JOINT_AMPLITUDE, JOINT_PERIOD)
+    ]
+
+
+def encode_coordinates(joints, tool_offset=DEFAULT_TOOL_OFFSET):
+    """Joint 角度 → IR 7001-7036 的 36 個 register (Base、Joint、Tool 一次打包)"""
+    flange = forward_kinematics(joints)
+    base = matrix_to_pose(flange)
+    tool = matrix_to_pose(apply_tool(flange, tool_offset))
+    return list(REGISTERS.unpack(FLOATS.pack(*base, *joints, *tool)))
+
+
+class MotionSimulator:
+    """以固定 tick 頻率更新一組裝置的座標與狀態
+
+    每台裝置的軌跡相位不同 (distinct=True)；distinct=False 時所有裝置共用同一組
+    計算結果，每個 tick 只計算一次運動學。狀態腳本的時間以 status_scale 縮放。
+    """
+
+    def __init__(self, devices, tick_rate=DEFAULT_TICK_RATE, status_scale=1.0, distinct=True,
+                 tool_offset=DEFAULT_TOOL_OFFSET):
+        if not 0 < tick_rate <= MAX_TICK_RATE:
+            raise ValueError(f"tick 頻率必須介於 0 與 {MAX_TICK_RATE} Hz 之間: {tick_rate}")
+        self.devices = list(devices)
+        self.period = 1.0 / tick_rate
+        self.tick_rate = tick_rate
+        self.status_scale = status_scale
+        self.distinct = distinct
+        self.tool_offset = tool_offset
+        self.script_length = sum(step[0] for step in STATUS_SCRIPT) * status_scale
+        self.motion_time = 0.0  # 只在腳本允許運動時累加
+        self.last_t = 0.0
+        self.step = None
+        self.ticks = 0
+        self.overruns = 0
+
+    def status_step(self, t):
+        """時間 t 對應的狀態腳本步驟索引"""
+        t %= self.script_length
+        for i, step in enumerate(STATUS_SCRIPT):
+            t -= step[0] * self.status_scale
+            if t < 0:
+                return i
+        return len(STATUS_SCRIPT) - 1
+
+    def apply_status(self, step):
+        """寫入狀態腳本步驟 (從腳本起點累積，確保各位元狀態一致)"""
+        bits = {}
+        for _, _, changes, _, _ in STATUS_SCRIPT[:step + 1]:
+            bits.update(changes)
+        robot_state = STATUS_SCRIPT[step][3]
+        for device in self.devices:
+            current = device.getValues(2, STATUS_BITS_ADDR, 9)
+            values = [bits.get(STATUS_BITS_ADDR + i, current[i]) for i in range(9)]
+            device.setValues(2, STATUS_BITS_ADDR, values)
+            device.setValues(4, ROBOT_STATE_ADDR, [robot_state])
+
+    def tick(self, t):
+        """更新一次 (t 為自啟動起算的秒數)"""
+        step = self.status_step(t)
+        if step != self.step:
+            self.step = step
+            self.apply_status(step)
+        if STATUS_SCRIPT[step][4]:
+            self.motion_time += t - self.last_t
+        self.last_t = t
+
+        if self.distinct:
+            for i, device in enumerate(self.devices):
+                registers = encode_coordinates(joint_positions(self.motion_time, i * 0.618), self.tool_offset)
+                device.setValues(4, COORDS_ADDR, registers)
+        else:
+            registers = encode_coordinates(joint_positions(self.motion_time), self.tool_offset)
+            for device in self.devices:
+                device.setValues(4, COORDS_ADDR, registers)
+        self.ticks += 1
+
+    async def run(self):
+        """tick 迴圈 (依單調時鐘排程不累積漂移)
+
+        事件迴圈計時器的解析度約 1 ms，落後 MAX_CATCH_UP 秒內的 tick 會連續補上；
+        落後更多時跳過錯過的 tick 並計入 overruns。
+        """
+        start = time.monotonic()
+        next_tick = start
+        next_report = start + STATS_INTERVAL
+        while True:
+            now = time.monotonic()
+            if next_tick > now:
+                await asyncio.sleep(next_tick - now)
+            self.tick(next_tick - start)
+            next_tick += self.period
+            now = time.monotonic()
+            if now - next_tick > MAX_CATCH_UP:
+                missed = int((now - next_tick) / self.period)
+                self.overruns += missed
+                next_tick += missed * self.period
+            if now >= next_report:
+                log.info("motion: %d ticks, %.1f Hz, overruns %d, devices %d",
+                         self.ticks, self.ticks / (now - start), self.overruns, len(self.devices))
+                next_report += STATS_INTERVAL
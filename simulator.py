@@ -3,69 +3,311 @@
 """
 TM Robot Modbus TCP 模擬器
 提供完整的 TM Robot 座標和狀態模擬
+
+延遲以延後送出回應的方式注入 (不阻塞事件迴圈)，各功能碼可設定不同的延遲分布；
+同一連線可同時有多個未完成請求 (管線化)，可同時服務數百個連線
 """
 
-from pymodbus.server import StartAsyncTcpServer
-from pymodbus.datastore import ModbusSequentialDataBlock, ModbusDeviceContext, ModbusServerContext
+from pymodbus.datastore import ModbusDeviceContext, ModbusServerContext
+from pymodbus.exceptions import NoSuchIdException
+import argparse
 import asyncio
+import json
 import logging
-import sys
 import struct
 import random
 import time
 
+from sim_faults import make_distribution, FaultModel, NO_FAULT, throttle
+from sim_metrics import ServerMetrics, start_metrics_server, dump_metrics, write_metrics
+from sim_datablock import PagedDataBlock, REGISTER_TYPE, BIT_TYPE
+from sim_motion import MotionSimulator, DEFAULT_TICK_RATE
+
 logging.basicConfig()
 log = logging.getLogger()
 log.setLevel(logging.INFO)
 
+MBAP_HEADER = struct.Struct(">HHHB")  # transaction id, protocol id, length, unit id
+
+DATA_SIZE = 10000  # 位址 0-9999 (含 User Define Area 9000-9999)
+
+# 協定限制 (單次請求)
+MAX_READ_REGISTERS = 125
+MAX_READ_BITS = 2000
+MAX_WRITE_REGISTERS = 123
+MAX_WRITE_COILS = 1968
+
+READ_FUNCTION_CODES = (1, 2, 3, 4)
+WRITE_FUNCTION_CODES = (5, 6, 15, 16)
+
+# Modbus 例外碼
+ILLEGAL_FUNCTION = 0x01
+ILLEGAL_ADDRESS = 0x02
+ILLEGAL_VALUE = 0x03
+GATEWAY_NO_RESPONSE = 0x0B
+
+# 預設延遲設定 (ms): read/write 為讀取/寫入功能碼的預設分布，
+# 功能碼 ("1"-"16") 可個別覆寫；每 spike_every 次讀取額外加上一次 spike 延遲；
+# "faults" 為故障注入規則列表 (見 sim_faults.py)，"seed" 固定亂數種子以重現結果
+DEFAULT_LATENCY_PROFILE = {
+    "read": ["uniform", 5, 15],
+    "write": ["uniform", 8, 20],
+    "spike_every": 50,
+    "spike": ["uniform", 20, 50],
+}
+
+NO_LATENCY_PROFILE = {"read": ["fixed", 0], "write": ["fixed", 0]}
+
+write_buffer_limit = 64 * 1024  # 回應緩衝超過此大小時暫停讀取請求 (背壓)
+
+
 def float_to_registers(float_val):
     """將 Float32 轉換為兩個 16-bit registers"""
     packed = struct.pack('>f', float_val)
     return struct.unpack('>HH', packed)
 
-class RealisticModbusDataBlock(ModbusSequentialDataBlock):
-    """添加真實延遲的 Modbus 數據區塊"""
-    
-    def __init__(self, address, values):
-        super().__init__(address, values)
+
+class LatencyModel:
+    """依功能碼取樣回應延遲 (秒)；seed 未指定時使用設定中的 seed"""
+
+    def __init__(self, profile=None, seed=None):
+        profile = DEFAULT_LATENCY_PROFILE if profile is None else profile
+        self.rng = random.Random(profile.get("seed") if seed is None else seed)
+        read = make_distribution(profile.get("read", ["fixed", 0]))
+        write = make_distribution(profile.get("write", ["fixed", 0]))
+        self.distributions = {fc: read for fc in READ_FUNCTION_CODES}
+        self.distributions.update({fc: write for fc in WRITE_FUNCTION_CODES})
+        for key, spec in profile.items():
+            if key.isdigit():
+                self.distributions[int(key)] = make_distribution(spec)
+        self.spike_every = profile.get("spike_every", 0)
+        self.spike = make_distribution(profile["spike"]) if self.spike_every else None
         self.read_count = 0
-        self.write_count = 0
-    
-    def getValues(self, address, count=1):
-        """讀取時添加延遲"""
-        # 模擬網路和處理延遲 (5-15ms)
-        delay = random.uniform(0.005, 0.015)
-        time.sleep(delay)
-        
-        self.read_count += 1
-        
-        # 偶爾模擬較長的延遲 (模擬網路抖動)
-        if self.read_count % 50 == 0:
-            time.sleep(random.uniform(0.02, 0.05))
-        
-        return super().getValues(address, count)
-    
-    def setValues(self, address, values):
-        """寫入時添加延遲"""
-        # 寫入通常比讀取慢一些
-        delay = random.uniform(0.008, 0.020)
-        time.sleep(delay)
-        
-        self.write_count += 1
-        
-        return super().setValues(address, values)
-
-def create_tm_robot_context():
-    """建立 TM Robot Modbus Context"""
-    
-    # 準備數據陣列 - 支援高位址
-    ir_data = [0] * 8000  # Input Registers
-    di_data = [0] * 8000  # Discrete Inputs  
-    co_data = [0] * 8000  # Coils
-    hr_data = [0] * 8000  # Holding Registers
-    
+
+    def sample(self, function_code):
+        distribution = self.distributions.get(function_code)
+        delay = distribution(self.rng) if distribution else 0.0
+        if self.spike and function_code in READ_FUNCTION_CODES:
+            self.read_count += 1
+            if self.read_count % self.spike_every == 0:
+                delay += self.spike(self.rng)  # 偶爾模擬較長的延遲 (模擬網路抖動)
+        return delay
+
+
+def load_latency_profile(path):
+    """讀取延遲/故障設定檔 (JSON)"""
+    with open(path, encoding="utf-8") as f:
+        profile = json.load(f)
+    LatencyModel(profile)  # 驗證設定
+    FaultModel(profile.get("faults"))
+    return profile
+
+
+def exception_pdu(function_code, code):
+    return struct.pack(">BB", function_code | 0x80, code)
+
+
+def pack_bits(values):
+    data = bytearray((len(values) + 7) // 8)
+    for i, value in enumerate(values):
+        if value:
+            data[i >> 3] |= 1 << (i & 7)
+    return bytes(data)
+
+
+def unpack_bits(data, count):
+    return [bool(data[i >> 3] >> (i & 7) & 1) for i in range(count)]
+
+
+def process_request(device, pdu):
+    """執行一個請求 PDU，回傳回應 PDU"""
+    function_code = pdu[0]
+    try:
+        if function_code in READ_FUNCTION_CODES:
+            address, count = struct.unpack(">HH", pdu[1:5])
+            bits = function_code in (1, 2)
+            if not 1 <= count <= (MAX_READ_BITS if bits else MAX_READ_REGISTERS):
+                return exception_pdu(function_code, ILLEGAL_VALUE)
+            values = device.getValues(function_code, address, count)
+            if not isinstance(values, list):
+                return exception_pdu(function_code, ILLEGAL_ADDRESS)
+            data = pack_bits(values) if bits else struct.pack(f">{count}H", *values)
+            return struct.pack(">BB", function_code, len(data)) + data
+
+        if function_code in (5, 6):
+            address, value = struct.unpack(">HH", pdu[1:5])
+            if function_code == 5:
+                if value not in (0xFF00, 0x0000):
+                    return exception_pdu(function_code, ILLEGAL_VALUE)
+                value = value == 0xFF00
+            if device.setValues(function_code, address, [value]) is not None:
+                return exception_pdu(function_code, ILLEGAL_ADDRESS)
+            return pdu[:5]
+
+        if function_code in (15, 16):
+            address, count, byte_count = struct.unpack(">HHB", pdu[1:6])
+            if function_code == 15:
+                if not 1 <= count <= MAX_WRITE_COILS or byte_count != (count + 7) // 8:
+                    return exception_pdu(function_code, ILLEGAL_VALUE)
+                values = unpack_bits(pdu[6:6 + byte_count], count)
+            else:
+                if not 1 <= count <= MAX_WRITE_REGISTERS or byte_count != count * 2:
+                    return exception_pdu(function_code, ILLEGAL_VALUE)
+                values = list(struct.unpack(f">{count}H", pdu[6:6 + byte_count]))
+            if device.setValues(function_code, address, values) is not None:
+                return exception_pdu(function_code, ILLEGAL_ADDRESS)
+            return struct.pack(">BHH", function_code, address, count)
+    except struct.error:
+        return exception_pdu(function_code, ILLEGAL_VALUE)
+
+    return exception_pdu(function_code, ILLEGAL_FUNCTION)
+
+
+def new_counters():
+    """伺服器請求計數"""
+    return {
+        "requests": 0, "exceptions": 0, "bytes_in": 0, "bytes_out": 0,
+        "connections_total": 0, "connections_peak": 0, "by_function": {},
+        "injected_exceptions": 0, "dropped": 0, "resets": 0,
+    }
+
+
+def merge_counters(counters_list):
+    """彙總多個伺服器的請求計數 (connections_peak 為各伺服器峰值之和)"""
+    total = new_counters()
+    for counters in counters_list:
+        for key, value in counters.items():
+            if key == "by_function":
+                for function_code, n in value.items():
+                    total["by_function"][function_code] = total["by_function"].get(function_code, 0) + n
+            else:
+                total[key] += value
+    return total
+
+
+class ModbusSimServer:
+    """非阻塞 Modbus TCP 伺服器
+
+    請求到達時立即依序執行 (同一連線的寫入/讀取順序不變)，
+    回應則依延遲模型以 call_later 延後送出，事件迴圈不會被阻塞；
+    同一連線的多個請求可同時等待 (管線化，回應可能不依序，以 Transaction ID 對應)。
+    faults 為 FaultModel 時依規則注入例外、丟棄回應、重置連線、額外延遲與頻寬限制。
+    """
+
+    def __init__(self, context, latency=None, faults=None):
+        self.context = context
+        self.latency = latency or LatencyModel()
+        self.faults = faults or FaultModel()
+        self.connections = 0
+        self.counters = new_counters()
+        self.metrics = ServerMetrics()
+
+    async def start(self, host, port):
+        """開始監聽，回傳 asyncio.Server"""
+        return await asyncio.start_server(self.handle_client, host, port, backlog=1024)
+
+    async def handle_client(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        counters = self.counters
+        self.connections += 1
+        counters["connections_total"] += 1
+        counters["connections_peak"] = max(counters["connections_peak"], self.connections)
+        pacing = {}  # 頻寬限制的送出排程
+        peer = writer.get_extra_info("peername")
+        client = f"{peer[0]}:{peer[1]}" if peer else "unknown"
+        functions = self.metrics.connect(client)
+        try:
+            while True:
+                header = await reader.readexactly(MBAP_HEADER.size)
+                transaction_id, protocol_id, length, unit_id = MBAP_HEADER.unpack(header)
+                if length < 2:
+                    break
+                pdu = await reader.readexactly(length - 1)
+                if protocol_id != 0:
+                    continue
+
+                fault = self.faults.evaluate(unit_id, pdu, loop.time()) if self.faults else NO_FAULT
+                if fault.reset:
+                    counters["resets"] += 1
+                    writer.transport.abort()
+                    break
+                if fault.exception:
+                    counters["injected_exceptions"] += 1
+                    response = exception_pdu(pdu[0], fault.exception)
+                else:
+                    service_start = time.perf_counter_ns()
+                    response = self.respond(unit_id, pdu)
+                    service_ns = time.perf_counter_ns() - service_start
+                entry = self.metrics.record(functions, pdu[0], MBAP_HEADER.size + len(pdu),
+                                            0 if fault.exception else service_ns)
+                frame = MBAP_HEADER.pack(transaction_id, 0, len(response) + 1, unit_id) + response
+                counters["requests"] += 1
+                counters["bytes_in"] += MBAP_HEADER.size + len(pdu)
+                by_function = counters["by_function"]
+                by_function[pdu[0]] = by_function.get(pdu[0], 0) + 1
+                if fault.drop:
+                    counters["dropped"] += 1
+                    continue
+                counters["bytes_out"] += len(frame)
+                if response[0] & 0x80:
+                    counters["exceptions"] += 1
+                delay = self.latency.sample(pdu[0]) + fault.delay
+                if fault.bandwidth:
+                    now = loop.time()
+                    delay = throttle(pacing, now, now + delay, len(frame), fault.bandwidth) - now
+                if delay > 0:
+                    loop.call_later(delay, self.send, writer, frame, entry, time.monotonic() + delay, delay)
+                else:
+                    self.send(writer, frame, entry)
+
+                if writer.transport.get_write_buffer_size() > write_buffer_limit:
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.connections -= 1
+            self.metrics.disconnect(client)
+            writer.close()
+
+    def respond(self, unit_id, pdu):
+        try:
+            device = self.context[unit_id]
+        except NoSuchIdException:
+            return exception_pdu(pdu[0], GATEWAY_NO_RESPONSE)
+        return process_request(device, pdu)
+
+    def send(self, writer, frame, entry=None, scheduled=None, delay=0.0):
+        """送出回應 (scheduled 為預定送出的 time.monotonic()，落後即為排隊延遲)"""
+        if writer.is_closing():
+            return
+        writer.write(frame)
+        if entry is not None:
+            lag = time.monotonic() - scheduled if scheduled is not None else 0.0
+            self.metrics.sent(entry, len(frame), int(delay * 1e9), int(max(lag, 0.0) * 1e9))
+
+
+def create_tm_robot_context(template=None, share_inputs=True):
+    """建立 TM Robot Modbus Context
+
+    資料區塊為分頁、寫入時複製的 PagedDataBlock (全為 0 的分頁不配置記憶體)。
+    template 為另一台裝置的 context 時以它為範本: 只複製分頁參考，寫入時才複製該頁；
+    share_inputs 為 True 時直接共用用戶端無法寫入的 DI/IR 區塊。
+    """
+    if template is not None:
+        di, co, hr, ir = (template.store[key] for key in "dchi")
+        if not share_inputs:
+            di = di.clone()
+            ir = ir.clone()
+        return ModbusDeviceContext(di=di, co=co.clone(), hr=hr.clone(), ir=ir)
+
+    # 準備數據陣列 (索引即 Modbus 位址 0-9999)
+    ir_data = [0] * DATA_SIZE  # Input Registers
+    di_data = [0] * DATA_SIZE  # Discrete Inputs
+    co_data = [0] * DATA_SIZE  # Coils
+    hr_data = [0] * DATA_SIZE  # Holding Registers
+
     # === TM Robot 座標數據 ===
-    
+
     # Base 座標系 (7001-7012)
     base_coords = [350.5, -120.3, 450.8, 0.0, 90.0, -45.0]
     for i, coord in enumerate(base_coords):
@@ -73,15 +315,15 @@ def create_tm_robot_context():
         addr = 7001 + i * 2
         ir_data[addr] = reg1
         ir_data[addr + 1] = reg2
-    
-    # Joint 角度 (7013-7024)  
+
+    # Joint 角度 (7013-7024)
     joint_angles = [0.0, -30.0, 45.0, 0.0, 75.0, 0.0]
     for i, angle in enumerate(joint_angles):
         reg1, reg2 = float_to_registers(angle)
         addr = 7013 + i * 2
         ir_data[addr] = reg1
         ir_data[addr + 1] = reg2
-    
+
     # Tool 座標系 (7025-7036)
     tool_coords = [355.2, -118.7, 455.3, 2.1, 91.5, -43.8]
     for i, coord in enumerate(tool_coords):
@@ -89,54 +331,59 @@ def create_tm_robot_context():
         addr = 7025 + i * 2
         ir_data[addr] = reg1
         ir_data[addr + 1] = reg2
-    
+
     # === TM Robot 狀態數據 ===
-    
+
     # Discrete Inputs
     di_data[7200] = 1  # Robot Link (已連線)
     di_data[7201] = 0  # Error (無錯誤)
     di_data[7202] = 0  # Project Running (未運行)
     di_data[7208] = 0  # ESTOP (已恢復)
-    
-    # Input Registers  
+
+    # Input Registers
     ir_data[7215] = 0  # Robot State (Normal)
     ir_data[7216] = 0  # Operation Mode (Manual)
-    
+
     # Coils
     co_data[7206] = 0  # Light (關閉)
-    
+
     # Control Box DI/DO (0-15)
     for i in range(16):
         di_data[i] = i % 2  # DI 交替 0/1
         co_data[i] = 0      # DO 全部為 0
-    
+
     # === User Define Area (9000-9999) ===
     # 初始化 User Define Area 的 Holding Registers
     for i in range(9000, 10000):
-        if i < len(hr_data):
-            hr_data[i] = i - 9000  # 設定初始值 (0, 1, 2, 3, ...)
-    
+        hr_data[i] = i - 9000  # 設定初始值 (0, 1, 2, 3, ...)
+
     # 設定一些特殊的 User Define 值
-    if 9000 < len(hr_data): hr_data[9000] = 12345   # 測試值
-    if 9001 < len(hr_data): hr_data[9001] = 67890   # 測試值
-    if 9010 < len(hr_data): hr_data[9010] = 0xABCD  # 十六進位測試值
-    if 9020 < len(hr_data): hr_data[9020] = 0x1234  # 十六進位測試值
-    if 9100 < len(hr_data): hr_data[9100] = 65535   # 最大值測試
-    
-    # 建立資料區塊 (使用真實延遲版本)
-    di = RealisticModbusDataBlock(0, di_data)
-    co = RealisticModbusDataBlock(0, co_data)  
-    hr = RealisticModbusDataBlock(0, hr_data)
-    ir = RealisticModbusDataBlock(0, ir_data)
-    
+    hr_data[9000] = 12345   # 測試值
+    hr_data[9001] = 54321   # 測試值
+    hr_data[9010] = 0xABCD  # 十六進位測試值
+    hr_data[9020] = 0x1234  # 十六進位測試值
+    hr_data[9100] = 65535   # 最大值測試
+
+    # 建立資料區塊 (ModbusDeviceContext 會將位址 +1，因此區塊從位址 1 開始)
+    di = PagedDataBlock.from_values(1, di_data, BIT_TYPE)
+    co = PagedDataBlock.from_values(1, co_data, BIT_TYPE)
+    hr = PagedDataBlock.from_values(1, hr_data, REGISTER_TYPE)
+    ir = PagedDataBlock.from_values(1, ir_data, REGISTER_TYPE)
+
     return ModbusDeviceContext(di=di, co=co, hr=hr, ir=ir)
 
-async def run_simulator(host="127.0.0.1", port=502):
-    """啟動 TM Robot 模擬器"""
-    
+async def run_simulator(host="127.0.0.1", port=502, latency_profile=None, tick_rate=None, status_scale=1.0,
+                        seed=None, metrics_port=None, metrics_file=None):
+    """啟動 TM Robot 模擬器 (tick_rate 有設定時座標與狀態會持續變化)"""
+
+    profile = latency_profile or DEFAULT_LATENCY_PROFILE
+    seed = profile.get("seed") if seed is None else seed
     device = create_tm_robot_context()
     context = ModbusServerContext(devices={1: device}, single=False)
-    
+    faults = FaultModel(profile.get("faults"), seed)
+    server = ModbusSimServer(context, LatencyModel(profile, seed), faults)
+    motion = MotionSimulator([device], tick_rate, status_scale) if tick_rate else None
+
     print("=" * 60)
     print("TM Robot Modbus TCP Simulator v1.0.1.0001")
     print("=" * 60)
@@ -144,7 +391,7 @@ async def run_simulator(host="127.0.0.1", port=502):
     print(f"Slave ID: 1")
     print("\nSimulated Coordinates:")
     print("   Base: X=350.5, Y=-120.3, Z=450.8 mm")
-    print("   Tool: X=355.2, Y=-118.7, Z=455.3 mm") 
+    print("   Tool: X=355.2, Y=-118.7, Z=455.3 mm")
     print("   Joint: J1=0deg, J2=-30deg, J3=45deg")
     print("\nSupported Addresses:")
     print("   Base Coordinates: 7001-7012")
@@ -152,11 +399,64 @@ async def run_simulator(host="127.0.0.1", port=502):
     print("   Tool Coordinates: 7025-7036")
     print("   Robot Status: 7200, 7201, 7215, 7216")
     print("   User Define Area: 9000-9999 (R/W)")
+    print(f"\nLatency profile: {json.dumps({k: v for k, v in profile.items() if k != 'faults'})}")
+    for rule in profile.get("faults", []):
+        print(f"Fault: {json.dumps(rule)}")
+    if seed is not None:
+        print(f"Seed: {seed}")
+    if motion:
+        print(f"Motion: {tick_rate:g} Hz (joints, Base/Tool poses, status bits 7200-7208, 7215)")
     print("\nSimulator is running... (Press Ctrl+C to stop)")
     print("=" * 60)
-    
-    await StartAsyncTcpServer(context=context, address=(host, port))
+
+    listener = await server.start(host, port)
+    metrics_listener = await start_metrics_server(host, metrics_port, [(port, server)]) if metrics_port else None
+    tasks = [asyncio.create_task(motion.run())] if motion else []
+    if metrics_file:
+        tasks.append(asyncio.create_task(dump_metrics(metrics_file, [(port, server)])))
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        for task in tasks:
+            task.cancel()
+        if metrics_listener:
+            metrics_listener.close()
+        if metrics_file:
+            write_metrics(metrics_file, [(port, server)])
+        if faults:
+            counters = server.counters
+            log.info("faults: %d requests, %d injected exceptions, %d dropped, %d resets",
+                     counters["requests"], counters["injected_exceptions"], counters["dropped"], counters["resets"])
+            for rule in faults.summary():
+                log.info("   %s (%s): matched %d, triggered %d",
+                         rule["name"], rule["action"], rule["matched"], rule["triggered"])
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="TM Robot Modbus TCP 模擬器")
+    parser.add_argument("port", type=int, nargs="?", default=502, help="監聽埠 (預設 502)")
+    parser.add_argument("--host", default="127.0.0.1", help="監聽位址")
+    parser.add_argument("--latency", help="延遲/故障設定檔 (JSON，單位 ms，可依功能碼設定分布與故障規則)")
+    parser.add_argument("--seed", type=int, help="亂數種子 (覆寫設定檔的 seed，重現相同的延遲與故障序列)")
+    parser.add_argument("--no-latency", action="store_true", help="不注入延遲")
+    parser.add_argument("--metrics-port", type=int, help="量測 HTTP 端點埠 (/metrics Prometheus 格式、/metrics.json)")
+    parser.add_argument("--metrics-file", help="定期寫入請求量測 (JSON，每 10 秒與結束時)")
+    parser.add_argument("--motion", action="store_true", help="座標與狀態持續變化 (背景 tick 引擎)")
+    parser.add_argument("--tick-rate", type=float, default=DEFAULT_TICK_RATE, help="動態資料更新頻率 (Hz，最高 1000)")
+    parser.add_argument("--status-scale", type=float, default=1.0, help="狀態腳本時間倍率 (小於 1 切換更快)")
+    return parser
 
 if __name__ == "__main__":
-    port = int(sys.argv[1]) if len(sys.argv) > 1 else 502
-    asyncio.run(run_simulator("127.0.0.1", port))
\ No newline at end of file
+    args = build_parser().parse_args()
+    if args.no_latency:
+        profile = NO_LATENCY_PROFILE
+    elif args.latency:
+        profile = load_latency_profile(args.latency)
+    else:
+        profile = None
+    try:
+        asyncio.run(run_simulator(args.host, args.port, profile,
+                                  args.tick_rate if args.motion else None, args.status_scale, args.seed,
+                                  args.metrics_port, args.metrics_file))
+    except KeyboardInterrupt:
+        pass
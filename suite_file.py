@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+宣告式測試套件 (YAML / JSON)
+套件檔載入時驗證並編譯為執行計畫: 相鄰的讀取步驟合併為最少請求、
+解碼器與預期值比對預先建立，執行時每個步驟只剩讀取與比較
+
+檔案格式 (YAML 範例):
+    suites:
+      回歸測試:
+        device_id: 1
+        steps:
+          - name: Base X
+            read: {function: 4, address: 7001, datatype: Float32}
+            expect: 350.5
+            tolerance: 0.01
+          - name: 寫入 9000
+            write: {function: 6, address: 9000, value: 123}
+          - loop: 10
+            steps:
+              - name: 驗證 9000
+                read: {function: 3, address: 9000}
+                expect: 123
+          - test: test_base_coords
+"""
+
+import json
+import os
+import time
+
+try:
+    import yaml
+except ImportError:  # PyYAML 為選用套件，未安裝時只支援 JSON
+    yaml = None
+
+from modbus_engine import (
+    DATATYPES, WORD_DATATYPES, WORD_ORDERS, DEFAULT_WORD_ORDER, DEFAULT_SLAVE_ID,
+    PRESET_TEST_NAMES, convert_registers
+)
+from read_planner import ReadItem, plan_reads, execute_plan, BIT_FUNCTION_CODES, DEFAULT_MAX_GAP
+from bulk_io import MAX_WRITE_REGISTERS, MAX_WRITE_COILS
+from results_store import RESULT_SUITE
+
+DEFAULT_SUITE_FILES = ("test_suites.yaml", "test_suites.yml", "test_suites.json")
+
+WRITE_FUNCTION_CODES = (5, 6, 15, 16)
+MAX_LOOP_COUNT = 1_000_000
+
+
+class SuiteFileError(ValueError):
+    """套件檔格式錯誤"""
+
+
+class SuitePlan:
+    """編譯後的測試套件"""
+
+    def __init__(self, name, phases, step_names, check_count):
+        self.name = name
+        self.phases = phases          # 依序執行的階段 (見 compile_steps)
+        self.step_names = step_names  # 顯示用的步驟名稱
+        self.check_count = check_count
+
+    def run(self, engine, verbose=False):
+        """在 engine 上執行，回傳 (通過數, 失敗數)"""
+        return run_suite_plan(engine, self, verbose)
+
+
+def _require(step, key, where):
+    if key not in step:
+        raise SuiteFileError(f"{where}: 缺少 {key}")
+    return step[key]
+
+
+def _as_int(value, key, where, low=0, high=0xFFFF):
+    if isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high:
+        raise SuiteFileError(f"{where}: {key} 必須是 {low}-{high} 的整數 (目前為 {value!r})")
+    return value
+
+
+def _build_decoder(function_code, datatype, word_order):
+    """預先建立解碼函數 (原始數值列表 → 數值列表)"""
+    if function_code in BIT_FUNCTION_CODES:
+        return lambda data: [bool(v) for v in data]
+    if datatype in WORD_DATATYPES:
+        return lambda data: convert_registers(data, datatype, word_order)
+    return lambda data: convert_registers(data, datatype)
+
+
+def _compile_read(step, index, where):
+    """編譯讀取步驟，回傳 (ReadItem, 檢查項目)"""
+    spec = _require(step, "read", where)
+    function_code = _as_int(_require(spec, "function", where), "function", where, 1, 4)
+    address = _as_int(_require(spec, "address", where), "address", where)
+    bits = function_code in BIT_FUNCTION_CODES
+    datatype = spec.get("datatype", "Bool" if bits else "UInt16")
+    if datatype not in DATATYPES:
+        raise SuiteFileError(f"{where}: 不支援的資料型別 {datatype}")
+    word_order = spec.get("word_order", DEFAULT_WORD_ORDER)
+    if word_order not in WORD_ORDERS:
+        raise SuiteFileError(f"{where}: 不支援的 word_order {word_order}")
+
+    expect = step.get("expect")
+    if expect is not None and not isinstance(expect, list):
+        expect = [expect]
+    width = 2 if datatype in WORD_DATATYPES and not bits else 1
+    default_count = len(expect) * width if expect else width
+    count = _as_int(spec.get("count", default_count), "count", where, 1, 2000 if bits else 125)
+    if expect and len(expect) > count // width:
+        raise SuiteFileError(f"{where}: 預期值數量 ({len(expect)}) 超過讀取數量")
+
+    tolerance = step.get("tolerance", 0)
+    if not isinstance(tolerance, (int, float)) or tolerance < 0:
+        raise SuiteFileError(f"{where}: tolerance 必須是非負數")
+
+    name = step.get("name") or f"FC{function_code:02d} {address}"
+    item = ReadItem(index, function_code, address, count)
+    check = (name, index, _build_decoder(function_code, datatype, word_order), expect, tolerance, address)
+    return item, check
+
+
+def _compile_write(step, where, device_id):
+    """編譯寫入步驟"""
+    spec = _require(step, "write", where)
+    function_code = _require(spec, "function", where)
+    if function_code not in WRITE_FUNCTION_CODES:
+        raise SuiteFileError(f"{where}: 寫入功能碼必須是 {WRITE_FUNCTION_CODES}")
+    address = _as_int(_require(spec, "address", where), "address", where)
+    value = _require(spec, "value", where)
+    values = value if isinstance(value, list) else [value]
+    if function_code in (5, 15):
+        values = [bool(v) for v in values]
+    else:
+        values = [_as_int(v, "value", where) for v in values]
+    if function_code in (5, 6) and len(values) != 1:
+        raise SuiteFileError(f"{where}: 功能碼 {function_code:02d} 只能寫入單一值")
+    limit = MAX_WRITE_COILS if function_code == 15 else MAX_WRITE_REGISTERS
+    if not 1 <= len(values) <= limit:
+        raise SuiteFileError(f"{where}: 功能碼 {function_code:02d} 的寫入值數量必須介於 1-{limit} (目前 {len(values)})")
+    name = step.get("name") or f"FC{function_code:02d} {address}"
+    return ("write", name, function_code, address, values, device_id)
+
+
+def compile_steps(steps, suite_name, device_id=DEFAULT_SLAVE_ID, max_gap=DEFAULT_MAX_GAP, path="", counter=None):
+    """將步驟列表編譯為階段列表，回傳 (階段, 步驟名稱, 檢查數)
+
+    階段:
+        ("reads", 讀取區塊, 檢查項目, device_id)   相鄰讀取合併後一次執行
+        ("write", 名稱, 功能碼, 位址, 值列表, device_id)
+        ("test", 名稱, 引擎方法名稱)
+        ("loop", 次數, 子階段)
+    """
+    if not isinstance(steps, list) or not steps:
+        raise SuiteFileError(f"{suite_name}{path}: steps 必須是非空列表")
+    counter = counter if counter is not None else [0]
+    phases, names, checks = [], [], 0
+    pending_items, pending_checks = [], []
+    pending_device = device_id
+
+    def flush_reads():
+        if pending_items:
+            phases.append(("reads", plan_reads(pending_items, max_gap), tuple(pending_checks), pending_device))
+            pending_items.clear()
+            pending_checks.clear()
+
+    for i, step in enumerate(steps, 1):
+        where = f"{suite_name}{path} 步驟 {i}"
+        if not isinstance(step, dict):
+            raise SuiteFileError(f"{where}: 步驟必須是物件")
+        step_device = _as_int(step.get("device_id", device_id), "device_id", where, 0, 255)
+
+        if "read" in step:
+            if step_device != pending_device:
+                flush_reads()
+                pending_device = step_device
+            counter[0] += 1
+            item, check = _compile_read(step, counter[0], where)
+            pending_items.append(item)
+            pending_checks.append(check)
+            names.append(check[0])
+            checks += 1
+            continue
+
+        flush_reads()
+        if "write" in step:
+            phase = _compile_write(step, where, step_device)
+            names.append(phase[1])
+            checks += 1  # 寫入成功與否也計入檢查
+        elif "test" in step:
+            func = step["test"]
+            if func not in PRESET_TEST_NAMES:
+                raise SuiteFileError(f"{where}: 未知的預設測試 {func}")
+            name = step.get("name") or PRESET_TEST_NAMES[func]
+            phase = ("test", name, func)
+            names.append(name)
+            checks += 1
+        elif "loop" in step:
+            count = _as_int(step["loop"], "loop", where, 1, MAX_LOOP_COUNT)
+            sub_phases, sub_names, sub_checks = compile_steps(
+                _require(step, "steps", where), suite_name, step_device, max_gap, f"{path} 步驟 {i}", counter
+            )
+            phase = ("loop", count, sub_phases)
+            names.extend(f"{n} (×{count})" for n in sub_names)
+            checks += sub_checks * count
+        else:
+            raise SuiteFileError(f"{where}: 步驟必須包含 read / write / test / loop 其中之一")
+        phases.append(phase)
+
+    flush_reads()
+    return phases, names, checks
+
+
+def compile_suites(data, max_gap=DEFAULT_MAX_GAP):
+    """驗證並編譯套件定義 ({"suites": {名稱: {...}}})，回傳 {名稱: SuitePlan}"""
+    if not isinstance(data, dict) or not isinstance(data.get("suites"), dict):
+        raise SuiteFileError("套件檔必須包含 suites 物件")
+    plans = {}
+    for name, suite in data["suites"].items():
+        if isinstance(suite, list):
+            suite = {"steps": suite}
+        if not isinstance(suite, dict):
+            raise SuiteFileError(f"{name}: 套件必須是物件或步驟列表")
+        device_id = _as_int(suite.get("device_id", DEFAULT_SLAVE_ID), "device_id", name, 0, 255)
+        phases, names, checks = compile_steps(suite.get("steps"), name, device_id, max_gap)
+        plans[name] = SuitePlan(name, phases, names, checks)
+    return plans
+
+
+def load_suite_file(path, max_gap=DEFAULT_MAX_GAP):
+    """載入並編譯套件檔 (.yaml / .yml / .json)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.lower().endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise SuiteFileError("讀取 YAML 套件檔需要安裝 PyYAML (pip install pyyaml)")
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    return compile_suites(data, max_gap)
+
+
+def load_suite_files(paths=None, max_gap=DEFAULT_MAX_GAP):
+    """載入多個套件檔，回傳 ({名稱: SuitePlan}, [(路徑, 錯誤)])
+
+    paths 為 None 時載入 DEFAULT_SUITE_FILES 並略過不存在的檔案；
+    明確指定的路徑不存在則記錄為錯誤。
+    """
+    missing_ok = paths is None
+    plans, errors = {}, []
+    for path in DEFAULT_SUITE_FILES if paths is None else paths:
+        if not os.path.exists(path):
+            if not missing_ok:
+                errors.append((path, "檔案不存在"))
+            continue
+        try:
+            plans.update(load_suite_file(path, max_gap))
+        except Exception as e:  # 檔案、JSON/YAML 語法或格式錯誤
+            errors.append((path, e))
+    return plans, errors
+
+
+def suite_step_names(suite):
+    """取得套件的步驟名稱 (內建套件或 SuitePlan)"""
+    if isinstance(suite, SuitePlan):
+        return suite.step_names
+    return [test['name'] for test in suite]
+
+
+def _matches(values, expect, tolerance):
+    """比較讀取值與預期值"""
+    for value, expected in zip(values, expect):
+        if isinstance(value, float) or isinstance(expected, float):
+            if abs(value - expected) > tolerance:
+                return False
+        elif value != expected:
+            return False
+    return True
+
+
+def _write(client, function_code, address, values, device_id):
+    """執行寫入，回傳 pymodbus 回應"""
+    if function_code == 5:
+        return client.write_coil(address, values[0], device_id=device_id)
+    if function_code == 6:
+        return client.write_register(address, values[0], device_id=device_id)
+    if function_code == 15:
+        return client.write_coils(address, values, device_id=device_id)
+    return client.write_registers(address, values, device_id=device_id)
+
+
+def _run_phases(engine, plan, phases, outcome, verbose):
+    """依序執行階段，結果累計到 outcome [通過數, 失敗數]"""
+    log = engine.log
+    results = engine.results
+    for phase in phases:
+        kind = phase[0]
+        if kind == "reads":
+            _, blocks, checks, device_id = phase
+            start_ns = time.perf_counter_ns()
+            values, errors = execute_plan(engine.client, blocks, device_id)
+            elapsed_ms = (time.perf_counter_ns() - start_ns) / 1_000_000 / max(1, len(checks))
+            for block, error in errors:
+                log(f"❌ 讀取失敗 (FC{block.function_code:02d} {block.address}-{block.address + block.count - 1}): {error}", "ERROR")
+            for name, key, decode, expect, tolerance, address in checks:
+                raw = values.get(key)
+                if raw is None:
+                    ok, detail = False, "讀取失敗"
+                else:
+                    decoded = decode(raw)
+                    ok = expect is None or _matches(decoded, expect, tolerance)
+                    detail = f"{decoded[:len(expect)] if expect else decoded}"
+                    if not ok:
+                        log(f"❌ {name} ({address}): 讀取值 {decoded[:len(expect)]} ≠ 預期 {expect}"
+                            + (f" (容許誤差 {tolerance})" if tolerance else ""), "ERROR")
+                    elif verbose:
+                        log(f"✅ {name} ({address}): {detail}")
+                outcome[0 if ok else 1] += 1
+                results.add(RESULT_SUITE, name, ok, elapsed_ms, f"{plan.name}: {detail}")
+
+        elif kind == "write":
+            _, name, function_code, address, values, device_id = phase
+            start_ns = time.perf_counter_ns()
+            try:
+                response = _write(engine.client, function_code, address, values, device_id)
+                error = str(response) if response.isError() else None
+            except Exception as e:
+                error = str(e)
+            elapsed_ms = (time.perf_counter_ns() - start_ns) / 1_000_000
+            # 寫入與讀取檢查一樣計入通過/失敗數並記錄，讓統計與匯出的結果一致
+            outcome[0 if error is None else 1] += 1
+            if error:
+                log(f"❌ {name}: 寫入失敗 - {error}", "ERROR")
+                results.add(RESULT_SUITE, name, False, elapsed_ms, f"{plan.name}: 寫入失敗 {error}")
+            else:
+                if verbose:
+                    log(f"📝 {name}: 寫入 {address} = {values}")
+                results.add(RESULT_SUITE, name, True, elapsed_ms, f"{plan.name}: 寫入 {address} = {values}")
+
+        elif kind == "test":
+            _, name, func = phase
+            result = engine.run_named_test(func, name, RESULT_SUITE, plan.name)
+            ok = result is not None and result is not False
+            outcome[0 if ok else 1] += 1
+            if not ok:
+                log(f"❌ 測試失敗: {name}", "ERROR")
+
+        else:  # loop
+            _, count, sub_phases = phase
+            for _ in range(count):
+                _run_phases(engine, plan, sub_phases, outcome, verbose)
+
+
+def run_suite_plan(engine, plan, verbose=False):
+    """執行編譯後的套件，回傳 (通過數, 失敗數)"""
+    log = engine.log
+    log(f"🚀 開始執行測試套件: {plan.name} ({plan.check_count} 項檢查)")
+    log("=" * 50)
+
+    outcome = [0, 0]
+    started = time.perf_counter()
+    _run_phases(engine, plan, plan.phases, outcome, verbose)
+    elapsed = time.perf_counter() - started
+
+    passed, failed = outcome
+    log("=" * 50)
+    log(f"🎉 測試套件完成: {plan.name}", "SUCCESS")
+    log(f"📊 結果: 通過 {passed}/{passed + failed}, 失敗 {failed}/{passed + failed}")
+    per_check = elapsed / (passed + failed) * 1000 if passed + failed else 0
+    log(f"⏱️ 耗時 {elapsed * 1000:.1f} ms (平均每項 {per_check:.3f} ms)")
+    if failed == 0:
+        log("✅ 所有測試通過！", "SUCCESS")
+    else:
+        log(f"⚠️ 有 {failed} 個測試失敗", "WARNING")
+    return passed, failed
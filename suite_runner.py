@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+測試套件並行執行
+以位址範圍鎖決定哪些測試可以同時執行: 唯讀測試之間可並行，
+寫入的測試與任何存取重疊範圍的測試互斥
+"""
+
+import threading
+
+DEFAULT_SUITE_CONCURRENCY = 4  # 每台控制器同時使用的連線數上限
+
+# 功能碼 → 資料表 (寫入功能碼與讀取功能碼對應到同一張表)
+FUNCTION_TABLES = {1: "coil", 5: "coil", 15: "coil", 2: "di", 3: "hr", 6: "hr", 16: "hr", 4: "ir"}
+
+# 未宣告存取範圍的測試: 與所有測試互斥
+EXCLUSIVE_ACCESS = (("*", 0, float("inf"), True),)
+
+
+def normalize_access(spec):
+    """將測試的存取宣告轉換為 ((資料表, 起始, 結束, 是否寫入), ...)
+
+    spec 為 {"reads": [(功能碼, 位址, 數量)], "writes": [...]}；None 表示獨占。
+    """
+    if spec is None:
+        return EXCLUSIVE_ACCESS
+    access = []
+    for key, write in (("reads", False), ("writes", True)):
+        for function_code, address, count in spec.get(key, ()):
+            access.append((FUNCTION_TABLES[function_code], address, address + count - 1, write))
+    return tuple(access)
+
+
+def conflicts(a, b):
+    """兩個存取是否衝突 (同一資料表、範圍重疊且至少一方寫入)"""
+    table_a, start_a, end_a, write_a = a
+    table_b, start_b, end_b, write_b = b
+    if table_a != table_b and "*" not in (table_a, table_b):
+        return False
+    return (write_a or write_b) and start_a <= end_b and start_b <= end_a
+
+
+class AddressLocks:
+    """位址範圍鎖 (讀取共享、寫入互斥)"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._held = []
+
+    def _blocked(self, access):
+        return any(conflicts(a, h) for a in access for h in self._held)
+
+    def acquire(self, access):
+        """等待直到 access 與目前持有的範圍都不衝突"""
+        with self._cond:
+            while self._blocked(access):
+                self._cond.wait()
+            self._held.extend(access)
+
+    def release(self, access):
+        with self._cond:
+            for a in access:
+                self._held.remove(a)
+            self._cond.notify_all()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+User Define 全區掃描 (完整性/性能浸泡測試)
+將測試圖樣寫入整個 9000-9999 區，以最大區塊讀回 (可分散到多個連線)，
+以位元圖記錄不符的位址並報告吞吐量
+"""
+
+import asyncio
+import random
+import time
+
+from async_client import PipelinedModbusClient
+from bulk_io import MAX_WRITE_REGISTERS, chunk_ranges, data_bytes
+from modbus_engine import USER_DEFINE_START, USER_DEFINE_END, DEFAULT_SLAVE_ID
+from read_planner import MAX_READ_REGISTERS
+
+SWEEP_PATTERNS = ("address", "inverse", "checkerboard", "walking", "random")
+
+
+def make_pattern(pattern, start, count, seed=0, pass_index=0):
+    """產生測試圖樣 (每個 register 一個 16-bit 值)
+
+    address: 值 = 位址；inverse: 位址取反；checkerboard: 0xAAAA/0x5555 交錯；
+    walking: 單一位元輪流；random: 以 seed 產生的固定亂數。
+    pass_index 讓多次掃描使用不同內容 (checkerboard 反相、walking 位移)。
+    """
+    if pattern == "address":
+        return [(start + i + pass_index) & 0xFFFF for i in range(count)]
+    if pattern == "inverse":
+        return [~(start + i + pass_index) & 0xFFFF for i in range(count)]
+    if pattern == "checkerboard":
+        return [0xAAAA if (i + pass_index) % 2 == 0 else 0x5555 for i in range(count)]
+    if pattern == "walking":
+        return [1 << ((i + pass_index) % 16) for i in range(count)]
+    if pattern == "random":
+        rng = random.Random(seed + pass_index)
+        return [rng.getrandbits(16) for _ in range(count)]
+    raise ValueError(f"不支援的圖樣: {pattern}")
+
+
+def set_bits(bitmap, offset, count):
+    """將位元圖中 [offset, offset+count) 設為 1"""
+    for i in range(offset, offset + count):
+        bitmap[i >> 3] |= 1 << (i & 7)
+
+
+def bitmap_ranges(bitmap, start, count):
+    """將不符位元圖轉換為連續位址範圍列表 [(起始, 結束)]"""
+    ranges = []
+    run_start = None
+    for i in range(count):
+        bad = bitmap[i >> 3] >> (i & 7) & 1
+        if bad and run_start is None:
+            run_start = i
+        elif not bad and run_start is not None:
+            ranges.append((start + run_start, start + i - 1))
+            run_start = None
+    if run_start is not None:
+        ranges.append((start + run_start, start + count - 1))
+    return ranges
+
+
+async def _run_chunks(clients, chunks, job):
+    """將區塊輪流分配給各連線 (每個連線依序執行)，回傳各區塊結果"""
+    results = [None] * len(chunks)
+
+    async def worker(k, client):
+        for i in range(k, len(chunks), len(clients)):
+            try:
+                results[i] = await job(client, *chunks[i])
+            except (asyncio.TimeoutError, ConnectionError) as e:
+                results[i] = e
+
+    await asyncio.gather(*(worker(k, c) for k, c in enumerate(clients)))
+    return results
+
+
+async def _write_values(clients, start, values, device_id):
+    """分塊寫入，回傳失敗的區塊 [(起始, 數量, 錯誤)]"""
+    chunks = chunk_ranges(start, len(values), MAX_WRITE_REGISTERS)
+
+    async def job(client, address, count):
+        return await client.write_registers(address, values[address - start:address - start + count], device_id)
+
+    results = await _run_chunks(clients, chunks, job)
+    return [(a, n, r) for (a, n), r in zip(chunks, results) if isinstance(r, Exception) or r.isError()]
+
+
+async def _read_values(clients, start, count, device_id):
+    """分塊讀取，回傳 (數值列表 (讀取失敗為 None), 失敗的區塊)"""
+    chunks = chunk_ranges(start, count, MAX_READ_REGISTERS)
+
+    async def job(client, address, n):
+        return await client.read(3, address, n, device_id)
+
+    results = await _run_chunks(clients, chunks, job)
+    data = [None] * count
+    failed = []
+    for (address, n), result in zip(chunks, results):
+        if isinstance(result, Exception) or result.isError():
+            failed.append((address, n, result))
+            continue
+        data[address - start:address - start + n] = result.registers[:n]
+    return data, failed
+
+
+async def run_sweep(host, port, pattern="address", start=USER_DEFINE_START, end=USER_DEFINE_END,
+                    connections=1, passes=1, restore=True, seed=0, timeout=3, device_id=DEFAULT_SLAVE_ID):
+    """執行全區掃描，回傳結果 dict
+
+    restore 為 True 時先讀取原始內容，結束後寫回。
+    start/end 必須在 User Define 區 (9000-9999) 內，否則拋出 ValueError。
+    """
+    if not USER_DEFINE_START <= start <= end <= USER_DEFINE_END:
+        raise ValueError(f"掃描範圍必須在 User Define 區 {USER_DEFINE_START}-{USER_DEFINE_END} 內且起始不大於結束: "
+                         f"{start}-{end}")
+    if connections < 1:
+        raise ValueError(f"連線數必須大於 0: {connections}")
+    count = end - start + 1
+    clients = [PipelinedModbusClient(host, port, timeout=timeout, max_in_flight=1) for _ in range(connections)]
+    connected = [c for c, ok in zip(clients, await asyncio.gather(*(c.connect() for c in clients))) if ok]
+    if not connected:
+        raise ConnectionError(f"無法連線到 {host}:{port}")
+
+    bitmap = bytearray((count + 7) // 8)
+    result = {
+        "start": start, "end": end, "pattern": pattern, "passes": passes,
+        "connections": len(connected), "refused": connections - len(connected),
+        "write_time": 0.0, "read_time": 0.0, "bytes": data_bytes(3, count),
+        "errors": [], "restored": None,
+    }
+    try:
+        original = None
+        if restore:
+            original, failed = await _read_values(connected, start, count, device_id)
+            if failed:
+                raise ConnectionError(f"無法讀取原始內容 ({failed[0][0]}-{failed[0][0] + failed[0][1] - 1}): {failed[0][2]}")
+
+        for pass_index in range(passes):
+            values = make_pattern(pattern, start, count, seed, pass_index)
+
+            started = time.perf_counter()
+            failed = await _write_values(connected, start, values, device_id)
+            result["write_time"] += time.perf_counter() - started
+            for address, n, error in failed:
+                result["errors"].append(f"寫入 {address}-{address + n - 1}: {error}")
+                set_bits(bitmap, address - start, n)
+
+            started = time.perf_counter()
+            data, failed = await _read_values(connected, start, count, device_id)
+            result["read_time"] += time.perf_counter() - started
+            for address, n, error in failed:
+                result["errors"].append(f"讀取 {address}-{address + n - 1}: {error}")
+
+            for i, (expected, actual) in enumerate(zip(values, data)):
+                if expected != actual:
+                    bitmap[i >> 3] |= 1 << (i & 7)
+
+        if original is not None:
+            result["restored"] = not await _write_values(connected, start, original, device_id)
+    finally:
+        await asyncio.gather(*(c.close() for c in connected))
+
+    result["bitmap"] = bytes(bitmap)
+    result["mismatches"] = sum(bin(b).count("1") for b in bitmap)
+    result["ranges"] = bitmap_ranges(bitmap, start, count)
+    return result
+
+
+def log_sweep(log, result, max_ranges=20):
+    """輸出掃描結果，回傳是否全部相符"""
+    count = result["end"] - result["start"] + 1
+    total_bytes = result["bytes"] * result["passes"]
+    log(f"🧹 User Define 全區掃描: {result['start']}-{result['end']} ({count} registers)")
+    log(f"   圖樣: {result['pattern']}, 次數: {result['passes']}, 連線數: {result['connections']}"
+        + (f" (被拒絕 {result['refused']})" if result["refused"] else ""))
+    if result["write_time"] > 0:
+        log(f"   寫入: {result['write_time'] * 1000:.1f} ms, {total_bytes / result['write_time'] / 1024:.1f} KB/s")
+    if result["read_time"] > 0:
+        log(f"   讀取: {result['read_time'] * 1000:.1f} ms, {total_bytes / result['read_time'] / 1024:.1f} KB/s")
+    for error in result["errors"][:max_ranges]:
+        log(f"   ❌ {error}", "ERROR")
+
+    if result["mismatches"]:
+        log(f"❌ 不符位址: {result['mismatches']}/{count}", "ERROR")
+        ranges = result["ranges"]
+        text = ", ".join(f"{a}" if a == b else f"{a}-{b}" for a, b in ranges[:max_ranges])
+        more = f" ... (共 {len(ranges)} 段)" if len(ranges) > max_ranges else ""
+        log(f"   範圍: {text}{more}")
+        log(f"   位元圖: {result['bitmap'].hex()}")
+    else:
+        log(f"✅ 全部 {count} 個位址讀回相符", "SUCCESS")
+
+    if result["restored"] is True:
+        log("↩️ 已寫回原始內容")
+    elif result["restored"] is False:
+        log("⚠️ 寫回原始內容失敗", "WARNING")
+    log("─" * 50)
+    return result["mismatches"] == 0 and not result["errors"]
@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TM Robot Modbus 測試工具 - 命令列介面
+無需顯示器，供 CI 與無人站台執行測試套件與性能測試
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from modbus_engine import (
+    ModbusTestEngine, TEST_SUITES, PERF_TEST_TYPES, DATATYPES, WORD_ORDERS, DEFAULT_SLAVE_ID,
+    SNAPSHOT_READ_ITEMS, USER_DEFINE_START, USER_DEFINE_END, console_log
+)
+from read_planner import ReadItem, DEFAULT_MAX_GAP
+from suite_runner import DEFAULT_SUITE_CONCURRENCY
+from suite_file import load_suite_files, suite_step_names
+from recorder import TimeSeriesRecorder, RecordingReader, log_recording_info
+from monitor import MonitorEngine, build_groups, format_signal, log_monitor_summary, DEFAULT_MONITOR_GROUPS
+from perf_stats import PerfStats
+from connection_pool import log_pool_status
+from async_client import run_depth_sweep, log_depth_sweep, DEFAULT_DEPTHS
+from load_generator import run_fixed_rate, run_rate_sweep, log_fixed_rate, log_rate_sweep, DEFAULT_RATES
+from scale_test import (
+    run_session_ramp, log_sessions, log_session_ramp, DEFAULT_SESSION_COUNTS, DEFAULT_SESSION_MAX_DOWNTIME
+)
+from sweep import run_sweep, log_sweep, SWEEP_PATTERNS
+from connect_bench import run_connect_test, log_connect_test, DEFAULT_CONNECT_CYCLES
+from fleet import load_endpoints, poll_fleet, log_fleet_table, DEFAULT_FLEET_CONCURRENCY, DEFAULT_FLEET_ROUNDS
+
+FUNCTIONS = {
+    "01": "Coils (01)",
+    "02": "Discrete Inputs (02)",
+    "03": "Holding Registers (03)",
+    "04": "Input Registers (04)",
+}
+
+SINGLE_TESTS = {
+    "base": "test_base_coords",
+    "tool": "test_tool_coords",
+    "joint": "test_joint_angles",
+    "status": "test_robot_status",
+    "userdefine": "test_user_define_area",
+    "all": "test_all",
+}
+
+
+def build_parser():
+    """建立命令列參數解析器"""
+    parser = argparse.ArgumentParser(description="TM Robot Modbus 測試工具 (命令列版)")
+    parser.add_argument("--ip", default="127.0.0.1", help="Modbus 伺服器 IP")
+    parser.add_argument("--port", type=int, default=502, help="Modbus 伺服器 Port")
+    parser.add_argument("--timeout", type=float, default=3, help="連線逾時 (秒)")
+    parser.add_argument("--max-gap", type=int, default=DEFAULT_MAX_GAP, help="合併讀取允許的位址間隙")
+    parser.add_argument("--results-csv", help="將測試結果記錄匯出為 CSV")
+
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_test = sub.add_parser("test", help="執行預設測試")
+    p_test.add_argument("name", choices=list(SINGLE_TESTS))
+
+    p_suite = sub.add_parser("suite", help="執行測試套件")
+    p_suite.add_argument("name", nargs="?", help="套件名稱 (省略則列出所有套件)")
+    p_suite.add_argument("--file", action="append", help="套件檔 (YAML/JSON，可重複)，省略則載入目前目錄的 test_suites.yaml/.json")
+    p_suite.add_argument("--verbose", action="store_true", help="套件檔的每項檢查都輸出結果")
+    p_suite.add_argument("--concurrency", type=int, default=DEFAULT_SUITE_CONCURRENCY, help="最多同時使用的連線數 (1 為依序執行)")
+
+    p_read = sub.add_parser("read", help="自定義讀取")
+    p_read.add_argument("--function", choices=list(FUNCTIONS), default="04", help="功能碼")
+    p_read.add_argument("--address", type=int, required=True, help="起始位址")
+    p_read.add_argument("--count", type=int, default=1, help="數量")
+    p_read.add_argument("--datatype", choices=DATATYPES, default="UInt16", help="資料型別")
+    p_read.add_argument("--word-order", choices=WORD_ORDERS, default=WORD_ORDERS[0], help="32-bit 型別的位元組順序")
+    p_read.add_argument("--slave", type=int, default=DEFAULT_SLAVE_ID, help="Slave ID")
+
+    p_perf = sub.add_parser("perf", help="執行性能測試")
+    p_perf.add_argument("--type", choices=PERF_TEST_TYPES, default=PERF_TEST_TYPES[0], help="測試類型")
+    p_perf.add_argument("--count", type=int, default=100, help="測試次數")
+    p_perf.add_argument("--interval", type=int, default=0, help="測試間隔 (ms)")
+    p_perf.add_argument("--max-downtime", type=float, default=60, help="連線中斷時最多等待重新連線的秒數")
+    p_perf.add_argument("--no-restore", dest="restore", action="store_false", help="結束後不寫回工作負載寫入位址的原始內容")
+
+    p_pipe = sub.add_parser("pipeline", help="管線化性能測試 (吞吐量 vs. 管線深度)")
+    p_pipe.add_argument("--type", choices=PERF_TEST_TYPES, default=PERF_TEST_TYPES[0], help="測試類型")
+    p_pipe.add_argument("--count", type=int, default=1000, help="每個深度的測試次數")
+    p_pipe.add_argument("--depths", type=parse_int_list, default=list(DEFAULT_DEPTHS), help="管線深度列表，例如 1,2,4,8")
+    p_pipe.add_argument("--no-restore", dest="restore", action="store_false", help="結束後不寫回工作負載寫入位址的原始內容")
+
+    p_rate = sub.add_parser("rate", help="開迴路固定速率測試 (延遲自預定送出時間起算)")
+    p_rate.add_argument("--type", choices=PERF_TEST_TYPES, default=PERF_TEST_TYPES[0], help="測試類型")
+    p_rate.add_argument("--rate", type=positive_float, help="目標速率 (req/s)")
+    p_rate.add_argument("--rates", type=parse_float_list, help="速率掃描列表 (req/s)，例如 0.5,50,100,200 (尋找飽和點)")
+    p_rate.add_argument("--duration", type=positive_float, default=5, help="每個速率的測試秒數")
+    p_rate.add_argument("--depth", type=int, default=1, help="同時進行中的請求上限")
+    p_rate.add_argument("--no-restore", dest="restore", action="store_false", help="結束後不寫回工作負載寫入位址的原始內容")
+
+    p_scale = sub.add_parser("scale", help="多連線擴展測試 (總吞吐量 vs. 同時連線數)")
+    p_scale.add_argument("--type", choices=PERF_TEST_TYPES, default=PERF_TEST_TYPES[0], help="測試類型")
+    p_scale.add_argument("--count", type=int, default=100, help="每個連線的測試次數")
+    p_scale.add_argument("--interval", type=int, default=0, help="測試間隔 (ms)")
+    p_scale.add_argument("--sessions", type=parse_int_list, default=list(DEFAULT_SESSION_COUNTS), help="連線數列表，例如 1,2,4,8")
+    p_scale.add_argument("--detail", action="store_true", help="輸出每個連線的延遲表")
+    p_scale.add_argument("--max-downtime", type=float, default=DEFAULT_SESSION_MAX_DOWNTIME,
+                         help="各連線中斷時最多等待重新連線的秒數")
+    p_scale.add_argument("--no-restore", dest="restore", action="store_false", help="結束後不寫回工作負載寫入位址的原始內容")
+
+    p_connect = sub.add_parser("connect", help="短連線測試 (連線 → 讀取 → 關閉，分別統計連線與首次回應時間)")
+    p_connect.add_argument("--type", choices=PERF_TEST_TYPES, default=PERF_TEST_TYPES[0], help="每次連線執行的工作負載")
+    p_connect.add_argument("--cycles", type=int, default=DEFAULT_CONNECT_CYCLES, help="測試輪數")
+    p_connect.add_argument("--storm", type=int, default=1, help="每輪同時建立的連線數 (連線風暴)")
+    p_connect.add_argument("--reads", type=int, default=1, help="每個連線執行的工作負載次數 (第 2 次起計為穩態延遲)")
+    p_connect.add_argument("--interval", type=int, default=0, help="每輪間隔 (ms)")
+    p_connect.add_argument("--no-restore", dest="restore", action="store_false", help="結束後不寫回工作負載寫入位址的原始內容")
+
+    p_sweep = sub.add_parser("sweep", help="User Define 全區寫入/讀回掃描 (完整性與吞吐量)")
+    p_sweep.add_argument("--pattern", choices=SWEEP_PATTERNS, default=SWEEP_PATTERNS[0], help="測試圖樣")
+    p_sweep.add_argument("--passes", type=int, default=1, help="掃描次數 (每次圖樣位移)")
+    p_sweep.add_argument("--connections", type=int, default=1, help="同時使用的連線數 (區塊輪流分配)")
+    p_sweep.add_argument("--seed", type=int, default=0, help="random 圖樣的亂數種子")
+    p_sweep.add_argument("--start", type=int, default=USER_DEFINE_START, help="起始位址")
+    p_sweep.add_argument("--end", type=int, default=USER_DEFINE_END, help="結束位址")
+    p_sweep.add_argument("--no-restore", dest="restore", action="store_false", help="結束後不寫回原始內容")
+
+    p_record = sub.add_parser("record", help="以固定頻率輪詢並記錄到時間序列檔")
+    p_record.add_argument("--output", required=True, help="記錄檔路徑 (.tmrec)")
+    p_record.add_argument("--rate", type=positive_float, default=50, help="輪詢頻率 (Hz)")
+    p_record.add_argument("--duration", type=positive_float, default=60, help="記錄秒數")
+    p_record.add_argument("--user-count", type=int, default=0, help="一併記錄 User Define 區 (9000 起) 的 register 數")
+
+    p_monitor = sub.add_parser("monitor", help="多頻率連續監控 (只輸出變化的數值)")
+    p_monitor.add_argument("--duration", type=float, default=10, help="監控秒數")
+    p_monitor.add_argument("--coord-rate", type=float, default=DEFAULT_MONITOR_GROUPS[0]["rate"], help="座標輪詢頻率 (Hz)")
+    p_monitor.add_argument("--status-rate", type=float, default=DEFAULT_MONITOR_GROUPS[1]["rate"], help="狀態輪詢頻率 (Hz)")
+    p_monitor.add_argument("--deadband", type=float, default=DEFAULT_MONITOR_GROUPS[0]["deadband"], help="座標變化死區")
+    p_monitor.add_argument("--config", help="監控群組設定檔 (JSON 列表或含 monitor 欄位的物件)，指定時忽略上述頻率參數")
+    p_monitor.add_argument("--output", help="同時將變化的數值記錄到時間序列檔 (.tmrec)")
+
+    p_replay = sub.add_parser("replay", help="讀取時間序列記錄檔")
+    p_replay.add_argument("file", help="記錄檔路徑")
+    p_replay.add_argument("--start", type=float, help="起始時間 (秒，自記錄開始起算)")
+    p_replay.add_argument("--end", type=float, help="結束時間 (秒)")
+    p_replay.add_argument("--signal", action="append", help="只讀取指定訊號 (可重複)")
+    p_replay.add_argument("--csv", help="匯出為 CSV (省略則輸出到畫面)")
+
+    p_fleet = sub.add_parser("fleet", help="併行輪詢多台 Robot")
+    p_fleet.add_argument("--file", help="端點檔案 (JSON 或每行 ip[:port] [名稱])，省略則讀取設定檔的 fleet 欄位")
+    p_fleet.add_argument("--rounds", type=int, default=DEFAULT_FLEET_ROUNDS, help="每台輪詢次數")
+    p_fleet.add_argument("--concurrency", type=int, default=DEFAULT_FLEET_CONCURRENCY, help="最大同時輪詢台數")
+    p_fleet.add_argument("--depth", type=int, default=1, help="每台連線的管線深度")
+
+    return parser
+
+
+def parse_int_list(value):
+    """解析以逗號分隔的正整數列表"""
+    try:
+        numbers = [int(v) for v in value.split(",") if v.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"無效的整數列表: {value}")
+    if not numbers or min(numbers) < 1:
+        raise argparse.ArgumentTypeError(f"數值必須大於 0: {value}")
+    return numbers
+
+
+def positive_float(value):
+    """解析正數"""
+    try:
+        number = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"無效的數值: {value}")
+    if not 0 < number < float("inf"):
+        raise argparse.ArgumentTypeError(f"數值必須大於 0: {value}")
+    return number
+
+
+def parse_float_list(value):
+    """解析以逗號分隔的正數列表"""
+    try:
+        numbers = [float(v) for v in value.split(",") if v.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"無效的數值列表: {value}")
+    if not numbers or min(numbers) <= 0:
+        raise argparse.ArgumentTypeError(f"數值必須大於 0: {value}")
+    return numbers
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    suites = None
+    if args.command == "suite":
+        plans, errors = load_suite_files(args.file, args.max_gap)
+        for path, error in errors:
+            print(f"載入套件檔失敗 {path}: {error}", file=sys.stderr)
+        if errors:
+            return 2
+        suites = dict(TEST_SUITES, **plans)
+        if not args.name:
+            for name, suite in suites.items():
+                print(f"{name}: {', '.join(suite_step_names(suite))}")
+            return 0
+
+    if args.command == "pipeline":
+        return run_pipeline(args)
+    if args.command == "fleet":
+        return run_fleet(args)
+    if args.command == "rate":
+        return run_rate(args)
+    if args.command == "scale":
+        return run_scale(args)
+    if args.command == "sweep":
+        return run_sweep_command(args)
+    if args.command == "connect":
+        return run_connect(args)
+    if args.command == "replay":
+        return run_replay(args)
+
+    engine = ModbusTestEngine(max_gap=args.max_gap)
+    engine.log(f"🔌 正在連線到 {args.ip}:{args.port}...")
+    if not engine.connect(args.ip, args.port, timeout=args.timeout):
+        engine.log("🔌 連線失敗", "ERROR")
+        return 2
+    engine.log(f"🔌 連線成功: {args.ip}:{args.port}", "SUCCESS")
+
+    try:
+        if args.command == "test":
+            result = engine.run_named_test(SINGLE_TESTS[args.name])
+            ok = result is not None and result is not False
+        elif args.command == "suite":
+            suite = suites.get(args.name)
+            if hasattr(suite, "run"):
+                outcome = suite.run(engine, verbose=args.verbose)
+            else:
+                outcome = engine.run_test_suite(args.name, suites, concurrency=args.concurrency)
+            ok = outcome is not None and outcome[1] == 0
+        elif args.command == "read":
+            values = engine.execute_user_define_test(
+                FUNCTIONS[args.function], args.address, args.count, args.datatype,
+                slave_id=args.slave, test_name="CLI Read", word_order=args.word_order
+            )
+            ok = values is not None
+        elif args.command == "record":
+            ok = run_record(engine, args)
+        elif args.command == "monitor":
+            ok = run_monitor(engine, args)
+        else:
+            perf_stats = engine.run_performance_test(
+                args.type, args.count, args.interval, stats=PerfStats(retain_samples=False),
+                max_downtime=args.max_downtime, restore=args.restore
+            )
+            stats = engine.report_performance(args.type, args.interval, perf_stats)
+            log_pool_status(engine.log, engine.pool)
+            ok = stats is not None and stats["success_rate"] == 100
+    finally:
+        engine.disconnect()
+        if args.results_csv:
+            count = engine.results.export_csv(args.results_csv)
+            engine.log(f"📊 測試結果已匯出: {args.results_csv} ({count} 筆)", "SUCCESS")
+        engine.results.close()
+
+    return 0 if ok else 1
+
+
+def run_record(engine, args):
+    """以固定頻率輪詢快照並記錄 (依單調時鐘排程，不累積漂移)"""
+    items = list(SNAPSHOT_READ_ITEMS)
+    if args.user_count > 0:
+        items.append(ReadItem("User Define", 3, USER_DEFINE_START, args.user_count))
+    period_ns = int(1_000_000_000 / args.rate)
+    total = int(args.rate * args.duration)
+    missed = 0
+
+    engine.log(f"📼 開始記錄: {args.output} ({args.rate} Hz, {args.duration} 秒)")
+    with TimeSeriesRecorder(args.output) as recorder:
+        engine.recorder = recorder
+        start_ns = time.monotonic_ns()
+        for i in range(total):
+            delay_ns = start_ns + i * period_ns - time.monotonic_ns()
+            if delay_ns > 0:
+                time.sleep(delay_ns / 1_000_000_000)
+            elif delay_ns < -period_ns:
+                missed += 1  # 落後超過一個週期
+            engine.read_items(items)
+        engine.recorder = None
+
+    with RecordingReader(args.output) as reader:
+        log_recording_info(engine.log, reader)
+    if missed:
+        engine.log(f"⚠️ {missed} 次輪詢落後超過一個週期 (頻率過高或控制器回應過慢)", "WARNING")
+    engine.log("─" * 50)
+    return recorder.sample_count > 0
+
+
+def load_monitor_config(args):
+    """依命令列參數或設定檔建立監控群組設定"""
+    if args.config:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data.get("monitor", []) if isinstance(data, dict) else data
+    coords, status = (dict(g) for g in DEFAULT_MONITOR_GROUPS)
+    coords.update(rate=args.coord_rate, deadband=args.deadband)
+    status.update(rate=args.status_rate)
+    return [coords, status]
+
+
+def run_monitor(engine, args):
+    """執行多頻率連續監控"""
+    try:
+        groups = build_groups(load_monitor_config(args), engine.max_gap)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        engine.log(f"❌ 監控設定錯誤: {e}", "ERROR")
+        return False
+
+    monitor = MonitorEngine(
+        engine, groups,
+        on_change=lambda name, values, _: engine.log(f"🔄 {format_signal(name, values)}"),
+        on_error=lambda message: engine.log(f"🔄 監控錯誤: {message}", "ERROR")
+    )
+    rates = ", ".join(f"{g['name']} {g['rate']:g} Hz" for g in groups)
+    engine.log(f"🔁 開始連續監控 ({rates})，{args.duration} 秒...")
+
+    recorder = TimeSeriesRecorder(args.output) if args.output else None
+    engine.recorder = recorder
+    try:
+        monitor.run(lambda: True, duration=args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.recorder = None
+        if recorder is not None:
+            recorder.close()
+            engine.log(f"📼 已記錄 {recorder.sample_count} 筆變化到 {args.output}", "SUCCESS")
+
+    log_monitor_summary(engine.log, monitor)
+    return all(g["errors"] == 0 for g in groups)
+
+
+def run_replay(args):
+    """讀取時間序列記錄檔"""
+    log = console_log
+    try:
+        reader = RecordingReader(args.file)
+    except (OSError, ValueError) as e:
+        log(f"❌ 無法開啟記錄檔: {e}", "ERROR")
+        return 2
+
+    with reader:
+        log_recording_info(log, reader)
+        if args.csv:
+            rows = reader.export_csv(args.csv, args.start, args.end, args.signal)
+            log(f"📊 已匯出 {rows} 筆到 {args.csv}", "SUCCESS")
+        else:
+            for t, name, values in reader.read(args.start, args.end, args.signal):
+                print(f"{t:12.6f}  {name}: {list(values)}")
+    return 0
+
+
+def run_pipeline(args):
+    """執行管線化性能測試"""
+    log = console_log
+    log(f"🚀 管線化性能測試: {args.type}, 每個深度 {args.count} 次, 深度 {args.depths}")
+    try:
+        rows = asyncio.run(run_depth_sweep(args.ip, args.port, args.type, args.count, args.depths, args.timeout,
+                                           args.restore))
+    except (ConnectionError, ValueError) as e:
+        log(f"🔌 {e}", "ERROR")
+        return 2
+    log_depth_sweep(log, args.type, rows)
+    return 0 if all(r["count"] and r["success_rate"] == 100 for r in rows) else 1
+
+
+def run_rate(args):
+    """執行開迴路固定速率測試或速率掃描"""
+    log = console_log
+    try:
+        if args.rate:
+            log(f"🚀 固定速率測試: {args.type}, {args.rate} req/s, {args.duration} 秒")
+            result = asyncio.run(run_fixed_rate(
+                args.ip, args.port, args.type, args.rate, max(1, int(args.rate * args.duration)),
+                args.depth, args.timeout, restore=args.restore
+            ))
+            log_fixed_rate(log, result)
+            return 0 if result["latency"] and result["latency"]["success_rate"] == 100 else 1
+
+        rates = args.rates or list(DEFAULT_RATES)
+        log(f"🚀 速率掃描: {args.type}, 速率 {rates} req/s, 每個 {args.duration} 秒")
+        rows = asyncio.run(run_rate_sweep(
+            args.ip, args.port, args.type, rates, args.duration, args.depth, args.timeout, args.restore
+        ))
+    except (ConnectionError, ValueError) as e:
+        log(f"🔌 {e}", "ERROR")
+        return 2
+    log_rate_sweep(log, args.type, rows)
+    return 0
+
+
+def run_scale(args):
+    """執行多連線擴展測試"""
+    log = console_log
+    log(f"🚀 多連線擴展測試: {args.type}, 每個連線 {args.count} 次, 連線數 {args.sessions}")
+    try:
+        results = run_session_ramp(
+            args.ip, args.port, args.type, args.sessions, args.count, args.interval, args.timeout, args.restore,
+            args.max_downtime
+        )
+    except (ConnectionError, ValueError) as e:
+        log(f"🔌 {e}", "ERROR")
+        return 2
+    if args.detail:
+        for result in results:
+            log_sessions(log, result)
+    log_session_ramp(log, args.type, results)
+    return 0 if any(r["connected"] for r in results) else 2
+
+
+def run_connect(args):
+    """執行短連線 (連線建立延遲) 測試"""
+    log = console_log
+    log(f"🚀 短連線測試: {args.type}, {args.cycles} 輪, 每輪 {args.storm} 個連線, 每個連線 {args.reads} 次")
+    try:
+        result = asyncio.run(run_connect_test(
+            args.ip, args.port, args.type, args.cycles, args.storm, args.reads, args.interval, args.timeout,
+            restore=args.restore
+        ))
+    except (ConnectionError, ValueError) as e:
+        log(f"🔌 {e}", "ERROR")
+        return 2
+    if not result["connect"]:
+        log(f"🔌 無法連線到 {args.ip}:{args.port}", "ERROR")
+        return 2
+    return 0 if log_connect_test(log, result) else 1
+
+
+def run_sweep_command(args):
+    """執行 User Define 全區掃描"""
+    log = console_log
+    try:
+        result = asyncio.run(run_sweep(
+            args.ip, args.port, args.pattern, args.start, args.end, args.connections,
+            args.passes, args.restore, args.seed, args.timeout
+        ))
+    except (ConnectionError, ValueError) as e:
+        log(f"🔌 {e}", "ERROR")
+        return 2
+    return 0 if log_sweep(log, result) else 1
+
+
+def run_fleet(args):
+    """併行輪詢多台 Robot"""
+    log = console_log
+    try:
+        endpoints = load_endpoints(args.file)
+    except (OSError, ValueError, KeyError) as e:
+        log(f"❌ 載入端點失敗: {e}", "ERROR")
+        return 2
+    if not endpoints:
+        log("❌ 沒有任何 Robot 端點 (請使用 --file 或在設定檔加入 fleet 欄位)", "ERROR")
+        return 2
+
+    log(f"🏭 開始輪詢 {len(endpoints)} 台 Robot (每台 {args.rounds} 次, 併行 {args.concurrency})...")
+    rows, elapsed = asyncio.run(poll_fleet(
+        endpoints, args.rounds, args.concurrency, args.timeout, args.max_gap, args.depth
+    ))
+    passed = log_fleet_table(log, rows, elapsed)
+    return 0 if passed == len(rows) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
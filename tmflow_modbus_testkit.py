@@ -7,25 +7,40 @@ TM Robot 座標測試 GUI
 
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, filedialog
-from pymodbus.client import ModbusTcpClient
-import struct
 import threading
-import time
+import asyncio
+import queue
 from datetime import datetime
 import json
 import os
-import csv
+
+from modbus_engine import (
+    ModbusTestEngine, TEST_SUITES, PERF_TEST_TYPES, DATATYPES, WORD_ORDERS, DEFAULT_WORD_ORDER,
+    convert_registers, format_coordinates, format_log_line, check_perf_concurrency
+)
+from perf_stats import PerfStats
+from async_client import run_pipelined_test
+from recorder import TimeSeriesRecorder, RECORDING_EXTENSION
+from suite_file import load_suite_files, suite_step_names
+from monitor import MonitorEngine, build_groups, format_signal, log_monitor_summary
+from connection_pool import log_pool_status
 
 class TMRobotTestGUI:
     VERSION = "v1.0.2.0003"  # 版本號
+    PERF_REFRESH_MS = 100  # 性能測試畫面刷新間隔 (10 Hz)
+    LOG_FLUSH_MS = 50  # 日誌批次寫入間隔
+    LOG_MAX_LINES = 5000  # 日誌區域保留的最大行數
     
     def __init__(self, root):
         self.root = root
         self.root.title(f"🤖 TM Robot 座標測試工具 {self.VERSION}")
         self.root.geometry("1100x800")
         
-        self.client = None
-        self.is_connected = False
+        # 日誌佇列 (任何執行緒皆可寫入，由 Tk 主迴圈批次取出)
+        self.log_queue = queue.Queue()
+        
+        # 測試引擎 (所有 Modbus 操作皆透過引擎執行)
+        self.engine = ModbusTestEngine(log=self.log)
         
         # 設定檔路徑
         self.config_file = "testkit_config.json"
@@ -34,11 +49,24 @@ class TMRobotTestGUI:
         # 測試套件
         self.test_suites = self.load_test_suites()
         
-        # 測試結果記錄
-        self.test_results_history = []
-        
         self.setup_ui()
         self.setup_keyboard_shortcuts()
+        self.root.after(self.LOG_FLUSH_MS, self.drain_log_queue)
+    
+    @property
+    def test_results_history(self):
+        """測試結果記錄 (ResultStore)"""
+        return self.engine.results
+    
+    @property
+    def client(self):
+        """目前的 Modbus 客戶端"""
+        return self.engine.client
+    
+    @property
+    def is_connected(self):
+        """是否已連線"""
+        return self.engine.is_connected
         
     def validate_number(self, value):
         """驗證輸入是否為有效數字"""
@@ -102,32 +130,13 @@ class TMRobotTestGUI:
         self.save_config()
     
     def load_test_suites(self):
-        """載入測試套件定義"""
-        return {
-            "基本功能測試": [
-                {"name": "Robot Link", "func": "test_robot_status"},
-                {"name": "Base 座標", "func": "test_base_coords"},
-                {"name": "Joint 角度", "func": "test_joint_angles"}
-            ],
-            "完整座標測試": [
-                {"name": "Base 座標", "func": "test_base_coords"},
-                {"name": "Tool 座標", "func": "test_tool_coords"},
-                {"name": "Joint 角度", "func": "test_joint_angles"}
-            ],
-            "狀態檢查": [
-                {"name": "Robot 狀態", "func": "test_robot_status"}
-            ],
-            "User Define 測試": [
-                {"name": "User Define Area", "func": "test_user_define_area"}
-            ],
-            "全功能測試": [
-                {"name": "Base 座標", "func": "test_base_coords"},
-                {"name": "Tool 座標", "func": "test_tool_coords"},
-                {"name": "Joint 角度", "func": "test_joint_angles"},
-                {"name": "Robot 狀態", "func": "test_robot_status"},
-                {"name": "User Define Area", "func": "test_user_define_area"}
-            ]
-        }
+        """載入測試套件定義 (內建套件 + 套件檔，路徑可在設定檔的 suite_files 欄位指定)"""
+        suites = dict(TEST_SUITES)
+        plans, errors = load_suite_files(self.config.get("suite_files"))
+        suites.update(plans)
+        for path, error in errors:
+            self.log(f"📦 載入套件檔失敗 {path}: {error}", "ERROR")
+        return suites
     
     def setup_keyboard_shortcuts(self):
         """設定鍵盤快捷鍵"""
@@ -230,6 +239,8 @@ class TMRobotTestGUI:
         ttk.Button(btn_frame3, text="🗑️ 清除 (Ctrl+L)", command=self.clear_log, width=15).pack(side="left", padx=2)
         ttk.Button(btn_frame3, text="💾 儲存 (Ctrl+S)", command=self.save_log, width=15).pack(side="left", padx=2)
         ttk.Button(btn_frame3, text="📊 匯出 CSV", command=self.export_results_csv, width=12).pack(side="left", padx=2)
+        self.record_btn = ttk.Button(btn_frame3, text="📼 開始記錄", command=self.toggle_recording, width=12)
+        self.record_btn.pack(side="left", padx=2)
         
         # === 測試套件區域 ===
         suite_frame = ttk.LabelFrame(left_frame, text="📦 測試套件", padding="10")
@@ -276,8 +287,14 @@ class TMRobotTestGUI:
         ttk.Label(user_frame, text="資料型別:").grid(row=3, column=0, sticky="w", pady=2)
         self.datatype_var = tk.StringVar(value="Float32")
         datatype_combo = ttk.Combobox(user_frame, textvariable=self.datatype_var, width=15, state="readonly")
-        datatype_combo['values'] = ("Bool", "Int16", "UInt16", "Int32", "UInt32", "Float32", "Raw")
-        datatype_combo.grid(row=3, column=1, columnspan=2, sticky="ew", padx=5, pady=2)
+        datatype_combo['values'] = DATATYPES
+        datatype_combo.grid(row=3, column=1, sticky="ew", padx=5, pady=2)
+        
+        # 32-bit 型別的位元組順序
+        self.word_order_var = tk.StringVar(value=DEFAULT_WORD_ORDER)
+        word_order_combo = ttk.Combobox(user_frame, textvariable=self.word_order_var, width=6, state="readonly")
+        word_order_combo['values'] = WORD_ORDERS
+        word_order_combo.grid(row=3, column=2, sticky="w", padx=5, pady=2)
         
         # Slave ID
         ttk.Label(user_frame, text="Slave ID:").grid(row=4, column=0, sticky="w", pady=2)
@@ -325,7 +342,7 @@ class TMRobotTestGUI:
         ttk.Label(perf_frame, text="測試類型:").grid(row=0, column=0, sticky="w", pady=2)
         self.perf_test_var = tk.StringVar(value="Base座標讀取")
         perf_combo = ttk.Combobox(perf_frame, textvariable=self.perf_test_var, width=18, state="readonly")
-        perf_combo['values'] = ("Base座標讀取", "Tool座標讀取", "Joint角度讀取", "Robot狀態讀取", "User Define讀取", "User Define寫入", "User Define讀寫", "混合測試", "極限測試")
+        perf_combo['values'] = PERF_TEST_TYPES
         perf_combo.grid(row=0, column=1, columnspan=2, sticky="ew", padx=5, pady=2)
         
         # 測試次數
@@ -374,9 +391,20 @@ class TMRobotTestGUI:
                            command=lambda v=value: self.test_interval_var.set(v))
             btn.pack(side="left", padx=1)
         
+        # 管線深度 (同時未完成的請求數，1 = 同步模式)
+        ttk.Label(perf_frame, text="管線深度:").grid(row=3, column=0, sticky="w", pady=2)
+        self.pipeline_depth_var = tk.StringVar(value="1")
+        depth_combo = ttk.Combobox(perf_frame, textvariable=self.pipeline_depth_var, width=6)
+        depth_combo['values'] = ("1", "2", "4", "8", "16", "32")
+        depth_combo.grid(row=3, column=1, sticky="w", padx=5, pady=2)
+        
+        # 保留逐筆樣本 (關閉後僅保留直方圖統計，大量測試時記憶體不會持續成長)
+        self.retain_samples_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(perf_frame, text="保留逐筆樣本", variable=self.retain_samples_var).grid(row=3, column=2, sticky="w", pady=2)
+        
         # 控制按鈕
         perf_btn_frame = ttk.Frame(perf_frame)
-        perf_btn_frame.grid(row=3, column=0, columnspan=3, pady=10)
+        perf_btn_frame.grid(row=4, column=0, columnspan=3, pady=10)
         
         self.start_perf_btn = ttk.Button(perf_btn_frame, text="🚀 開始測試", command=self.start_performance_test, width=12)
         self.start_perf_btn.pack(side="left", padx=2)
@@ -386,7 +414,7 @@ class TMRobotTestGUI:
         
         # 即時結果顯示
         result_frame = ttk.LabelFrame(perf_frame, text="📊 即時結果", padding="5")
-        result_frame.grid(row=4, column=0, columnspan=3, sticky="ew", pady=(10,0))
+        result_frame.grid(row=5, column=0, columnspan=3, sticky="ew", pady=(10,0))
         
         # 進度條
         ttk.Label(result_frame, text="進度:").grid(row=0, column=0, sticky="w")
@@ -422,7 +450,8 @@ class TMRobotTestGUI:
         # 性能測試相關變數
         self.perf_testing = False
         self.perf_thread = None
-        self.perf_results = []
+        self.perf_stats = PerfStats()
+        self.perf_total = 0
         
         # 設定權重
         perf_frame.columnconfigure(1, weight=1)
@@ -444,33 +473,44 @@ class TMRobotTestGUI:
         # 監控相關變數
         self.monitoring = False
         self.monitor_thread = None
+        self.monitor_engine = None
         
         # 初始化日誌
         self.log(f"🚀 TM Robot 座標測試工具 {self.VERSION} 已啟動")
         self.log("📝 請先連線到 Modbus 設備，然後選擇測試項目")
         
     def log(self, message, level="INFO"):
-        """記錄日誌"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        
-        # 根據等級添加圖示
-        if level == "ERROR":
-            icon = "❌"
-        elif level == "SUCCESS":
-            icon = "✅"
-        elif level == "WARNING":
-            icon = "⚠️"
-        else:
-            icon = "ℹ️"
-            
-        log_entry = f"[{timestamp}] {icon} {message}\n"
+        """記錄日誌 (執行緒安全，僅放入佇列)"""
+        self.log_queue.put(format_log_line(message, level) + "\n")
+    
+    def flush_log(self):
+        """將佇列中的日誌一次寫入文字區域 (僅限主執行緒呼叫)"""
+        lines = []
+        try:
+            while True:
+                lines.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if not lines:
+            return
         
-        self.log_text.insert(tk.END, log_entry)
+        # 超過上限的舊行寫入後也會被刪除，直接略過
+        self.log_text.insert(tk.END, "".join(lines[-self.LOG_MAX_LINES:]))
+        
+        # 限制總行數
+        line_count = int(self.log_text.index("end-1c").split(".")[0])
+        if line_count > self.LOG_MAX_LINES:
+            self.log_text.delete(1.0, f"{line_count - self.LOG_MAX_LINES + 1}.0")
         self.log_text.see(tk.END)
-        self.root.update()
+    
+    def drain_log_queue(self):
+        """定時批次寫入日誌"""
+        self.flush_log()
+        self.root.after(self.LOG_FLUSH_MS, self.drain_log_queue)
         
     def clear_log(self):
         """清除日誌"""
+        self.flush_log()
         self.log_text.delete(1.0, tk.END)
         self.log("🗑️ 日誌已清除")
         
@@ -480,6 +520,7 @@ class TMRobotTestGUI:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"tm_robot_test_log_{timestamp}.txt"
             
+            self.flush_log()
             with open(filename, 'w', encoding='utf-8') as f:
                 f.write(self.log_text.get(1.0, tk.END))
                 
@@ -488,6 +529,32 @@ class TMRobotTestGUI:
         except Exception as e:
             self.log(f"💾 儲存日誌失敗: {e}", "ERROR")
         
+    def toggle_recording(self):
+        """切換時間序列記錄 (記錄所有輪詢到的座標/狀態數值)"""
+        recorder = self.engine.recorder
+        if recorder is not None:
+            self.engine.recorder = None
+            recorder.close()
+            self.record_btn.config(text="📼 開始記錄")
+            self.log(f"📼 記錄已停止: {recorder.path} ({recorder.sample_count} 筆)", "SUCCESS")
+            return
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = filedialog.asksaveasfilename(
+            defaultextension=RECORDING_EXTENSION,
+            initialfile=f"tm_robot_record_{timestamp}{RECORDING_EXTENSION}",
+            filetypes=[("Recording files", f"*{RECORDING_EXTENSION}"), ("All files", "*.*")]
+        )
+        if not filename:
+            return
+        try:
+            self.engine.recorder = TimeSeriesRecorder(filename)
+        except OSError as e:
+            self.log(f"📼 無法建立記錄檔: {e}", "ERROR")
+            return
+        self.record_btn.config(text="⏹️ 停止記錄")
+        self.log(f"📼 開始記錄: {filename}", "SUCCESS")
+
     def toggle_connection(self):
         """切換連線/斷線狀態"""
         if self.is_connected:
@@ -517,11 +584,10 @@ class TMRobotTestGUI:
             # 更新為連線中狀態
             self.update_connection_button('connecting')
             self.log(f"🔌 正在連線到 {ip}:{port}...")
+            self.flush_log()
             self.root.update()  # 強制更新 GUI
             
-            self.client = ModbusTcpClient(ip, port=port, timeout=3)
-            if self.client.connect():
-                self.is_connected = True
+            if self.engine.connect(ip, port, timeout=3):
                 self.update_connection_button('connected')
                 self.log(f"🔌 連線成功: {ip}:{port}", "SUCCESS")
                 self.status_var.set(f"🟢 已連線: {ip}:{port}")
@@ -534,13 +600,12 @@ class TMRobotTestGUI:
                 # 更新 IP 下拉選單
                 self.ip_combo['values'] = self.config["ip_history"]
             else:
-                self.is_connected = False
                 self.update_connection_button('disconnected')
                 self.log("🔌 連線失敗", "ERROR")
                 messagebox.showerror("連線失敗", f"無法連線到 {ip}:{port}\n\n請檢查：\n1. TMflow 是否正在運行\n2. Modbus TCP Server 是否已啟用\n3. IP 位址和 Port 是否正確\n4. 網路連線是否正常")
                 
         except Exception as e:
-            self.is_connected = False
+            self.engine.disconnect()
             self.update_connection_button('disconnected')
             self.log(f"🔌 連線錯誤: {e}", "ERROR")
             messagebox.showerror("連線錯誤", f"連線時發生錯誤：\n{str(e)}\n\n請檢查網路設定和防火牆")
@@ -549,201 +614,68 @@ class TMRobotTestGUI:
         """斷線"""
         if self.monitoring:
             self.toggle_monitoring()  # 停止監控
+        if self.engine.recorder is not None:
+            self.toggle_recording()  # 停止記錄
             
-        if self.client:
-            self.client.close()
-            
-        self.is_connected = False
+        self.engine.disconnect()
         self.update_connection_button('disconnected')
         self.log("🔌 已斷線")
         
     def read_coordinates(self, start_addr, coord_type, count=12):
         """讀取座標數據"""
-        if not self.is_connected:
-            self.log("❌ 請先連線", "ERROR")
-            return None
-            
-        try:
-            self.log(f"📍 讀取 {coord_type} (位址 {start_addr}-{start_addr+count-1})...")
-            
-            result = self.client.read_input_registers(start_addr, count=count, device_id=1)
-            
-            if result.isError():
-                self.log(f"📍 讀取失敗: {result}", "ERROR")
-                return None
-                
-            registers = result.registers
-            self.log(f"📊 原始數據: {registers}")
-            
-            # 轉換為 Float32
-            coords = []
-            for i in range(0, len(registers), 2):
-                if i + 1 < len(registers):
-                    float_val = struct.unpack('>f', struct.pack('>HH', registers[i], registers[i+1]))[0]
-                    coords.append(float_val)
-                    
-            # 格式化顯示
-            self.log(f"✅ {coord_type}:", "SUCCESS")
-            
-            if coord_type == "Joint 角度":
-                for i, angle in enumerate(coords[:6], 1):
-                    self.log(f"   Joint {i}: {angle:8.3f}°")
-            else:
-                if len(coords) >= 6:
-                    self.log(f"   X:  {coords[0]:8.3f} mm")
-                    self.log(f"   Y:  {coords[1]:8.3f} mm") 
-                    self.log(f"   Z:  {coords[2]:8.3f} mm")
-                    self.log(f"   Rx: {coords[3]:8.3f}°")
-                    self.log(f"   Ry: {coords[4]:8.3f}°")
-                    self.log(f"   Rz: {coords[5]:8.3f}°")
-                else:
-                    self.log(f"   數據: {coords}")
-                    
-            self.log("─" * 50)
-            return coords
-            
-        except Exception as e:
-            self.log(f"📍 讀取錯誤: {e}", "ERROR")
-            return None
+        return self.engine.read_coordinates(start_addr, coord_type, count)
             
     def read_robot_status(self):
         """讀取 Robot 狀態"""
-        if not self.is_connected:
-            self.log("❌ 請先連線", "ERROR")
-            return
-            
-        try:
-            self.log("📊 讀取 Robot 狀態...")
-            
-            # 讀取 Discrete Inputs
-            di_addrs = [7200, 7201, 7202, 7208]
-            di_names = ["Robot Link", "Error", "Project Running", "ESTOP"]
-            
-            for addr, name in zip(di_addrs, di_names):
-                result = self.client.read_discrete_inputs(addr, count=1, device_id=1)
-                if not result.isError():
-                    value = result.bits[0]
-                    status = "🟢 True" if value else "🔴 False"
-                    self.log(f"   {name} ({addr}): {status}")
-                    
-            # 讀取 Input Registers
-            ir_addrs = [7215, 7216]
-            ir_names = ["Robot State", "Operation Mode"]
-            
-            for addr, name in zip(ir_addrs, ir_names):
-                result = self.client.read_input_registers(addr, count=1, device_id=1)
-                if not result.isError():
-                    value = result.registers[0]
-                    self.log(f"   {name} ({addr}): {value}")
-                    
-            self.log("✅ Robot 狀態讀取完成", "SUCCESS")
-            self.log("─" * 50)
-            
-        except Exception as e:
-            self.log(f"📊 狀態讀取錯誤: {e}", "ERROR")
+        return self.engine.read_robot_status()
             
     def test_base_coords(self):
         """測試 Base 座標"""
-        self.read_coordinates(7001, "Base 座標")
+        return self.engine.run_named_test("test_base_coords")
         
     def test_tool_coords(self):
         """測試 Tool 座標"""  
-        self.read_coordinates(7025, "Tool 座標")
+        return self.engine.run_named_test("test_tool_coords")
         
     def test_joint_angles(self):
         """測試 Joint 角度"""
-        self.read_coordinates(7013, "Joint 角度")
+        return self.engine.run_named_test("test_joint_angles")
         
     def test_robot_status(self):
         """測試 Robot 狀態"""
-        self.read_robot_status()
+        return self.engine.run_named_test("test_robot_status")
         
     def test_user_define_area(self):
         """測試 TM Robot User Define Area (9000-9999)"""
-        if not self.is_connected:
-            self.log("❌ 請先連線", "ERROR")
-            return
-            
-        self.log("👤 測試 TM Robot User Define Area...")
-        self.log("📍 位址範圍: 9000-9999 (User-define)")
-        
-        # 測試幾個 User Define 位址
-        test_addresses = [9000, 9001, 9002, 9010, 9020, 9100]
-        
-        for addr in test_addresses:
-            try:
-                # 嘗試讀取 Holding Registers (功能碼 03)
-                result = self.client.read_holding_registers(addr, count=1, device_id=1)
-                
-                if result.isError():
-                    self.log(f"   位址 {addr}: ❌ 讀取失敗 - {result}")
-                else:
-                    value = result.registers[0]
-                    self.log(f"   位址 {addr}: ✅ 值 = {value} (0x{value:04X})")
-                    
-            except Exception as e:
-                self.log(f"   位址 {addr}: ❌ 錯誤 - {e}")
-        
-        # 測試寫入功能 (如果支援)
-        self.log("\n📝 測試 User Define Area 寫入功能...")
-        test_write_addr = 9000
-        test_value = 12345
-        
-        try:
-            # 寫入測試值
-            write_result = self.client.write_register(test_write_addr, test_value, device_id=1)
-            
-            if write_result.isError():
-                self.log(f"   寫入位址 {test_write_addr}: ❌ 失敗 - {write_result}")
-            else:
-                self.log(f"   寫入位址 {test_write_addr}: ✅ 成功寫入 {test_value}")
-                
-                # 讀回驗證
-                read_result = self.client.read_holding_registers(test_write_addr, count=1, device_id=1)
-                if not read_result.isError():
-                    read_value = read_result.registers[0]
-                    if read_value == test_value:
-                        self.log(f"   驗證讀取: ✅ 值匹配 = {read_value}")
-                    else:
-                        self.log(f"   驗證讀取: ⚠️ 值不匹配 = {read_value} (預期: {test_value})")
-                        
-        except Exception as e:
-            self.log(f"   寫入測試錯誤: {e}")
-        
-        self.log("✅ User Define Area 測試完成", "SUCCESS")
-        self.log("─" * 50)
+        return self.engine.run_named_test("test_user_define_area")
         
     def test_all(self):
         """測試所有項目"""
-        if not self.is_connected:
-            self.log("❌ 請先連線", "ERROR")
-            return
-            
-        self.log("🚀 開始完整測試...")
-        self.log("=" * 50)
-        
-        self.test_base_coords()
-        time.sleep(0.2)
-        self.test_joint_angles()
-        time.sleep(0.2)
-        self.test_tool_coords()
-        time.sleep(0.2)
-        self.test_robot_status()
-        
-        self.log("🎉 完整測試完成！", "SUCCESS")
-        self.log("=" * 50)
+        return self.engine.run_named_test("test_all")
         
     def toggle_monitoring(self):
-        """切換連續監控模式"""
+        """切換連續監控模式 (群組與頻率可在設定檔的 monitor 欄位調整)"""
         if not self.monitoring:
             if not self.is_connected:
                 self.log("❌ 請先連線", "ERROR")
                 return
-                
+            
+            try:
+                groups = build_groups(self.config.get("monitor"), self.engine.max_gap)
+            except (ValueError, KeyError, TypeError) as e:
+                self.log(f"🔁 監控設定錯誤: {e}", "ERROR")
+                return
+            
+            self.monitor_engine = MonitorEngine(
+                self.engine, groups,
+                on_change=lambda name, values, _: self.log(f"🔄 {format_signal(name, values)}"),
+                on_error=lambda message: self.log(f"🔄 監控錯誤: {message}", "ERROR")
+            )
             self.monitoring = True
             self.monitor_thread = threading.Thread(target=self.monitor_loop, daemon=True)
             self.monitor_thread.start()
-            self.log("🔁 開始連續監控...", "SUCCESS")
+            rates = ", ".join(f"{g['name']} {g['rate']:g} Hz" for g in groups)
+            self.log(f"🔁 開始連續監控 ({rates}，只顯示變化的數值)...", "SUCCESS")
         else:
             self.monitoring = False
             self.log("🔁 停止連續監控", "WARNING")
@@ -827,108 +759,22 @@ class TMRobotTestGUI:
             datatype = self.datatype_var.get()
             slave_id = int(self.slave_id_var.get())
             test_name = self.test_name_var.get() or "Custom Test"
-            
-            self.log(f"🚀 執行自定義測試: {test_name}")
-            self.log(f"📊 參數: {function}, 位址={start_addr}, 數量={count}, 型別={datatype}, Slave={slave_id}")
-            
-            # 根據功能碼執行讀取
-            if "Coils" in function:
-                result = self.client.read_coils(start_addr, count=count, device_id=slave_id)
-            elif "Discrete Inputs" in function:
-                result = self.client.read_discrete_inputs(start_addr, count=count, device_id=slave_id)
-            elif "Holding Registers" in function:
-                result = self.client.read_holding_registers(start_addr, count=count, device_id=slave_id)
-            elif "Input Registers" in function:
-                result = self.client.read_input_registers(start_addr, count=count, device_id=slave_id)
-            else:
-                self.log("❌ 不支援的功能碼", "ERROR")
-                return
-            
-            if result.isError():
-                self.log(f"❌ 讀取失敗: {result}", "ERROR")
-                return
-            
-            # 處理結果
-            if hasattr(result, 'bits'):
-                # Coils 或 Discrete Inputs
-                values = result.bits[:count]
-                self.log(f"✅ {test_name} 結果:", "SUCCESS")
-                for i, value in enumerate(values):
-                    self.log(f"   [{start_addr + i}]: {value}")
-            else:
-                # Registers
-                registers = result.registers[:count]
-                self.log(f"📊 原始數據: {registers}")
-                
-                # 根據資料型別轉換
-                converted_values = self.convert_user_data(registers, datatype)
-                
-                self.log(f"✅ {test_name} 結果:", "SUCCESS")
-                
-                # 特殊處理座標數據
-                if datatype == "Float32" and count >= 6:
-                    self.display_user_coordinates(converted_values, test_name)
-                else:
-                    for i, value in enumerate(converted_values):
-                        self.log(f"   [{start_addr + i * (2 if datatype == 'Float32' or datatype == 'Int32' or datatype == 'UInt32' else 1)}]: {value}")
-            
-            self.log("─" * 50)
-            
         except ValueError as e:
             self.log(f"❌ 參數錯誤: {e}", "ERROR")
             messagebox.showerror("參數錯誤", "請檢查輸入的數值格式")
-        except Exception as e:
-            self.log(f"❌ 測試錯誤: {e}", "ERROR")
+            return
+        
+        self.engine.execute_user_define_test(function, start_addr, count, datatype, slave_id, test_name,
+                                             word_order=self.word_order_var.get())
     
-    def convert_user_data(self, registers, datatype):
+    def convert_user_data(self, registers, datatype, word_order=DEFAULT_WORD_ORDER):
         """轉換用戶自定義的數據型別"""
-        if datatype == "Raw":
-            return registers
-        elif datatype == "Bool":
-            return [bool(reg) for reg in registers]
-        elif datatype == "Int16":
-            return [reg if reg < 32768 else reg - 65536 for reg in registers]
-        elif datatype == "UInt16":
-            return registers
-        elif datatype == "Int32":
-            values = []
-            for i in range(0, len(registers), 2):
-                if i + 1 < len(registers):
-                    value = struct.unpack('>i', struct.pack('>HH', registers[i], registers[i+1]))[0]
-                    values.append(value)
-            return values
-        elif datatype == "UInt32":
-            values = []
-            for i in range(0, len(registers), 2):
-                if i + 1 < len(registers):
-                    value = struct.unpack('>I', struct.pack('>HH', registers[i], registers[i+1]))[0]
-                    values.append(value)
-            return values
-        elif datatype == "Float32":
-            values = []
-            for i in range(0, len(registers), 2):
-                if i + 1 < len(registers):
-                    value = struct.unpack('>f', struct.pack('>HH', registers[i], registers[i+1]))[0]
-                    values.append(value)
-            return values
-        else:
-            return registers
+        return convert_registers(registers, datatype, word_order)
     
     def display_user_coordinates(self, coords, test_name):
         """顯示用戶自定義的座標數據"""
-        if "Joint" in test_name or "joint" in test_name.lower():
-            for i, angle in enumerate(coords[:6], 1):
-                self.log(f"   Joint {i}: {angle:8.3f}°")
-        elif len(coords) >= 6:
-            self.log(f"   X:  {coords[0]:8.3f} mm")
-            self.log(f"   Y:  {coords[1]:8.3f} mm") 
-            self.log(f"   Z:  {coords[2]:8.3f} mm")
-            self.log(f"   Rx: {coords[3]:8.3f}°")
-            self.log(f"   Ry: {coords[4]:8.3f}°")
-            self.log(f"   Rz: {coords[5]:8.3f}°")
-        else:
-            for i, coord in enumerate(coords):
-                self.log(f"   [{i}]: {coord:8.3f}")
+        for line in format_coordinates(coords, test_name):
+            self.log(line)
 
     def start_performance_test(self):
         """開始性能測試"""
@@ -963,8 +809,23 @@ class TMRobotTestGUI:
             self.log("❌ 請輸入有效的測試間隔", "ERROR")
             return
         
+        # 驗證管線深度
+        try:
+            depth = int(self.pipeline_depth_var.get())
+            if not 1 <= depth <= 256:
+                self.log("❌ 管線深度必須介於 1-256", "ERROR")
+                return
+        except ValueError:
+            self.log("❌ 請輸入有效的管線深度", "ERROR")
+            return
+        try:
+            check_perf_concurrency(self.perf_test_var.get(), depth)
+        except ValueError as e:
+            self.log(f"❌ {e}", "ERROR")
+            return
+        
         # 重置結果
-        self.perf_results = []
+        self.perf_stats = PerfStats(retain_samples=self.retain_samples_var.get())
         self.progress_bar['value'] = 0
         self.progress_var.set("0/0")
         self.avg_time_var.set("-- ms")
@@ -981,10 +842,15 @@ class TMRobotTestGUI:
         self.perf_thread = threading.Thread(target=self.performance_test_loop, daemon=True)
         self.perf_thread.start()
         
+        # 定時刷新統計 (不在每次測試後更新)
+        self.perf_total = test_count
+        self.progress_bar['maximum'] = test_count
+        self.root.after(self.PERF_REFRESH_MS, self.refresh_performance_display)
+        
         test_type = self.perf_test_var.get()
         
         self.log(f"🚀 開始性能測試: {test_type}")
-        self.log(f"📊 測試參數: {test_count}次, 間隔{interval}ms")
+        self.log(f"📊 測試參數: {test_count}次, 間隔{interval}ms, 管線深度{depth}")
     
     def stop_performance_test(self):
         """停止性能測試"""
@@ -998,34 +864,24 @@ class TMRobotTestGUI:
         try:
             test_type = self.perf_test_var.get()
             test_count = int(self.test_count_var.get())
-            interval = int(self.test_interval_var.get()) / 1000.0  # 轉換為秒
+            interval = int(self.test_interval_var.get())
             
-            self.progress_bar['maximum'] = test_count
+            depth = int(self.pipeline_depth_var.get())
             
-            for i in range(test_count):
-                if not self.perf_testing:
-                    break
-                
-                # 執行單次測試
-                start_time = time.time()
-                success = self.execute_single_performance_test(test_type)
-                end_time = time.time()
-                
-                response_time = (end_time - start_time) * 1000  # 轉換為毫秒
-                
-                # 記錄結果
-                self.perf_results.append({
-                    'time': response_time,
-                    'success': success,
-                    'timestamp': datetime.now()
-                })
-                
-                # 更新 GUI
-                self.root.after(0, self.update_performance_display, i + 1, test_count)
-                
-                # 等待間隔 (支援 0ms 極限測試)
-                if i < test_count - 1 and interval > 0:  # 最後一次不需要等待，0ms 不等待
-                    time.sleep(interval)
+            if depth > 1:
+                # 管線化模式: 以獨立連線保持 depth 個請求同時進行
+                stats = asyncio.run(run_pipelined_test(
+                    self.ip_var.get(), int(self.port_var.get()), test_type, test_count, depth,
+                    interval_ms=interval, perf_stats=self.perf_stats,
+                    should_continue=lambda: self.perf_testing
+                ))
+                self.root.after(0, lambda: self.log(f"⚡ 管線深度 {depth}: 吞吐量 {stats['throughput']:.1f} req/s"))
+            else:
+                self.engine.run_performance_test(
+                    test_type, test_count, interval,
+                    stats=self.perf_stats,
+                    should_continue=lambda: self.perf_testing
+                )
             
             # 測試完成
             if self.perf_testing:
@@ -1037,47 +893,13 @@ class TMRobotTestGUI:
     
     def execute_single_performance_test(self, test_type):
         """執行單次性能測試"""
-        try:
-            if test_type == "Base座標讀取":
-                result = self.client.read_input_registers(7001, count=12, device_id=1)
-            elif test_type == "Tool座標讀取":
-                result = self.client.read_input_registers(7025, count=12, device_id=1)
-            elif test_type == "Joint角度讀取":
-                result = self.client.read_input_registers(7013, count=12, device_id=1)
-            elif test_type == "Robot狀態讀取":
-                result = self.client.read_discrete_inputs(7200, count=4, device_id=1)
-            elif test_type == "User Define讀取":
-                result = self.client.read_holding_registers(9000, count=10, device_id=1)
-            elif test_type == "User Define寫入":
-                # 測試寫入操作
-                import random
-                test_value = random.randint(1, 65535)
-                result = self.client.write_register(9000, test_value, device_id=1)
-            elif test_type == "User Define讀寫":
-                # 測試讀寫組合操作
-                import random
-                test_value = random.randint(1, 65535)
-                # 先寫入
-                write_result = self.client.write_register(9000, test_value, device_id=1)
-                if write_result.isError():
-                    return False
-                # 再讀取驗證
-                result = self.client.read_holding_registers(9000, count=1, device_id=1)
-            elif test_type == "混合測試":
-                # 執行多種操作的組合
-                result1 = self.client.read_input_registers(7001, count=6, device_id=1)  # Base XYZ
-                result2 = self.client.read_discrete_inputs(7200, count=2, device_id=1)  # Status
-                result = result1 if not result1.isError() else result2
-            elif test_type == "極限測試":
-                # 最小數據量的極限測試
-                result = self.client.read_holding_registers(9000, count=1, device_id=1)
-            else:
-                return False
-            
-            return not result.isError()
-            
-        except Exception:
-            return False
+        return self.engine.execute_single_performance_test(test_type)
+    
+    def refresh_performance_display(self):
+        """定時刷新性能測試顯示，測試進行中持續排程"""
+        self.update_performance_display(self.perf_stats.count, self.perf_total)
+        if self.perf_testing:
+            self.root.after(self.PERF_REFRESH_MS, self.refresh_performance_display)
     
     def update_performance_display(self, current, total):
         """更新性能測試顯示"""
@@ -1086,77 +908,28 @@ class TMRobotTestGUI:
         self.progress_var.set(f"{current}/{total}")
         
         # 計算統計數據
-        if self.perf_results:
-            times = [r['time'] for r in self.perf_results]
-            successes = [r['success'] for r in self.perf_results]
-            
-            avg_time = sum(times) / len(times)
-            min_time = min(times)
-            max_time = max(times)
-            success_rate = (sum(successes) / len(successes)) * 100
-            
-            self.avg_time_var.set(f"{avg_time:.1f} ms")
-            self.min_time_var.set(f"{min_time:.1f} ms")
-            self.max_time_var.set(f"{max_time:.1f} ms")
-            self.success_rate_var.set(f"{success_rate:.1f} %")
+        stats = self.perf_stats.live()
+        if stats:
+            self.avg_time_var.set(f"{stats['avg']:.1f} ms")
+            self.min_time_var.set(f"{stats['min']:.1f} ms")
+            self.max_time_var.set(f"{stats['max']:.1f} ms")
+            self.success_rate_var.set(f"{stats['success_rate']:.1f} %")
     
     def performance_test_completed(self):
         """性能測試完成"""
         self.perf_testing = False
         self.start_perf_btn.config(state="normal")
         self.stop_perf_btn.config(state="disabled")
+        self.update_performance_display(self.perf_stats.count, self.perf_total)
         
-        if self.perf_results:
-            times = [r['time'] for r in self.perf_results]
-            successes = [r['success'] for r in self.perf_results]
-            
-            avg_time = sum(times) / len(times)
-            min_time = min(times)
-            max_time = max(times)
-            success_rate = (sum(successes) / len(successes)) * 100
-            
-            # 計算 95% 百分位數
-            sorted_times = sorted(times)
-            p95_index = int(len(sorted_times) * 0.95)
-            p95_time = sorted_times[p95_index] if p95_index < len(sorted_times) else max_time
-            
-            # 計算標準差
-            variance = sum((t - avg_time) ** 2 for t in times) / len(times)
-            std_dev = variance ** 0.5
-            
-            test_type = self.perf_test_var.get()
-            interval = self.test_interval_var.get()
-            
-            self.log("🎉 性能測試完成！", "SUCCESS")
-            self.log("📊 測試結果統計:")
-            self.log(f"   測試類型: {test_type}")
-            self.log(f"   測試次數: {len(self.perf_results)}")
-            self.log(f"   測試間隔: {interval} ms")
-            self.log(f"   平均時間: {avg_time:.2f} ms")
-            self.log(f"   最小時間: {min_time:.2f} ms")
-            self.log(f"   最大時間: {max_time:.2f} ms")
-            self.log(f"   95% 百分位: {p95_time:.2f} ms")
-            self.log(f"   標準差: {std_dev:.2f} ms")
-            self.log(f"   成功率: {success_rate:.1f}%")
-            
-            # 特殊提示
-            if interval == "0":
-                self.log("⚡ 極限測試模式: 無間隔連續測試", "WARNING")
-                if avg_time < 5:
-                    self.log("🚀 優秀性能: 平均反應時間 < 5ms", "SUCCESS")
-                elif avg_time < 10:
-                    self.log("✅ 良好性能: 平均反應時間 < 10ms", "SUCCESS")
-                else:
-                    self.log("⚠️ 注意: 平均反應時間較高，可能需要優化", "WARNING")
-            
-            if "寫入" in test_type:
-                self.log("📝 寫入測試: 包含寫入操作的性能測試")
-            
-            self.log("─" * 50)
+        self.engine.report_performance(self.perf_test_var.get(), self.test_interval_var.get(), self.perf_stats)
+        if self.engine.pool is not None:
+            log_pool_status(self.log, self.engine.pool)
     
     def generate_performance_report(self):
         """生成性能測試報告"""
-        if not self.perf_results:
+        stats = self.perf_stats.summary()
+        if not stats:
             self.log("❌ 沒有測試結果可生成報告", "ERROR")
             return
         
@@ -1171,39 +944,31 @@ class TMRobotTestGUI:
                 # 測試參數
                 f.write("測試參數:\n")
                 f.write(f"  測試類型: {self.perf_test_var.get()}\n")
-                f.write(f"  測試次數: {len(self.perf_results)}\n")
+                f.write(f"  測試次數: {stats['count']}\n")
                 f.write(f"  測試間隔: {self.test_interval_var.get()} ms\n")
-                f.write(f"  測試時間: {self.perf_results[0]['timestamp'].strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+                f.write(f"  測試時間: {self.perf_stats.started_at.strftime('%Y-%m-%d %H:%M:%S')}\n\n")
                 
                 # 統計結果
-                times = [r['time'] for r in self.perf_results]
-                successes = [r['success'] for r in self.perf_results]
-                
-                avg_time = sum(times) / len(times)
-                min_time = min(times)
-                max_time = max(times)
-                success_rate = (sum(successes) / len(successes)) * 100
-                
-                sorted_times = sorted(times)
-                p95_index = int(len(sorted_times) * 0.95)
-                p95_time = sorted_times[p95_index] if p95_index < len(sorted_times) else max_time
-                
-                variance = sum((t - avg_time) ** 2 for t in times) / len(times)
-                std_dev = variance ** 0.5
-                
                 f.write("統計結果:\n")
-                f.write(f"  平均反應時間: {avg_time:.2f} ms\n")
-                f.write(f"  最小反應時間: {min_time:.2f} ms\n")
-                f.write(f"  最大反應時間: {max_time:.2f} ms\n")
-                f.write(f"  95% 百分位數: {p95_time:.2f} ms\n")
-                f.write(f"  標準差: {std_dev:.2f} ms\n")
-                f.write(f"  成功率: {success_rate:.1f}%\n\n")
+                f.write(f"  平均反應時間: {stats['avg']:.2f} ms\n")
+                f.write(f"  最小反應時間: {stats['min']:.2f} ms\n")
+                f.write(f"  最大反應時間: {stats['max']:.2f} ms\n")
+                f.write(f"  50% 百分位數: {stats['p50']:.2f} ms\n")
+                f.write(f"  90% 百分位數: {stats['p90']:.2f} ms\n")
+                f.write(f"  95% 百分位數: {stats['p95']:.2f} ms\n")
+                f.write(f"  99% 百分位數: {stats['p99']:.2f} ms\n")
+                f.write(f"  99.9% 百分位數: {stats['p999']:.2f} ms\n")
+                f.write(f"  標準差: {stats['std_dev']:.2f} ms\n")
+                f.write(f"  成功率: {stats['success_rate']:.1f}%\n\n")
                 
                 # 詳細數據
-                f.write("詳細測試數據:\n")
-                f.write("序號\t反應時間(ms)\t成功\t時間戳\n")
-                for i, result in enumerate(self.perf_results, 1):
-                    f.write(f"{i}\t{result['time']:.2f}\t\t{result['success']}\t{result['timestamp'].strftime('%H:%M:%S.%f')[:-3]}\n")
+                if self.perf_stats.samples:
+                    f.write("詳細測試數據:\n")
+                    f.write("序號\t反應時間(ms)\t成功\t時間戳\n")
+                    for i, result in enumerate(self.perf_stats.samples, 1):
+                        f.write(f"{i}\t{result['time']:.2f}\t\t{result['success']}\t{result['timestamp'].strftime('%H:%M:%S.%f')[:-3]}\n")
+                else:
+                    f.write("(未保留逐筆樣本)\n")
             
             self.log(f"📈 性能報告已生成: {filename}", "SUCCESS")
             
@@ -1212,14 +977,8 @@ class TMRobotTestGUI:
 
     def monitor_loop(self):
         """監控循環"""
-        while self.monitoring and self.is_connected:
-            try:
-                self.log("🔄 監控中...")
-                self.test_all()
-                time.sleep(5)  # 每5秒監控一次
-            except Exception as e:
-                self.log(f"🔄 監控錯誤: {e}", "ERROR")
-                break
+        self.monitor_engine.run(lambda: self.monitoring and self.is_connected)
+        log_monitor_summary(self.log, self.monitor_engine)
     
     def run_test_suite(self):
         """執行測試套件"""
@@ -1232,37 +991,7 @@ class TMRobotTestGUI:
             self.log(f"❌ 找不到測試套件: {suite_name}", "ERROR")
             return
         
-        suite = self.test_suites[suite_name]
-        
-        self.log(f"🚀 開始執行測試套件: {suite_name}")
-        self.log("=" * 50)
-        
-        passed = 0
-        failed = 0
-        
-        for test in suite:
-            try:
-                self.log(f"\n▶️ 執行: {test['name']}")
-                
-                # 執行測試函數
-                func = getattr(self, test['func'])
-                func()
-                
-                passed += 1
-                time.sleep(0.3)  # 測試間隔
-                
-            except Exception as e:
-                self.log(f"❌ 測試失敗: {test['name']} - {e}", "ERROR")
-                failed += 1
-        
-        self.log("=" * 50)
-        self.log(f"🎉 測試套件完成: {suite_name}", "SUCCESS")
-        self.log(f"📊 結果: 通過 {passed}/{len(suite)}, 失敗 {failed}/{len(suite)}")
-        
-        if failed == 0:
-            self.log("✅ 所有測試通過！", "SUCCESS")
-        else:
-            self.log(f"⚠️ 有 {failed} 個測試失敗", "WARNING")
+        self.engine.run_test_suite(suite_name, self.test_suites)
     
     def show_suite_content(self):
         """顯示測試套件內容"""
@@ -1275,21 +1004,19 @@ class TMRobotTestGUI:
         
         content = f"測試套件: {suite_name}\n"
         content += "=" * 40 + "\n\n"
-        content += f"包含 {len(suite)} 個測試項目：\n\n"
+        names = suite_step_names(suite)
+        content += f"包含 {len(names)} 個測試項目：\n\n"
         
-        for i, test in enumerate(suite, 1):
-            content += f"{i}. {test['name']}\n"
+        for i, name in enumerate(names, 1):
+            content += f"{i}. {name}\n"
         
         messagebox.showinfo("測試套件內容", content)
     
     def export_results_csv(self):
-        """匯出測試結果為 CSV"""
-        if not self.test_results_history:
-            # 如果沒有歷史記錄，從日誌中提取
-            log_content = self.log_text.get(1.0, tk.END)
-            if not log_content.strip():
-                messagebox.showwarning("無資料", "沒有測試結果可以匯出")
-                return
+        """匯出測試結果為 CSV (直接寫出結果記錄，清除日誌後仍可匯出)"""
+        if not len(self.test_results_history):
+            messagebox.showwarning("無資料", "沒有測試結果可以匯出")
+            return
         
         try:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -1302,35 +1029,9 @@ class TMRobotTestGUI:
             if not filename:
                 return
             
-            with open(filename, 'w', newline='', encoding='utf-8-sig') as f:
-                writer = csv.writer(f)
-                
-                # 寫入標題
-                writer.writerow(['時間', '測試項目', '狀態', '詳細資訊'])
-                
-                # 從日誌中提取資料
-                log_content = self.log_text.get(1.0, tk.END)
-                for line in log_content.split('\n'):
-                    if line.strip():
-                        # 簡單解析日誌行
-                        parts = line.split('] ', 1)
-                        if len(parts) == 2:
-                            time_part = parts[0].replace('[', '')
-                            message = parts[1]
-                            
-                            # 判斷狀態
-                            if '✅' in message or 'SUCCESS' in message:
-                                status = '成功'
-                            elif '❌' in message or 'ERROR' in message:
-                                status = '失敗'
-                            elif '⚠️' in message or 'WARNING' in message:
-                                status = '警告'
-                            else:
-                                status = '資訊'
-                            
-                            writer.writerow([time_part, '', status, message])
+            count = self.test_results_history.export_csv(filename)
             
-            self.log(f"📊 測試結果已匯出: {filename}", "SUCCESS")
+            self.log(f"📊 測試結果已匯出: {filename} ({count} 筆)", "SUCCESS")
             messagebox.showinfo("匯出成功", f"測試結果已匯出至：\n{filename}")
             
         except Exception as e: